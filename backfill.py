@@ -5,7 +5,6 @@ Usage: python backfill.py --symbol SPY --start 2020-01-01 --end 2025-01-28
 import argparse
 import logging
 from datetime import datetime
-import time
 import pandas as pd
 
 from utils.logger import setup_logging, log_section_header
@@ -28,24 +27,34 @@ def backfill_date_range(symbol: str, start_date: str, end_date: str):
     
     success_count = 0
     
-    for i, date in enumerate(date_range, 1):
-        date_str = date.strftime('%Y%m%d')
-        logger.info(f"[{i}/{len(date_range)}] Processing {date_str}...")
-        
-        try:
-            metrics, datasets = collector.calculate_daily_metrics(symbol, date_str)
-            storage.save_daily_metrics(symbol, metrics)
+    # Lots mensuels : une requête greeks/prix par expiration sur le mois, découpée
+    # par date ; chaque lot est calculé et sauvegardé avant la collecte du suivant
+    i = 0
+    for batch_start, batch_end, bulk in collector.iter_range_data(symbol, start_date, end_date):
+        for date in pd.bdate_range(batch_start, batch_end):
+            i += 1
+            date_str = date.strftime('%Y%m%d')
+            logger.info(f"[{i}/{len(date_range)}] Processing {date_str}...")
             
-            if 'gex_distribution' in datasets and not datasets['gex_distribution'].empty:
-                storage.save_gex_distribution(symbol, date_str, datasets['gex_distribution'])
+            try:
+                if bulk is not None:
+                    metrics, datasets = collector.calculate_daily_metrics_from_range(symbol, date_str, bulk)
+                else:
+                    metrics, datasets = collector.calculate_daily_metrics(symbol, date_str)
+                storage.save_daily_metrics(symbol, metrics)
+                
+                if 'gex_distribution' in datasets and not datasets['gex_distribution'].empty:
+                    storage.save_gex_distribution(symbol, date_str, datasets['gex_distribution'])
+                
+                storage.update_state(symbol, date_str, 'success')
+                success_count += 1
+                logger.info(f"✓ {date_str} completed")
             
-            storage.update_state(symbol, date_str, 'success')
-            success_count += 1
-            logger.info(f"✓ {date_str} completed")
-            time.sleep(1)
-        
-        except Exception as e:
-            logger.error(f"✗ {date_str} failed: {e}")
+            except Exception as e:
+                logger.error(f"✗ {date_str} failed: {e}")
+    
+    storage.compact_daily_metrics(symbol)
+    collector.close()
     
     log_section_header("BACKFILL COMPLETED")
     logger.info(f"Success: {success_count}/{len(date_range)}")
@@ -57,6 +66,7 @@ def main():
     parser.add_argument('--end', type=str, required=True)
     args = parser.parse_args()
     
+    settings.ensure_paths()
     backfill_date_range(args.symbol, args.start, args.end)
 
 if __name__ == "__main__":
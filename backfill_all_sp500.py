@@ -6,79 +6,197 @@ Backfill massif adapte a la souscription FREE ThetaData:
 - Reprend automatiquement (state tracking)
 """
 import json
-import time
 import logging
+import os
 import sys
+import threading
+import time
+import numpy as np
 import pandas as pd
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed, wait)
 from datetime import datetime, timedelta
 from pathlib import Path
 
 sys.path.insert(0, '/home/ubuntu/warehouse_collector')
 
-from utils.logger import setup_logging, log_section_header
-from core.api_wrapper import ThetaDataAPI
+from utils.logger import (setup_logging, start_log_listener, setup_worker_logging,
+                          worker_mp_context, get_logger, log_section_header)
+from core.api_wrapper import ThetaDataAPI, TokenBucket
 from core.calculations import (
     calculate_net_exposures, calculate_realized_volatility,
     calculate_skew_metrics, calculate_pc_ratios,
-    calculate_gex_distribution, analyze_liquidity
+    calculate_gex_distribution, analyze_liquidity, merge_greeks_oi,
+    compute_exposures, concat_by_expiration, prepare_greeks
 )
 from core.term_structure import calculate_term_structure_metrics
 from core.price_history import PriceHistoryManager
 from storage.manager import StorageManager
 from config import settings
 
-logger = setup_logging()
+# Logging configured by main(): calc_pool workers re-import this module
+logger = logging.getLogger(__name__)
 
 STATE_FILE = Path('/home/ubuntu/warehouse_data/state/backfill_progress.json')
+PROGRESS_LOG = STATE_FILE.with_suffix('.jsonl')
+
+_thread_local = threading.local()
+
+# Shared by every worker's ThetaDataAPI so the global request rate and the number
+# of simultaneous Terminal requests (FETCH_WORKERS) stay capped across threads
+_rate_limiter = TokenBucket(settings.RATE_LIMIT_PER_SEC)
+_request_slots = threading.BoundedSemaphore(settings.FETCH_WORKERS)
+
+# Columns of the OI endpoint actually read by the calculation engines
+OI_COLUMNS = ['strike', 'right', 'open_interest']
+
+# Tickers per yf.download call
+YF_BATCH_SIZE = 100
+
+# Dates per symbol thread waiting in calc_pool: fetching pauses beyond this
+MAX_PENDING_CALCS = 2 * settings.CALC_WORKERS
+
+# Options backfill window, identical for every symbol. With FREE sub, stock EOD
+# is ~1 year: collect from 2025-01-01 to now.
+DATE_RANGE = pd.bdate_range('2025-01-01', '2026-01-31')
+DATE_STRS = DATE_RANGE.strftime('%Y%m%d').tolist()
 
 def load_progress():
+    """Last consolidated snapshot, replayed with the events logged since."""
+    progress = {'completed_symbols': [], 'in_progress': [], 'failed': {}, 'phase': 'stock_history'}
     if STATE_FILE.exists():
         with open(STATE_FILE) as f:
-            return json.load(f)
-    return {'completed_symbols': [], 'current_symbol': None, 'failed': {}, 'phase': 'stock_history'}
+            progress = json.load(f)
+
+    if PROGRESS_LOG.exists():
+        completed = set(progress['completed_symbols'])
+        with open(PROGRESS_LOG) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # Truncated last line after a crash
+                symbol = event.get('symbol')
+                if event.get('status') == 'failed':
+                    progress['failed'][symbol] = event.get('error', '')
+                if event.get('status') in ('done', 'failed') and symbol not in completed:
+                    completed.add(symbol)
+                    progress['completed_symbols'].append(symbol)
+    return progress
+
+def log_progress(symbol, status, error=None):
+    """Append one completion event (O(1) per symbol instead of rewriting the state)."""
+    event = {'ts': time.time(), 'symbol': symbol, 'status': status}
+    if error is not None:
+        event['error'] = error
+    with open(PROGRESS_LOG, 'a') as f:
+        f.write(json.dumps(event) + '\n')
 
 def save_progress(progress):
+    """Consolidate the snapshot and reset the event log (end of run)."""
     STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(STATE_FILE, 'w') as f:
+    tmp_file = STATE_FILE.with_suffix('.tmp')
+    with open(tmp_file, 'w') as f:
         json.dump(progress, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, STATE_FILE)
+    PROGRESS_LOG.unlink(missing_ok=True)
+
+
+def get_thread_api():
+    """One ThetaDataAPI per worker thread (no shared connection state)."""
+    if not hasattr(_thread_local, 'api'):
+        _thread_local.api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT,
+                                         settings.FETCH_WORKERS, rate_limiter=_rate_limiter,
+                                         request_slots=_request_slots)
+    return _thread_local.api
+
+
+def save_yfinance_history(symbol, df, price_history_mgr):
+    """Normalize one symbol's yfinance OHLCV frame and save it."""
+    log = get_logger(__name__, symbol)
+    if df.empty:
+        log.warning("No yfinance data")
+        return 0
+
+    # Keep OHLCV before materializing the index, and strip the tz on the
+    # DatetimeIndex itself rather than re-parsing a date column
+    keep_cols = [c for c in ['Open', 'High', 'Low', 'Close', 'Volume'] if c in df.columns]
+    df = df[keep_cols]
+    df.index = pd.DatetimeIndex(df.index).tz_localize(None)
+    df = df.rename_axis('date').reset_index()
+    df.columns = [c.lower() for c in df.columns]
+    if 'volume' in df.columns:
+        df['volume'] = df['volume'].fillna(0).astype('int64')  # Float after batch alignment
+
+    price_history_mgr.save_stock_history(symbol, df)
+    price_history_mgr.compact_history(symbol)  # One-shot save: fold a rerun's part in right away
+    log.info(f"{len(df)} days stock history via yfinance")
+    return len(df)
 
 
-def collect_stock_history_yfinance(symbol, start_date, end_date, price_history_mgr):
-    """Collect 5 years of stock OHLCV via yfinance (free, no subscription needed)."""
+def collect_stock_history_yfinance(symbols, start_date, end_date, price_history_mgr):
+    """Collect 5 years of stock OHLCV via yfinance (free, no subscription needed).
+
+    One batched yf.download per YF_BATCH_SIZE tickers instead of one Ticker session per symbol.
+    """
     try:
         import yfinance as yf
-        ticker = yf.Ticker(symbol)
-        df = ticker.history(start=start_date, end=end_date, auto_adjust=False)
-
-        if df.empty:
-            logger.warning(f"{symbol}: No yfinance data")
-            return 0
-
-        # Normalize columns
-        df = df.reset_index()
-        df.columns = [c.lower().replace(' ', '_') for c in df.columns]
-        if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date']).dt.tz_localize(None)
-
-        # Keep OHLCV
-        keep_cols = [c for c in ['date', 'open', 'high', 'low', 'close', 'volume'] if c in df.columns]
-        df = df[keep_cols]
-
-        price_history_mgr.save_stock_history(symbol, df)
-        logger.info(f"{symbol}: {len(df)} days stock history via yfinance")
-        return len(df)
-    except Exception as e:
-        logger.warning(f"{symbol}: yfinance failed: {e}")
-        return 0
-
+    except ImportError as e:
+        logger.warning(f"yfinance unavailable: {e}")
+        return {}
 
-def collect_options_metrics_day(symbol, date_str, api, storage):
-    """Collect options metrics for one symbol/date. Returns metrics dict or None."""
-    # Spot price (recent only via ThetaData, fallback to None)
-    df_spot = api.fetch('/stock/history/eod', {
-        'symbol': symbol, 'start_date': date_str, 'end_date': date_str
+    counts = {}
+    for i in range(0, len(symbols), YF_BATCH_SIZE):
+        batch = list(symbols[i:i + YF_BATCH_SIZE])
+        try:
+            bulk = yf.download(batch, start=start_date, end=end_date, group_by='ticker',
+                               threads=True, auto_adjust=False, progress=False)
+        except Exception as e:
+            logger.warning(f"yfinance batch {i // YF_BATCH_SIZE + 1} failed: {e}")
+            continue
+
+        for symbol in batch:
+            try:
+                if isinstance(bulk.columns, pd.MultiIndex):
+                    if symbol not in bulk.columns.get_level_values(0):
+                        df = pd.DataFrame()
+                    else:
+                        # Batched frames share one date index: drop the dates this ticker lacks
+                        df = bulk[symbol].dropna(how='all')
+                else:
+                    df = bulk
+                counts[symbol] = save_yfinance_history(symbol, df, price_history_mgr)
+            except Exception as e:
+                get_logger(__name__, symbol).warning(f"yfinance failed: {e}")
+                counts[symbol] = 0
+    return counts
+
+
+def concat_columns(frames, columns):
+    """Stack only the needed columns as numpy arrays instead of concatenating whole frames."""
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+
+    return pd.DataFrame({
+        col: np.concatenate([df[col].to_numpy() for df in frames])
+        for col in columns if all(col in df.columns for df in frames)
     })
 
+
+def fetch_options_day(symbol, date_str, api):
+    """I/O stage: spot + raw option frames for one symbol/date.
+
+    Returns (metrics, df_greeks, df_oi, df_prices) or None when there is no spot.
+    """
+    date_dt = pd.Timestamp(date_str)
+
+    # Spot price (recent only via ThetaData, fallback to None); served from the
+    # per-symbol stock-history cache after the first date
+    df_spot = api.fetch_stock_history(symbol, date_str, date_str)
+
     if df_spot.empty:
         return None
 
@@ -96,72 +214,78 @@ def collect_options_metrics_day(symbol, date_str, api, storage):
         if col in df_spot.columns:
             metrics[f'spot_{col}'] = float(df_spot[col].iloc[0]) if col != 'volume' else int(df_spot[col].iloc[0])
 
-    # Get active expirations
-    df_exp = api.fetch('/option/list/expirations', {'symbol': symbol})
-    if df_exp.empty:
-        return metrics
-
-    expirations = pd.to_datetime(df_exp['expiration'])
-    active = expirations[expirations >= pd.to_datetime(date_str)]
-    exp_list = active.dt.strftime('%Y%m%d').tolist()
-
-    if not exp_list:
-        return metrics
-
-    # Collect greeks + OI for all expirations
-    all_greeks = []
-    all_oi = []
-    all_prices = []
-
-    for exp in exp_list[:settings.MAX_EXPIRATIONS_FOR_GEX]:
-        df_greeks = api.fetch('/option/history/greeks/eod', {
-            'symbol': symbol, 'expiration': exp,
-            'start_date': date_str, 'end_date': date_str
-        })
-        time.sleep(settings.RATE_LIMIT_DELAY)
-
-        df_oi = api.fetch('/option/history/open_interest', {
-            'symbol': symbol, 'expiration': exp, 'date': date_str
-        })
-        time.sleep(settings.RATE_LIMIT_DELAY)
-
-        df_prices = api.fetch('/option/history/eod', {
-            'symbol': symbol, 'expiration': exp,
-            'start_date': date_str, 'end_date': date_str
-        })
-        time.sleep(settings.RATE_LIMIT_DELAY)
-
-        for df in [df_greeks, df_oi, df_prices]:
-            if not df.empty:
-                df['expiration'] = pd.to_datetime(exp)
-                df['date'] = pd.to_datetime(date_str)
-                df['dte'] = (pd.to_datetime(exp) - pd.to_datetime(date_str)).days
+    # Active expirations, sorted; the listing is cached by the API for the day
+    active = api.fetch_active_expirations(symbol, date_str)
 
-        all_greeks.append(df_greeks)
-        all_oi.append(df_oi)
-        all_prices.append(df_prices)
+    if not active:
+        return metrics, pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
-    df_greeks = pd.concat(all_greeks, ignore_index=True) if any(not d.empty for d in all_greeks) else pd.DataFrame()
-    df_oi = pd.concat(all_oi, ignore_index=True) if any(not d.empty for d in all_oi) else pd.DataFrame()
-    df_prices = pd.concat(all_prices, ignore_index=True) if any(not d.empty for d in all_prices) else pd.DataFrame()
+    exp_batch = active[:settings.MAX_EXPIRATIONS_FOR_GEX]
+    exp_dates = pd.to_datetime(exp_batch, format='%Y%m%d')
 
-    metrics['expiration_count'] = len(exp_list)
+    # One request per dataset with expiration='*' when the API accepts it
+    bulk = api.fetch_all_expirations(symbol, date_str, exp_batch)
+    if bulk is not None:
+        df_prices, df_greeks, df_oi = bulk
+        for df in (df_greeks, df_prices):
+            if not df.empty:
+                df['date'] = date_dt
+        df_oi = df_oi[[c for c in OI_COLUMNS if c in df_oi.columns]]
+    else:
+        # Dispatch greeks/OI/prices for every expiration concurrently
+        requests_list = []
+        for exp in exp_batch:
+            requests_list += [
+                ('/option/history/greeks/eod', {'symbol': symbol, 'expiration': exp,
+                                                'start_date': date_str, 'end_date': date_str}),
+                ('/option/history/open_interest', {'symbol': symbol, 'expiration': exp, 'date': date_str}),
+                ('/option/history/eod', {'symbol': symbol, 'expiration': exp,
+                                         'start_date': date_str, 'end_date': date_str}),
+            ]
+        results = api.fetch_many(requests_list)
+
+        # Raw frames are kept untouched; expiration/date/dte are tagged after the concat
+        df_greeks = concat_by_expiration(results[0::3], exp_dates, date_dt)
+        # OI is only ever joined on (strike, right) to read open_interest
+        df_oi = concat_columns(results[1::3], OI_COLUMNS)
+        df_prices = concat_by_expiration(results[2::3], exp_dates, date_dt)
+
+    metrics['expiration_count'] = len(active)
+    return metrics, df_greeks, df_oi, df_prices
+
+
+def compute_options_metrics(metrics, df_greeks, df_oi, df_prices):
+    """CPU stage: run the calculation engines on fetched frames (picklable, runs in calc_pool)."""
+    spot_price = metrics['spot_price']
 
     if not df_greeks.empty and not df_oi.empty:
+        # Greeks/OI join and exposure arrays shared by net exposures and GEX
+        try:
+            df_merged = merge_greeks_oi(df_greeks, df_oi)
+            exposures = compute_exposures(df_merged, spot_price) if df_merged is not None else None
+        except Exception:
+            df_merged = exposures = None
+
         try:
-            net_exp = calculate_net_exposures(df_greeks, df_oi, spot_price)
+            net_exp = calculate_net_exposures(df_greeks, df_oi, spot_price, df_merged, exposures)
             metrics.update(net_exp)
         except Exception:
             pass
 
+        # Type/delta/IV arrays shared by global skew and term structure
         try:
-            skew = calculate_skew_metrics(df_greeks)
+            prepared = prepare_greeks(df_greeks)
+        except Exception:
+            prepared = None
+
+        try:
+            skew = calculate_skew_metrics(df_greeks, prepared)
             metrics.update(skew)
         except Exception:
             pass
 
         try:
-            ts = calculate_term_structure_metrics(df_greeks)
+            ts = calculate_term_structure_metrics(df_greeks, prepared)
             metrics.update(ts)
         except Exception:
             pass
@@ -173,7 +297,7 @@ def collect_options_metrics_day(symbol, date_str, api, storage):
             pass
 
         try:
-            df_gex = calculate_gex_distribution(df_greeks, df_oi, spot_price)
+            df_gex = calculate_gex_distribution(df_greeks, df_oi, spot_price, df_merged, exposures)
             if not df_gex.empty:
                 call_walls = df_gex[df_gex['is_call_wall']]
                 put_walls = df_gex[df_gex['is_put_wall']]
@@ -194,81 +318,133 @@ def collect_options_metrics_day(symbol, date_str, api, storage):
     return metrics
 
 
-def backfill_symbol(symbol, api, storage, price_history_mgr):
-    """Full backfill for one symbol."""
+def collect_options_metrics_day(symbol, date_str, api):
+    """Collect options metrics for one symbol/date. Returns metrics dict or None."""
+    raw = fetch_options_day(symbol, date_str, api)
+    return compute_options_metrics(*raw) if raw is not None else None
 
-    # Phase 1: Stock price history via yfinance (5 years, free)
-    collect_stock_history_yfinance(symbol, '2021-01-01', '2026-01-31', price_history_mgr)
 
-    # Phase 2: Options metrics - only recent dates where ThetaData has stock EOD
-    # With FREE sub, stock EOD is ~1 year. Collect from 2025-01-01 to now.
-    start = pd.to_datetime('2025-01-01')
-    end = pd.to_datetime('2026-01-31')
-    date_range = pd.bdate_range(start, end)
+def backfill_symbol(symbol, api, storage, calc_pool):
+    """Options backfill for one symbol (stock history is fetched in bulk by main()).
+
+    This thread keeps fetching while calc_pool processes compute the previous dates.
+    """
+
+    log = get_logger(__name__, symbol)
 
-    success = 0
+    # Phase 2: Options metrics - only recent dates where ThetaData has stock EOD
+    pending = {}  # calc future -> date_str
+    symbol_metrics = []
     failed = 0
 
-    for i, date in enumerate(date_range, 1):
-        date_str = date.strftime('%Y%m%d')
+    def collect(futures):
+        nonlocal failed
+        for future in futures:
+            date_str = pending.pop(future)
+            try:
+                metrics = future.result()
+                if metrics and metrics.get('spot_price'):
+                    symbol_metrics.append(metrics)
+                else:
+                    failed += 1
+            except Exception as e:
+                failed += 1
+                log.debug(f"{date_str}: {e}")
+
+    for i, date_str in enumerate(DATE_STRS, 1):
+        # Bounded window: fetched frames don't pile up faster than calc_pool drains them
+        if len(pending) >= MAX_PENDING_CALCS:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
 
         try:
-            metrics = collect_options_metrics_day(symbol, date_str, api, storage)
-            if metrics and metrics.get('spot_price'):
-                storage.save_daily_metrics(symbol, metrics)
-                storage.update_state(symbol, date_str, 'success')
-                success += 1
+            raw = fetch_options_day(symbol, date_str, api)
+            if raw is not None:
+                pending[calc_pool.submit(compute_options_metrics, *raw)] = date_str
             else:
                 failed += 1
-            time.sleep(0.1)
         except Exception as e:
             failed += 1
-            logger.debug(f"{symbol} {date_str}: {e}")
-            time.sleep(0.3)
+            log.debug(f"{date_str}: {e}")
 
         if i % 50 == 0:
-            logger.info(f"  {symbol}: {i}/{len(date_range)} ({success} OK)")
+            log.info(f"{i}/{len(DATE_STRS)} fetched")
+
+    collect(list(pending))
+    symbol_metrics.sort(key=lambda m: m['date'])
+
+    # One master write + one state update per symbol instead of one per date
+    success = len(symbol_metrics)
+    if symbol_metrics:
+        storage.save_daily_metrics_batch(symbol, symbol_metrics)
+        storage.update_state(symbol, symbol_metrics[-1]['date'], 'success')
 
-    logger.info(f"{symbol}: Done - {success} days collected, {failed} failed")
+    log.info(f"Done - {success} days collected, {failed} failed")
     return success
 
 
 def main():
+    setup_logging()
     log_section_header("MASSIVE BACKFILL S&P 500 - ADAPTED FOR FREE SUBSCRIPTION")
     logger.info("Phase 1: Stock OHLCV 5yr via yfinance (free)")
     logger.info("Phase 2: Options metrics ~1yr via ThetaData")
 
-    api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT)
+    settings.ensure_paths()
     storage = StorageManager()
     history_path = settings.PATHS['derived_hv'] / '..' / 'price_history'
     price_history_mgr = PriceHistoryManager(history_path)
 
     progress = load_progress()
-    completed = set(progress.get('completed_symbols', []))
+    progress.pop('current_symbol', None)
+    progress['in_progress'] = []
+    completed = set(progress.get('completed_symbols', [])) & settings.SYMBOLS_SET
     symbols = settings.SYMBOLS
     remaining = [s for s in symbols if s not in completed]
 
     logger.info(f"Total symbols: {len(symbols)}, Completed: {len(completed)}, Remaining: {len(remaining)}")
-
-    for idx, symbol in enumerate(remaining, 1):
-        logger.info(f"\n{'='*60}")
-        logger.info(f"[{idx}/{len(remaining)}] {symbol}")
-        logger.info(f"{'='*60}")
-
-        progress['current_symbol'] = symbol
-        save_progress(progress)
-
-        try:
-            success = backfill_symbol(symbol, api, storage, price_history_mgr)
-            progress['completed_symbols'].append(symbol)
-            progress['current_symbol'] = None
-            save_progress(progress)
-        except Exception as e:
-            logger.error(f"CRITICAL {symbol}: {e}", exc_info=True)
-            progress['failed'][symbol] = str(e)
-            progress['completed_symbols'].append(symbol)  # Skip and continue
-            save_progress(progress)
-            time.sleep(2)
+    logger.info(f"Workers: {settings.BACKFILL_WORKERS}")
+
+    logger.info(f"Calc processes: {settings.CALC_WORKERS}")
+
+    # Calculations run in worker processes, out of the fetch threads' GIL. Their
+    # records go through a queue so only this process writes the rotating log file.
+    log_queue, log_listener = start_log_listener()
+    calc_pool = ProcessPoolExecutor(max_workers=settings.CALC_WORKERS, mp_context=worker_mp_context(),
+                                    initializer=setup_worker_logging, initargs=(log_queue,))
+
+    # Phase 1: Stock price history via yfinance (5 years, free), batched across symbols
+    collect_stock_history_yfinance(remaining, '2021-01-01', '2026-01-31', price_history_mgr)
+
+    progress_lock = threading.Lock()
+
+    def run_symbol(symbol):
+        with progress_lock:
+            progress['in_progress'].append(symbol)
+        return backfill_symbol(symbol, get_thread_api(), storage, calc_pool)
+
+    with calc_pool, ThreadPoolExecutor(max_workers=settings.BACKFILL_WORKERS) as executor:
+        futures = {executor.submit(run_symbol, symbol): symbol for symbol in remaining}
+
+        for idx, future in enumerate(as_completed(futures), 1):
+            symbol = futures[future]
+            log = get_logger(__name__, symbol)
+            error = None
+            try:
+                future.result()
+                log.info(f"[{idx}/{len(remaining)}] done")
+            except Exception as e:
+                log.error(f"CRITICAL: {e}", exc_info=True)
+                error = str(e)
+
+            with progress_lock:
+                if error is not None:
+                    progress['failed'][symbol] = error
+                progress['in_progress'].remove(symbol)
+                progress['completed_symbols'].append(symbol)  # Failed ones are skipped too
+                log_progress(symbol, 'failed' if error is not None else 'done', error)
+
+    log_listener.stop()
+    save_progress(progress)
 
     log_section_header("BACKFILL COMPLETE")
     logger.info(f"Completed: {len(progress['completed_symbols'])}/{len(symbols)}")
@@ -81,12 +81,15 @@ def backfill_complete_history(symbol: str, start_date: str, end_date: str):
             logger.info(f"    RR25 7DTE: {metrics.get('ts_7dte_rr25', 'N/A')}")
             
             success_count += 1
-            time.sleep(1)  # Rate limiting
         
         except Exception as e:
             logger.error(f"  ✗ Failed: {e}")
             failed_dates.append(date_str)
     
+    storage.compact_daily_metrics(symbol)
+    collector.price_history.compact_history(symbol)
+    collector.close()
+    
     # RÉSUMÉ
     log_section_header("BACKFILL COMPLETED")
     logger.info(f"Success: {success_count}/{len(date_range)} days")
@@ -140,6 +143,7 @@ def main():
     parser.add_argument('--end', type=str, required=True, help='End date (YYYY-MM-DD)')
     args = parser.parse_args()
     
+    settings.ensure_paths()
     backfill_complete_history(args.symbol, args.start, args.end)
 
 if __name__ == "__main__":
@@ -2,29 +2,96 @@
 Affiche les dernières données collectées.
 Usage: python check_latest.py
 """
+import datetime as dt
+
 import pandas as pd
-from pathlib import Path
+import pyarrow.parquet as pq
 from config import settings
+from storage.manager import StorageManager
+
+SYMBOL = 'SPY'
+N_LATEST = 5
 
-master_file = settings.PATHS['aggregated'] / 'SPY_master_daily.parquet'
+storage = StorageManager()
+master_file = settings.PATHS['aggregated'] / f'{SYMBOL}_master_daily.parquet'
+master = pq.ParquetFile(master_file) if master_file.exists() else None
+parts = storage.pending_daily_parts(SYMBOL)
 
-if not master_file.exists():
+if master is None and not parts:
     print("❌ No data collected yet")
     exit(1)
 
-df = pd.read_parquet(master_file)
-df = df.sort_values('date')
+cols_display = ['date', 'spot_price', 'net_gamma_billions', 'net_delta_millions', 'iv_atm', 'pc_volume']
 
-print(f"\n📊 Latest Data ({len(df)} days collected)")
-print("="*80)
+def _tail_start(pqf: pq.ParquetFile, n: int):
+    """
+    Date min des derniers row groups couvrant n lignes (master trié par date),
+    None si les statistiques ne le permettent pas (lecture complète).
+    """
+    meta = pqf.metadata
+    date_col = pqf.schema_arrow.get_field_index('date')
+    if date_col < 0:
+        return None
+    rows = 0
+    for rg in reversed(range(meta.num_row_groups)):
+        stats = meta.row_group(rg).column(date_col).statistics
+        if stats is None or not stats.has_min_max or not isinstance(stats.min, dt.datetime):
+            return None
+        rows += meta.row_group(rg).num_rows
+        if rows >= n:
+            return stats.min
+    return None
 
-latest = df.tail(5)
-cols_display = ['date', 'spot_price', 'net_gamma_billions', 'net_delta_millions', 'iv_atm', 'pc_volume']
+# Seuls les derniers row groups du master sont lus (filtre date poussé au lecteur),
+# fusionnés avec les parts en attente (la part la plus récente gagne par date)
+tail_start = _tail_start(master, N_LATEST) if master is not None else None
+df = storage.load_master_daily(SYMBOL, start_date=tail_start, columns=cols_display)
+cols_display = [c for c in cols_display if c in df.columns]
+latest = df.tail(N_LATEST)
+
+def _null_count(pqf: pq.ParquetFile) -> int:
+    """Nulls d'un fichier via les statistiques de row group, lecture complète si absentes."""
+    meta = pqf.metadata
+    null_count = 0
+    for rg in range(meta.num_row_groups):
+        for col in range(meta.num_columns):
+            stats = meta.row_group(rg).column(col).statistics
+            if stats is None or not stats.has_null_count:
+                return int(pqf.read().to_pandas().isna().sum().sum())
+            null_count += stats.null_count
+    return null_count
+
+def _dates(pqf: pq.ParquetFile) -> pd.Series:
+    """Colonne date seule d'un fichier, en datetime."""
+    return pd.to_datetime(pqf.read(columns=['date']).column('date').to_pandas())
+
+# Complétude sur l'ensemble dédoublonné : master via ses statistiques, plus les
+# parts dont la date n'y figure pas encore (une ligne par date, comme n_rows)
+null_count = 0
+n_cells = 0
+n_rows = 0
+master_dates = pd.Series(dtype='datetime64[ns]')
+if master is not None:
+    null_count += _null_count(master)
+    n_cells += master.metadata.num_rows * master.metadata.num_columns
+    n_rows += master.metadata.num_rows
+    if parts:
+        master_dates = _dates(master)
+for part in parts:
+    pqf = pq.ParquetFile(part)
+    if _dates(pqf).isin(master_dates).all():
+        continue  # Date déjà comptée dans le master
+    null_count += _null_count(pqf)
+    n_cells += pqf.metadata.num_rows * pqf.metadata.num_columns
+    n_rows += pqf.metadata.num_rows
+
+print(f"\n📊 Latest Data ({n_rows} days collected)")
+print("="*80)
 print(latest[cols_display].to_string(index=False))
 print("="*80)
 
-last_date = df['date'].max()
-print(f"\nLast collected: {last_date.date()}")
+last_date = latest['date'].max()
+print(f"\nLast collected: {pd.Timestamp(last_date).date()}")
 
-completeness = (1 - df.isna().sum().sum() / (len(df) * len(df.columns))) * 100
+completeness = (1 - null_count / n_cells) * 100 if n_cells else 0.0
 print(f"Completeness: {completeness:.1f}%")
@@ -2,21 +2,28 @@
 Nettoie les données de test.
 Usage: python cleanup.py
 """
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from config import settings
 
+def _remove(entry):
+    """Supprime une entrée de répertoire (fichier ou sous-arbre)."""
+    if entry.is_dir(follow_symlinks=False):
+        shutil.rmtree(entry.path)
+    else:
+        os.unlink(entry.path)
+
 response = input(f"Delete ALL data in {settings.BASE_PATH}? (yes/no): ")
 
 if response.lower() == 'yes':
-    for path_name, path in settings.PATHS.items():
-        if path.exists():
-            for item in path.iterdir():
-                if item.is_file():
-                    item.unlink()
-                elif item.is_dir():
-                    shutil.rmtree(item)
-            print(f"✓ Cleaned {path_name}")
-    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for path_name, path in settings.PATHS.items():
+            if path.exists():
+                with os.scandir(path) as entries:
+                    list(executor.map(_remove, list(entries)))
+                print(f"✓ Cleaned {path_name}")
+
     print("\n✓ All test data deleted")
 else:
     print("Cancelled")
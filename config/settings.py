@@ -9,12 +9,15 @@ from pathlib import Path
 # ============================================================================
 THETADATA_BASE_URL = "http://localhost:25503/v3"
 THETADATA_TIMEOUT = 15
-RATE_LIMIT_DELAY = 0.05  # 50ms entre requêtes
+RATE_LIMIT_PER_SEC = 20  # Débit max (token bucket dans ThetaDataAPI)
+FETCH_WORKERS = 4  # Requêtes simultanées max vers le Terminal
+BACKFILL_WORKERS = 8  # Symboles traités en parallèle pendant le backfill
+CALC_WORKERS = os.cpu_count() or 1  # Processus de calcul des métriques pendant le backfill
 
 # ============================================================================
 # SYMBOLS TO TRACK
 # ============================================================================
-SYMBOLS = [
+SYMBOLS = (
     'A', 'AAPL', 'ABBV', 'ABNB', 'ABT', 'ACGL', 'ACN', 'ADBE', 'ADI', 'ADM',
     'ADP', 'ADSK', 'AEE', 'AEP', 'AES', 'AFL', 'AIG', 'AIZ', 'AJG', 'AKAM',
     'ALB', 'ALGN', 'ALL', 'ALLE', 'AMAT', 'AMCR', 'AMD', 'AME', 'AMGN', 'AMP',
@@ -66,7 +69,8 @@ SYMBOLS = [
     'WBD', 'WDAY', 'WDC', 'WEC', 'WELL', 'WFC', 'WM', 'WMB', 'WMT', 'WRB',
     'WSM', 'WST', 'WTW', 'WY', 'WYNN', 'XEL', 'XOM', 'XYL', 'XYZ', 'YUM',
     'ZBH', 'ZBRA', 'ZTS'
-]  # S&P 500 - 503 tickers
+)  # S&P 500 - 503 tickers
+SYMBOLS_SET = frozenset(SYMBOLS)  # Tests d'appartenance O(1)
 
 # ============================================================================
 # STORAGE CONFIGURATION
@@ -90,11 +94,15 @@ PATHS = {
     'state': BASE_PATH / 'state'
 }
 
-# Créer tous les répertoires
-for path in PATHS.values():
-    path.mkdir(parents=True, exist_ok=True)
+def ensure_paths():
+    """Crée l'arborescence du warehouse (appelé par les points d'entrée, pas à l'import)."""
+    for path in PATHS.values():
+        path.mkdir(parents=True, exist_ok=True)
 
 STATE_FILE = PATHS['state'] / 'collection_state.json'
+API_CACHE_DIR = BASE_PATH / 'cache' / 'api'  # Réponses API statiques du jour (generate_skew_plots)
+DOWNCAST_FLOAT32 = True  # Greeks / quotes en float32 (moitié moins d'octets, précision suffisante)
+COMPACT_MIN_PARTS = 20  # Job quotidien : parts en attente avant fusion dans le fichier consolidé
 
 # ============================================================================
 # COLLECTION PARAMETERS
@@ -128,4 +136,3 @@ ALERT_THRESHOLDS = {
 # ============================================================================
 LOG_LEVEL = "INFO"
 LOG_FILE = BASE_PATH / 'logs' / 'collector.log'
-LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
@@ -16,12 +16,16 @@ TEST_MODE = True
 # ============================================================================
 THETADATA_BASE_URL = "http://localhost:25503/v3"
 THETADATA_TIMEOUT = 15
-RATE_LIMIT_DELAY = 0.05
+RATE_LIMIT_PER_SEC = 20
+FETCH_WORKERS = 4
+BACKFILL_WORKERS = 2
+CALC_WORKERS = 2  # Processus de calcul des métriques pendant le backfill
 
 # ============================================================================
 # SYMBOLS TO TRACK (TEST)
 # ============================================================================
-SYMBOLS = ['SPY']  # Un seul pour test
+SYMBOLS = ('SPY',)  # Un seul pour test
+SYMBOLS_SET = frozenset(SYMBOLS)
 
 # ============================================================================
 # STORAGE CONFIGURATION (LOCAL)
@@ -49,10 +53,15 @@ PATHS = {
     'logs': BASE_PATH / 'logs'
 }
 
-for path in PATHS.values():
-    path.mkdir(parents=True, exist_ok=True)
+def ensure_paths():
+    """Crée l'arborescence du warehouse (appelé par les points d'entrée, pas à l'import)."""
+    for path in PATHS.values():
+        path.mkdir(parents=True, exist_ok=True)
 
 STATE_FILE = PATHS['state'] / 'collection_state.json'
+API_CACHE_DIR = BASE_PATH / 'cache' / 'api'  # Réponses API statiques du jour (generate_skew_plots)
+DOWNCAST_FLOAT32 = True  # Greeks / quotes en float32 (moitié moins d'octets, précision suffisante)
+COMPACT_MIN_PARTS = 20  # Job quotidien : parts en attente avant fusion dans le fichier consolidé
 
 # ============================================================================
 # TEST PARAMETERS
@@ -3,30 +3,165 @@ Wrapper API ThetaData v3 - Diamond Standard.
 Zero-Crash Policy avec corrections empiriques.
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
 import io
 import logging
-from typing import Dict
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from core.calculations import COLUMN_ALIASES, DATE_COLUMNS, RIGHT_DTYPE, parse_dates
+from storage.manager import PARQUET_OPTIONS
 
 logger = logging.getLogger(__name__)
 
+# Types connus des colonnes CSV ThetaData (évite l'inférence du parser)
+CSV_DTYPES = {
+    'strike': 'float64',
+    'bid': 'float64',
+    'ask': 'float64',
+    'close': 'float64',
+    'delta': 'float64',
+    'gamma': 'float64',
+    'theta': 'float64',
+    'vega': 'float64',
+    'implied_vol': 'float64',
+}
+
+# Options du lecteur CSV pyarrow (multi-thread, colonnes typées ci-dessus)
+CSV_CONVERT_OPTIONS = pa_csv.ConvertOptions(
+    column_types={col: pa.from_numpy_dtype(np.dtype(dtype)) for col, dtype in CSV_DTYPES.items()},
+    strings_can_be_null=True,
+)
+
+# Colonnes de comptage stockées en int32 quand les valeurs le permettent
+COUNT_COLUMNS = ('open_interest', 'volume')
+INT32_MAX = np.iinfo(np.int32).max
+
+def trade_dates(df: pd.DataFrame) -> Optional[pd.Series]:
+    """Date de séance de chaque ligne (colonne 'date', sinon 'timestamp'/'created')."""
+    for col in ['date', 'timestamp', 'created']:
+        if col in df.columns:
+            return pd.to_datetime(df[col], errors='coerce').dt.normalize()
+    return None
+
+def _log_no_data(endpoint: str, params: Dict, status: int):
+    logger.debug(f"No data for {endpoint} with params {params}")
+
+def _log_forbidden(endpoint: str, params: Dict, status: int):
+    logger.error(f"Subscription insufficient for {endpoint}")
+
+def _log_http_error(endpoint: str, params: Dict, status: int):
+    logger.warning(f"HTTP {status} on {endpoint}")
+
+# Codes HTTP spécifiques ThetaData (réponse vide) ; tout autre code != 200 : _log_http_error
+STATUS_HANDLERS = {
+    472: _log_no_data,
+    403: _log_forbidden,
+}
+
+# Codes 4xx qui ne disent rien du support de expiration='*' : pas de données (472),
+# date hors abonnement (403), limitation de débit (429)
+NON_STRUCTURAL_STATUSES = frozenset((403, 429, 472))
+
+def _rejects_wildcard(df: pd.DataFrame) -> bool:
+    """Refus structurel de expiration='*' : requête rejetée (4xx) ou réponse sans 'expiration'."""
+    status = df.attrs.get('http_status')
+    if status is not None:
+        return 400 <= status < 500 and status not in NON_STRUCTURAL_STATUSES
+    return not df.empty and 'expiration' not in df.columns
+
+class TokenBucket:
+    """
+    Limiteur de débit thread-safe (token bucket).
+    Ne bloque que lorsque le débit réel dépasse `rate` requêtes/seconde,
+    au lieu d'un sleep fixe après chaque requête.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Consomme un jeton, en attendant si le bucket est vide."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
 class ThetaDataAPI:
     """
     Wrapper robuste pour ThetaData API v3.
     Gère automatiquement les corrections empiriques et les erreurs.
     """
     
-    def __init__(self, base_url: str, timeout: int = 15):
+    MAX_429_RETRIES = 3
+    STOCK_CACHE_SIZE = 16  # Historiques stock gardés en mémoire (LRU, un par symbole)
+    
+    def __init__(self, base_url: str, timeout: int = 15, max_workers: int = 4,
+                 max_rate: float = 20.0, rate_limiter: Optional[TokenBucket] = None,
+                 cache_dir: Optional[Path] = None,
+                 request_slots: Optional[threading.Semaphore] = None):
         self.base_url = base_url
         self.timeout = timeout
+        self.max_workers = max_workers
+        # rate_limiter / request_slots permettent de partager un même débit et une même
+        # limite de requêtes simultanées entre plusieurs instances
+        self.rate_limiter = rate_limiter or TokenBucket(max_rate)
+        self.request_slots = request_slots or threading.BoundedSemaphore(max_workers)
         self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._executor = None  # Pool persistant, créé au premier fetch_many
+        
+        # Caches mémoire (durée de vie de l'instance)
+        self._cache_lock = threading.Lock()
+        self._expirations_cache = {}  # (symbol, jour de requête) -> DataFrame
+        self._expiration_index = {}  # symbol -> (DataFrame source, datetime64 triés, 'YYYYMMDD')
+        self._active_cache = {}  # (symbol, date) -> expirations actives
+        self._stock_cache = OrderedDict()  # symbol -> (start, end, DataFrame, dates de séance), LRU
+        self._wildcard_expirations = True  # expiration='*' accepté (désactivé au premier refus structurel)
+        # Cache disque optionnel des listes d'expirations (partagé entre exécutions du jour)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        
+        # Session persistante : connexions keep-alive réutilisées entre requêtes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=max(max_workers, 4),
+            max_retries=Retry(total=3, backoff_factor=0.3,
+                              status_forcelist=[500, 502, 503, 504],
+                              raise_on_status=False)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Connection': 'keep-alive'})
         
     def fetch(self, endpoint: str, params: Dict) -> pd.DataFrame:
         """
         Méthode principale de récupération.
         
         Returns:
-            DataFrame (vide si erreur - Zero-Crash Policy)
+            DataFrame (vide si erreur - Zero-Crash Policy ; code HTTP dans
+            attrs['http_status'] si la réponse n'est pas 200)
         """
         params['format'] = 'csv'
         
@@ -46,47 +181,70 @@ class ThetaDataAPI:
         
         # 3. Requête API
         try:
-            self.request_count += 1
-            
-            response = requests.get(
-                f"{self.base_url}{endpoint}",
-                params=params,
-                timeout=self.timeout
-            )
-            
-            # Gestion codes HTTP spécifiques ThetaData
-            if response.status_code == 472:
-                logger.debug(f"No data for {endpoint} with params {params}")
-                return pd.DataFrame()
-            
-            if response.status_code == 403:
-                logger.error(f"Subscription insufficient for {endpoint}")
-                return pd.DataFrame()
+            for attempt in range(self.MAX_429_RETRIES + 1):
+                self.rate_limiter.acquire()
+                with self._count_lock:
+                    self.request_count += 1
+                
+                with self.request_slots:
+                    response = self.session.get(
+                        f"{self.base_url}{endpoint}",
+                        params=params,
+                        timeout=self.timeout
+                    )
+                
+                if response.status_code != 429 or attempt == self.MAX_429_RETRIES:
+                    break
+                
+                # Trop de requêtes : délai Retry-After du serveur, sinon backoff exponentiel
+                backoff = self._retry_after(response, 0.5 * 2 ** attempt)
+                logger.warning(f"HTTP 429 on {endpoint}, retrying in {backoff:.1f}s")
+                time.sleep(backoff)
             
+            # Gestion codes HTTP : une comparaison sur le chemin 200, dispatch sinon
             if response.status_code != 200:
-                logger.warning(f"HTTP {response.status_code} on {endpoint}")
-                return pd.DataFrame()
+                handler = STATUS_HANDLERS.get(response.status_code, _log_http_error)
+                handler(endpoint, params, response.status_code)
+                df = pd.DataFrame()
+                df.attrs['http_status'] = response.status_code
+                return df
             
-            if not response.text.strip():
+            # Test de vacuité sur les octets, sans copie ni décodage du corps
+            body = response.content
+            if not body or body.isspace():
                 return pd.DataFrame()
             
-            # 4. Parsing CSV
+            # 4. Parsing CSV (octets bruts, lecteur pyarrow multi-thread)
             try:
-                df = pd.read_csv(io.StringIO(response.text))
-            except pd.errors.ParserError as e:
-                logger.warning(f"CSV parsing error on {endpoint}: {e}")
-                return pd.DataFrame()
+                df = pa_csv.read_csv(
+                    pa.BufferReader(body), convert_options=CSV_CONVERT_OPTIONS
+                ).to_pandas(date_as_object=False)
+            except pa.ArrowInvalid:
+                # Valeur non conforme à une colonne typée ou CSV irrégulier : parser pandas
+                try:
+                    df = pd.read_csv(io.BytesIO(body), engine='c')
+                except pd.errors.ParserError as e:
+                    logger.warning(f"CSV parsing error on {endpoint}: {e}")
+                    return pd.DataFrame()
             
             if df.empty:
                 return pd.DataFrame()
             
-            # 5. Normalisation colonnes
-            df.columns = df.columns.str.strip().str.lower()
+            # 5. Normalisation colonnes (mêmes alias que normalize_columns)
+            df.columns = [COLUMN_ALIASES.get(str(c).strip().lower(), str(c).strip().lower())
+                          for c in df.columns]
+            
+            # 5b. Comptages en int32 (moitié moins de mémoire, sans perte)
+            for col in COUNT_COLUMNS:
+                if col in df.columns and pd.api.types.is_integer_dtype(df[col]) \
+                        and df[col].abs().max() <= INT32_MAX:
+                    df[col] = df[col].astype('int32')
             
             # 6. CORRECTION EMPIRIQUE #1: Normaliser Put/Call
             if 'right' in df.columns:
                 df['right'] = df['right'].astype(str).str.upper().str.strip()
                 df = df[df['right'].isin(['CALL', 'PUT'])]
+                df['right'] = df['right'].astype(RIGHT_DTYPE)
             
             # 7. CORRECTION EMPIRIQUE #2: IV en pourcentage
             if 'implied_vol' in df.columns:
@@ -96,11 +254,12 @@ class ThetaDataAPI:
             if 'strike' in df.columns:
                 df['strike'] = pd.to_numeric(df['strike'], errors='coerce') / 1000
             
-            # 9. Conversion dates
-            date_cols = ['expiration', 'date', 'timestamp', 'created']
-            for col in date_cols:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
+            # 9. Conversion dates (colonnes déjà typées par le lecteur CSV laissées telles quelles)
+            for col in DATE_COLUMNS.intersection(df.columns):
+                df[col] = parse_dates(df[col])
+            
+            # Déjà conforme à normalize_columns : les moteurs de calcul ne refont pas la passe
+            df.attrs['normalized'] = True
             
             logger.debug(f"Fetched {len(df)} rows from {endpoint}")
             return df
@@ -113,6 +272,265 @@ class ThetaDataAPI:
             logger.error(f"Unexpected error on {endpoint}: {e}")
             return pd.DataFrame()
     
+    def fetch_active_expirations(self, symbol: str, current_date: str) -> List[str]:
+        """
+        Expirations >= current_date ('YYYYMMDD'), mémorisées par (symbol, date).
+        
+        La liste API est parsée et triée une fois ; chaque date ne coûte
+        ensuite qu'un searchsorted sur ce tableau trié.
+        """
+        key = (symbol, current_date)
+        with self._cache_lock:
+            if key in self._active_cache:
+                return self._active_cache[key]
+        
+        df_exp = self.fetch_expirations(symbol)
+        if df_exp.empty:
+            return []
+        
+        with self._cache_lock:
+            index = self._expiration_index.get(symbol)
+        if index is None or index[0] is not df_exp:
+            exp_sorted = np.sort(pd.to_datetime(df_exp['expiration']).to_numpy())
+            exp_sorted = exp_sorted[~np.isnat(exp_sorted)]
+            index = (df_exp, exp_sorted, pd.DatetimeIndex(exp_sorted).strftime('%Y%m%d').tolist())
+            with self._cache_lock:
+                self._expiration_index[symbol] = index
+        
+        _, exp_sorted, exp_strs = index
+        start = np.searchsorted(exp_sorted, pd.Timestamp(current_date).to_datetime64(), side='left')
+        active = exp_strs[start:]
+        with self._cache_lock:
+            self._active_cache[key] = active
+        return active
+    
+    @staticmethod
+    def _retry_after(response, default: float) -> float:
+        """Délai (secondes) annoncé par l'en-tête Retry-After d'un 429, sinon default."""
+        try:
+            delay = float(response.headers.get('Retry-After', ''))
+        except (TypeError, ValueError):
+            return default
+        return delay if delay >= 0 else default
+    
+    def fetch_expirations(self, symbol: str) -> pd.DataFrame:
+        """
+        Liste des expirations d'un symbole, mémorisée pour la journée.
+        
+        La réponse ne dépend que du symbole : un backfill multi-dates ne la
+        redemande plus pour chaque date. Avec cache_dir, la liste est aussi
+        conservée sur disque pour les exécutions suivantes du même jour.
+        """
+        key = (symbol, datetime.now().strftime('%Y%m%d'))
+        with self._cache_lock:
+            if key in self._expirations_cache:
+                return self._expirations_cache[key]
+        
+        cache_file = self._expirations_cache_file(*key)
+        df_exp = self._read_cache_file(cache_file)
+        if df_exp is None:
+            df_exp = self.fetch('/option/list/expirations', {'symbol': symbol})
+            if not df_exp.empty:
+                self._write_cache_file(cache_file, df_exp)
+                self._prune_expirations_cache(key[1])
+        if not df_exp.empty:
+            with self._cache_lock:
+                self._expirations_cache[key] = df_exp
+        return df_exp
+    
+    def _expirations_cache_file(self, symbol: str, day: str) -> Optional[Path]:
+        """Fichier du cache disque (un par symbole et par jour), None sans cache_dir."""
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"{symbol}_{day}_expirations.parquet"
+    
+    def _prune_expirations_cache(self, day: str):
+        """Supprime les listes d'expirations des jours précédents (cache disque borné au jour)."""
+        if self.cache_dir is None:
+            return
+        for cache_file in self.cache_dir.glob('*_expirations.parquet'):
+            if cache_file.stem.rsplit('_', 2)[-2] != day:
+                try:
+                    cache_file.unlink(missing_ok=True)
+                except OSError as e:
+                    logger.debug(f"Could not remove stale cache file {cache_file}: {e}")
+    
+    @staticmethod
+    def _read_cache_file(cache_file: Optional[Path]) -> Optional[pd.DataFrame]:
+        """Relit une réponse mise en cache (None si absente ou illisible)."""
+        if cache_file is None or not cache_file.exists():
+            return None
+        try:
+            return pd.read_parquet(cache_file)
+        except (OSError, pa.ArrowException) as e:
+            logger.debug(f"Unreadable cache file {cache_file}: {e}")
+            return None
+    
+    @staticmethod
+    def _write_cache_file(cache_file: Optional[Path], df: pd.DataFrame):
+        """Écrit une réponse dans le cache disque (échec non bloquant)."""
+        if cache_file is None:
+            return
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(cache_file, index=False, **PARQUET_OPTIONS)
+        except (OSError, pa.ArrowException) as e:
+            logger.debug(f"Could not write cache file {cache_file}: {e}")
+    
+    def fetch_stock_history(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        """
+        EOD stock sur [start_date, end_date], servi depuis un cache par symbole.
+        
+        En cas d'absence, la fenêtre mise en cache est étendue jusqu'à
+        aujourd'hui : les dates suivantes d'un backfill (spot et historique HV)
+        sont ensuite découpées localement sans nouvelle requête. Seuls les
+        STOCK_CACHE_SIZE symboles les plus récemment demandés sont conservés.
+        """
+        start = str(start_date).replace('-', '')
+        end = str(end_date).replace('-', '')
+        
+        with self._cache_lock:
+            cached = self._stock_cache.get(symbol)
+            if cached is not None:
+                self._stock_cache.move_to_end(symbol)
+        
+        if cached is None or start < cached[0] or end > cached[1]:
+            fetch_start = min(start, cached[0]) if cached else start
+            fetch_end = max(end, datetime.now().strftime('%Y%m%d'))
+            df = self.fetch('/stock/history/eod', {
+                'symbol': symbol, 'start_date': fetch_start, 'end_date': fetch_end
+            })
+            if df.empty:
+                return df
+            dates = trade_dates(df)
+            if dates is None:
+                # Fenêtre élargie non découpable : aucune ligne ne peut être attribuée à [start, end]
+                logger.warning(f"No date column in stock history for {symbol}, data ignored")
+                return pd.DataFrame()
+            cached = (fetch_start, fetch_end, df, dates)
+            with self._cache_lock:
+                self._stock_cache[symbol] = cached
+                self._stock_cache.move_to_end(symbol)
+                while len(self._stock_cache) > self.STOCK_CACHE_SIZE:
+                    self._stock_cache.popitem(last=False)
+        
+        _, _, df, dates = cached
+        mask = (dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))
+        return df[mask.to_numpy()].reset_index(drop=True)
+    
+    def fetch_spot_with_history(self, symbol: str, date: str,
+                                start_date: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Spot du jour + historique EOD [start_date, date] en une seule requête.
+        
+        La ligne spot est découpée localement dans l'historique (qui la contient
+        déjà) au lieu d'un second appel '/stock/history/eod' sur [date, date].
+        
+        Returns:
+            (df_spot, df_stock_hist)
+        """
+        df_hist = self.fetch_stock_history(symbol, start_date, date)
+        dates = trade_dates(df_hist) if not df_hist.empty else None
+        if dates is None:
+            return self.fetch_stock_history(symbol, date, date), df_hist
+        
+        is_day = (dates == pd.Timestamp(date)).to_numpy()
+        return df_hist[is_day].reset_index(drop=True), df_hist
+    
+    def fetch_all_expirations(self, symbol: str, date: str,
+                              expirations: List[str]) -> Optional[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]]:
+        """
+        Prices, greeks et OI de toutes les expirations en 3 requêtes (expiration='*').
+        
+        Les lignes sont restreintes aux expirations demandées, avec les colonnes
+        'expiration' (datetime) et 'dte'.
+        
+        Returns:
+            (prices, greeks, oi), ou None si le wildcard n'est pas exploitable :
+            l'appelant reprend alors la boucle par expiration. Le wildcard n'est
+            désactivé pour l'instance que sur un refus structurel (4xx de requête,
+            réponse sans 'expiration') ; des réponses simplement vides (jour férié,
+            hors abonnement, symbole illiquide) ne font replier que cet appel.
+        """
+        if not self._wildcard_expirations:
+            return None
+        
+        results = self.fetch_many([
+            ('/option/history/eod', {
+                'symbol': symbol, 'expiration': '*',
+                'start_date': date, 'end_date': date
+            }),
+            ('/option/history/greeks/eod', {
+                'symbol': symbol, 'expiration': '*',
+                'start_date': date, 'end_date': date
+            }),
+            ('/option/history/open_interest', {
+                'symbol': symbol, 'expiration': '*', 'date': date
+            }),
+        ])
+        
+        if any(_rejects_wildcard(df) for df in results):
+            logger.warning("expiration='*' not supported, falling back to per-expiration requests")
+            self._wildcard_expirations = False
+            return None
+        if all(df.empty for df in results):
+            logger.debug(f"expiration='*' returned no data for {symbol} {date}, "
+                         "per-expiration requests for this call only")
+            return None
+        
+        wanted = pd.to_datetime(pd.Series(expirations, dtype=object)).to_numpy()
+        date_dt = pd.Timestamp(date)
+        out = []
+        for df in results:
+            if df.empty:
+                out.append(df)
+                continue
+            exp = pd.to_datetime(df['expiration'], errors='coerce')
+            keep = exp.isin(wanted).to_numpy()
+            df = df[keep].reset_index(drop=True)
+            df['expiration'] = exp[keep].to_numpy()
+            df['dte'] = (df['expiration'] - date_dt).dt.days
+            out.append(df)
+        return tuple(out)
+    
+    def fetch_many(self, requests_list: List[Tuple[str, Dict]]) -> List[pd.DataFrame]:
+        """
+        Exécute plusieurs fetch en parallèle (I/O-bound).
+        
+        Le lot complet est soumis d'un coup à un pool de threads persistant
+        (max_workers threads ; request_slots borne les requêtes simultanées du
+        Terminal, y compris quand il est partagé entre plusieurs instances).
+        
+        Args:
+            requests_list: Liste de tuples (endpoint, params)
+        
+        Returns:
+            DataFrames dans le même ordre que requests_list
+        """
+        if not requests_list:
+            return []
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='thetadata')
+        
+        futures = [self._executor.submit(self.fetch, endpoint, params)
+                   for endpoint, params in requests_list]
+        return [f.result() for f in futures]
+    
+    def close(self):
+        """Libère le pool de threads et les connexions HTTP."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
     def get_stats(self) -> Dict:
         """Statistiques d'utilisation API."""
         return {
@@ -5,8 +5,9 @@ et Zero-Crash Policy pour les Index et Volumes manquants.
 """
 import pandas as pd
 import numpy as np
-from scipy.interpolate import interp1d
 import logging
+from types import MappingProxyType
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +15,56 @@ logger = logging.getLogger(__name__)
 # 🛠️ UTILITAIRES DE ROBUSTESSE
 # ==============================================================================
 
+# Alias courants des noms de colonnes (après strip + minuscules), en lecture seule
+COLUMN_ALIASES = MappingProxyType({
+    'vol': 'volume',
+    'size': 'volume',
+    'daily_volume': 'volume',
+    'oi': 'open_interest',
+    'openinterest': 'open_interest',
+    'type': 'right',
+    'cp': 'right',
+    'exp': 'expiration',
+    'expiry': 'expiration',
+})
+
+# Colonnes converties en datetime à la lecture des réponses API
+DATE_COLUMNS = frozenset(['expiration', 'date', 'timestamp', 'created'])
+
+# 'right' catégoriel (posé par ThetaDataAPI.fetch) : codes int8, CALL=0 / PUT=1
+RIGHT_DTYPE = pd.CategoricalDtype(['CALL', 'PUT'])
+
+def right_masks(right: pd.Series) -> tuple:
+    """
+    Masques booléens (CALL, PUT), via les codes entiers si 'right' est catégoriel.
+    
+    RIGHT_DTYPE (posé à l'ingestion) : CALL=0 / PUT=1. Autres catégories (ex. relue
+    d'un parquet ne contenant qu'un côté) : position de CALL/PUT dans les catégories.
+    """
+    if isinstance(right.dtype, pd.CategoricalDtype):
+        codes = right.cat.codes.to_numpy()
+        if right.dtype == RIGHT_DTYPE:
+            return codes == 0, codes == 1
+        positions = right.cat.categories.get_indexer(['CALL', 'PUT'])  # -1 si absent
+        return tuple(codes == pos if pos >= 0 else np.zeros(len(codes), dtype=bool)
+                     for pos in positions)
+    values = right.to_numpy()
+    return values == 'CALL', values == 'PUT'
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """
+    Conversion datetime sans re-parsing inutile.
+    
+    - déjà datetime64 : renvoyé tel quel
+    - entiers YYYYMMDD (format ThetaData) : format explicite, sans inférence
+    - sinon : inférence pandas, valeurs invalides → NaT
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_datetime(values, format='%Y%m%d', errors='coerce')
+    return pd.to_datetime(values, errors='coerce')
+
 def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
     Normalise les noms de colonnes et applique corrections empiriques ThetaData.
@@ -29,31 +80,21 @@ def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return df
     
-    df = df.copy()
-    
-    # 1. Nettoyage basique
-    df.columns = df.columns.str.strip().str.lower()
-    
-    # 2. Mapping des alias courants
-    mappings = {
-        'vol': 'volume',
-        'size': 'volume',
-        'daily_volume': 'volume',
-        'oi': 'open_interest',
-        'openinterest': 'open_interest',
-        'type': 'right',
-        'cp': 'right',
-        'exp': 'expiration',
-        'expiry': 'expiration',
-        'date': 'date'  # Force lowercase
-    }
-    df = df.rename(columns=mappings)
+    # Déjà normalisé (fetch API ou appel précédent) : rien à refaire
+    if df.attrs.get('normalized'):
+        return df
+    
+    # 1-2. Nettoyage (minuscules, strip) + alias en un seul rename (rename copie déjà)
+    df = df.rename(columns=lambda c: COLUMN_ALIASES.get(str(c).strip().lower(), str(c).strip().lower()))
     
     # 3. CORRECTION EMPIRIQUE #1 : Normalisation 'right'
-    if 'right' in df.columns:
+    if 'right' in df.columns and df['right'].dtype != RIGHT_DTYPE:
         df['right'] = df['right'].astype(str).str.upper().str.strip()
         # Standardisation P/C → PUT/CALL
         df['right'] = df['right'].replace({'P': 'PUT', 'C': 'CALL'})
+        # Catégoriel (codes int8) si toutes les valeurs sont reconnues
+        if df['right'].isin(RIGHT_DTYPE.categories).all():
+            df['right'] = df['right'].astype(RIGHT_DTYPE)
     
     # 4. CORRECTION EMPIRIQUE #2 : IV en pourcentage
     if 'implied_vol' in df.columns and 'iv_pct' not in df.columns:
@@ -67,13 +108,14 @@ def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
             
     # 6. CONVERSION DATES (Votre ajout blindé)
     if 'date' in df.columns:
-        # On force en string d'abord pour gérer le format int YYYYMMDD de ThetaData
+        # Datetime déjà parsé : rien à faire ; int YYYYMMDD de ThetaData : format explicite
         try:
-            df['date'] = pd.to_datetime(df['date'].astype(str), errors='coerce')
+            df['date'] = parse_dates(df['date'])
         except Exception:
             # Fallback simple
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
+            df['date'] = pd.to_datetime(df['date'].astype(str), errors='coerce')
 
+    df.attrs['normalized'] = True
     return df
 
 def safe_column_sum(df: pd.DataFrame, col: str, default: float = 0.0) -> float:
@@ -82,14 +124,38 @@ def safe_column_sum(df: pd.DataFrame, col: str, default: float = 0.0) -> float:
         return df[col].sum()
     return default
 
+def concat_by_expiration(frames: list, exp_dates: pd.DatetimeIndex, date_dt: pd.Timestamp,
+                         add_date: bool = True) -> pd.DataFrame:
+    """
+    Concatène les frames par expiration en une passe, puis pose
+    expiration / date / dte de façon vectorisée (un repeat au lieu d'un
+    broadcast par frame).
+    
+    exp_dates / date_dt sont déjà parsés (pas de pd.to_datetime par expiration).
+    """
+    pairs = [(df, exp) for df, exp in zip(frames, exp_dates) if not df.empty]
+    if not pairs:
+        return pd.DataFrame()
+    
+    df = pd.concat([d for d, _ in pairs], ignore_index=True)
+    lengths = [len(d) for d, _ in pairs]
+    df['expiration'] = pd.DatetimeIndex([exp for _, exp in pairs]).repeat(lengths)
+    if add_date:
+        df['date'] = date_dt
+    df['dte'] = (df['expiration'] - date_dt).dt.days
+    return df
+
 # ==============================================================================
 # 🧠 FONCTIONS CŒUR
 # ==============================================================================
 
-def calculate_net_exposures(df_greeks: pd.DataFrame, df_oi: pd.DataFrame, 
-                            spot_price: float) -> dict:
+def merge_greeks_oi(df_greeks: pd.DataFrame, df_oi: pd.DataFrame) -> Optional[pd.DataFrame]:
     """
-    Calcule les expositions nettes Delta et Gamma (market-wide).
+    Jointure greeks ↔ OI sur (strike, right), calculée une fois par date et
+    partagée entre calculate_net_exposures et calculate_gex_distribution.
+    
+    Returns:
+        DataFrame fusionné, ou None si les colonnes clés manquent
     """
     df_greeks = normalize_columns(df_greeks)
     df_oi = normalize_columns(df_oi)
@@ -97,11 +163,61 @@ def calculate_net_exposures(df_greeks: pd.DataFrame, df_oi: pd.DataFrame,
     required_cols = ['strike', 'right']
     if not all(col in df_greeks.columns for col in required_cols) or \
        not all(col in df_oi.columns for col in required_cols):
-        logger.warning("calculate_net_exposures: Colonnes clés manquantes")
-        return {}
+        return None
+    
+    return df_greeks.merge(df_oi, on=required_cols, how='inner')
+
+def compute_exposures(df_merged: pd.DataFrame, spot_price: float) -> dict:
+    """
+    Expositions delta/gamma ligne à ligne, en une lecture de l'OI.
+    
+    Calculées une fois sur le résultat de merge_greeks_oi et partagées entre
+    calculate_net_exposures et calculate_gex_distribution.
+    
+    Returns:
+        Tableaux NumPy alignés sur df_merged : 'delta_exposure', 'gamma_exposure',
+        'is_call', 'is_put' et 'valid' (delta/gamma présents, OI > 0)
+    """
+    n = len(df_merged)
+    nan = np.full(n, np.nan)
+    oi = df_merged['open_interest'].to_numpy(dtype=float) if 'open_interest' in df_merged.columns else nan
+    delta = df_merged['delta'].to_numpy(dtype=float) if 'delta' in df_merged.columns else nan
+    gamma = df_merged['gamma'].to_numpy(dtype=float) if 'gamma' in df_merged.columns else nan
+    
+    oi_notional = oi * 100
+    is_call, is_put = right_masks(df_merged['right'])
+    
+    return {
+        'delta_exposure': delta * oi_notional,
+        'gamma_exposure': gamma * oi_notional * spot_price,
+        'is_call': is_call,
+        'is_put': is_put,
+        'valid': ~np.isnan(delta) & ~np.isnan(gamma) & (oi > 0),
+    }
+
+def calculate_net_exposures(df_greeks: pd.DataFrame, df_oi: pd.DataFrame, 
+                            spot_price: float, df_merged: Optional[pd.DataFrame] = None,
+                            exposures: Optional[dict] = None) -> dict:
+    """
+    Calcule les expositions nettes Delta et Gamma (market-wide).
+    
+    df_merged : résultat de merge_greeks_oi, pour éviter de refaire la jointure.
+    exposures : résultat de compute_exposures(df_merged), partagé avec le GEX.
+    """
+    if df_merged is not None:
+        df = df_merged
+    else:
+        df_greeks = normalize_columns(df_greeks)
+        df_oi = normalize_columns(df_oi)
+        
+        required_cols = ['strike', 'right']
+        if not all(col in df_greeks.columns for col in required_cols) or \
+           not all(col in df_oi.columns for col in required_cols):
+            logger.warning("calculate_net_exposures: Colonnes clés manquantes")
+            return {}
 
-    # Fusion
-    df = df_greeks.merge(df_oi, on=['strike', 'right'], how='inner')
+        # Fusion
+        df = df_greeks.merge(df_oi, on=['strike', 'right'], how='inner')
     
     # Métriques par défaut
     zero_metrics = {
@@ -119,25 +235,25 @@ def calculate_net_exposures(df_greeks: pd.DataFrame, df_oi: pd.DataFrame,
         if col not in df.columns:
             return zero_metrics
 
-    df = df[(df['delta'].notna()) & (df['gamma'].notna()) & (df['open_interest'] > 0)]
+    if exposures is None:
+        exposures = compute_exposures(df, spot_price)
     
-    calls = df[df['right'] == 'CALL'].copy()
-    puts = df[df['right'] == 'PUT'].copy()
+    # Masques CALL/PUT restreints aux lignes exploitables (delta/gamma présents, OI > 0)
+    valid = exposures['valid']
+    is_call = exposures['is_call'] & valid
+    is_put = exposures['is_put'] & valid
+    oi = df['open_interest'].to_numpy(dtype=float)
     
     # Delta Exposure
-    calls['delta_exposure'] = calls['delta'] * calls['open_interest'] * 100
-    puts['delta_exposure'] = puts['delta'] * puts['open_interest'] * 100
-    
-    net_delta_calls = calls['delta_exposure'].sum()
-    net_delta_puts = puts['delta_exposure'].sum()
+    delta_exposure = exposures['delta_exposure']
+    net_delta_calls = delta_exposure[is_call].sum()
+    net_delta_puts = delta_exposure[is_put].sum()
     net_delta = net_delta_calls + net_delta_puts
     
     # Gamma Exposure
-    calls['gamma_exposure'] = calls['gamma'] * calls['open_interest'] * 100 * spot_price
-    puts['gamma_exposure'] = puts['gamma'] * puts['open_interest'] * 100 * spot_price
-    
-    net_gamma_calls = calls['gamma_exposure'].sum()
-    net_gamma_puts = puts['gamma_exposure'].sum()
+    gamma_exposure = exposures['gamma_exposure']
+    net_gamma_calls = gamma_exposure[is_call].sum()
+    net_gamma_puts = gamma_exposure[is_put].sum()
     net_gamma = net_gamma_calls - net_gamma_puts
     
     return {
@@ -147,13 +263,48 @@ def calculate_net_exposures(df_greeks: pd.DataFrame, df_oi: pd.DataFrame,
         'net_delta_puts': net_delta_puts,
         'net_gamma_calls': net_gamma_calls,
         'net_gamma_puts': net_gamma_puts,
-        'total_oi': int(df['open_interest'].sum()),
-        'call_oi': int(calls['open_interest'].sum()),
-        'put_oi': int(puts['open_interest'].sum()),
+        'total_oi': int(oi[valid].sum()),
+        'call_oi': int(oi[is_call].sum()),
+        'put_oi': int(oi[is_put].sum()),
         'net_gamma_billions': net_gamma / 1e9,
         'net_delta_millions': net_delta / 1e6
     }
 
+def rolling_std_multi(values: np.ndarray, windows: list) -> np.ndarray:
+    """
+    Écart-type glissant (ddof=1) pour plusieurs fenêtres en une seule passe.
+    
+    Équivalent à Series.rolling(window).std() pour chaque fenêtre : NaN tant
+    que la fenêtre ne contient pas `window` valeurs valides.
+    
+    Returns:
+        Tableau (len(values), len(windows))
+    """
+    n = len(values)
+    out = np.full((n, len(windows)), np.nan)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return out
+    
+    # Centrage : la variance est invariante, la précision des sommes meilleure
+    centered = np.where(valid, values - values[valid].mean(), 0.0)
+    cum = np.concatenate(([0.0], np.cumsum(centered)))
+    cum_sq = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    cum_n = np.concatenate(([0], np.cumsum(valid)))
+    
+    for j, window in enumerate(windows):
+        if window < 2 or window > n:
+            continue
+        count = cum_n[window:] - cum_n[:-window]
+        total = cum[window:] - cum[:-window]
+        total_sq = cum_sq[window:] - cum_sq[:-window]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (total_sq - total * total / count) / (count - 1)
+        var = np.where(count >= window, np.maximum(var, 0.0), np.nan)
+        out[window - 1:, j] = np.sqrt(var)
+    
+    return out
+
 def calculate_realized_volatility(df_stock: pd.DataFrame, 
                                   windows: list = [10, 20, 30, 60, 252]) -> pd.DataFrame:
     """
@@ -186,10 +337,10 @@ def calculate_realized_volatility(df_stock: pd.DataFrame,
     # Calculs Rendements
     df['log_return'] = np.log(df['close'] / df['close'].shift(1))
     
-    for window in windows:
-        df[f'hv_{window}d'] = (
-            df['log_return'].rolling(window=window).std() * np.sqrt(252) * 100
-        )
+    # Toutes les fenêtres en une passe (sommes cumulées)
+    hv = rolling_std_multi(df['log_return'].to_numpy(dtype=float), windows) * np.sqrt(252) * 100
+    for j, window in enumerate(windows):
+        df[f'hv_{window}d'] = hv[:, j]
     
     # Sélection colonnes
     cols_to_keep = [c for c in ['date', 'close'] if c in df.columns] + \
@@ -197,53 +348,78 @@ def calculate_realized_volatility(df_stock: pd.DataFrame,
                    
     return df[cols_to_keep].dropna()
 
-def interpolate_iv_at_delta(df: pd.DataFrame, target_delta: float, 
-                            option_type: str = 'PUT') -> float:
-    """
-    Interpole IV à un delta spécifique.
+def prepare_greeks(df_greeks: pd.DataFrame) -> Optional[dict]:
     """
-    df = normalize_columns(df)
+    Tableaux NumPy des greeks (type, delta, IV, masque qualité), calculés
+    une fois par date et partagés entre skew global et term structure.
     
-    required = ['right', 'iv_pct', 'delta']
-    if not all(c in df.columns for c in required):
-        return np.nan
-
-    target_type = 'PUT' if option_type in ['PUT', 'P'] else 'CALL'
+    Returns:
+        {'is_call', 'is_put', 'delta', 'iv', 'quality'} alignés sur les lignes
+        de df_greeks, ou None si les colonnes requises manquent
+    """
+    df_greeks = normalize_columns(df_greeks)
+    if not all(c in df_greeks.columns for c in ['right', 'iv_pct', 'delta']):
+        return None
     
-    df_filtered = df[
-        (df['right'] == target_type) &
-        (df['iv_pct'] > 0) &
-        (df['delta'].notna())
-    ].copy()
+    is_call, is_put = right_masks(df_greeks['right'])
+    delta = df_greeks['delta'].to_numpy(dtype=float)
+    iv = df_greeks['iv_pct'].to_numpy(dtype=float)
     
-    if 'volume' in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered['volume'] > 0]
+    # Options exploitables : IV positive, delta renseigné, volume > 0 si disponible
+    quality = (iv > 0) & ~np.isnan(delta)
+    if 'volume' in df_greeks.columns:
+        quality &= (df_greeks['volume'] > 0).to_numpy()
     
-    if df_filtered.empty:
-        return np.nan
+    return {'is_call': is_call, 'is_put': is_put, 'delta': delta, 'iv': iv, 'quality': quality}
+
+def sorted_delta_iv(prepared: dict, option_type: str, rows: Optional[np.ndarray] = None) -> tuple:
+    """
+    (|delta| trié, iv_pct aligné) des options exploitables d'un type,
+    restreintes à rows (masque booléen) si fourni.
     
-    df_filtered['abs_delta'] = df_filtered['delta'].abs()
-    df_filtered = df_filtered.sort_values('abs_delta')
+    Calculé une fois par type puis réutilisé pour chaque delta cible.
+    """
+    target_type = 'PUT' if option_type in ['PUT', 'P'] else 'CALL'
     
-    min_d = df_filtered['abs_delta'].min()
-    max_d = df_filtered['abs_delta'].max()
+    mask = (prepared['is_put'] if target_type == 'PUT' else prepared['is_call']) & prepared['quality']
+    if rows is not None:
+        mask &= rows
     
-    if min_d > target_delta or max_d < target_delta:
+    abs_delta = np.abs(prepared['delta'][mask])
+    iv = prepared['iv'][mask]
+    order = np.argsort(abs_delta)
+    return abs_delta[order], iv[order]
+
+def interp_sorted_iv(abs_delta: np.ndarray, iv: np.ndarray, target_delta: float) -> float:
+    """Interpolation linéaire sur des deltas triés (NaN hors plage)."""
+    if len(abs_delta) == 0 or abs_delta[0] > target_delta or abs_delta[-1] < target_delta:
         return np.nan
     
     try:
-        f = interp1d(df_filtered['abs_delta'], df_filtered['iv_pct'], 
-                     kind='linear', bounds_error=True)
-        return float(f(target_delta))
+        return float(np.interp(target_delta, abs_delta, iv))
     except Exception:
         return np.nan
 
-def calculate_skew_metrics(df_greeks: pd.DataFrame) -> dict:
+def interpolate_iv_at_delta(df: pd.DataFrame, target_delta: float, 
+                            option_type: str = 'PUT', prepared: Optional[dict] = None) -> float:
     """
-    Calcule métriques de skew (RR25, ATM IV, etc.).
+    Interpole IV à un delta spécifique.
+    
+    prepared : résultat de prepare_greeks(df), partagé entre appels PUT / CALL.
     """
-    df_greeks = normalize_columns(df_greeks)
+    if prepared is None:
+        prepared = prepare_greeks(df)
+    if prepared is None:
+        return np.nan
     
+    return interp_sorted_iv(*sorted_delta_iv(prepared, option_type), target_delta)
+
+def calculate_skew_metrics(df_greeks: pd.DataFrame, prepared: Optional[dict] = None) -> dict:
+    """
+    Calcule métriques de skew (RR25, ATM IV, etc.).
+    
+    prepared : résultat de prepare_greeks(df_greeks), partagé avec la term structure.
+    """
     metrics = {
         'iv_atm': np.nan, 'iv_25d_put': np.nan, 'iv_25d_call': np.nan,
         'rr25': np.nan, 'iv_10d_put': np.nan, 'bf25': np.nan
@@ -252,17 +428,26 @@ def calculate_skew_metrics(df_greeks: pd.DataFrame) -> dict:
     if df_greeks.empty:
         return metrics
     
-    iv_atm_call = interpolate_iv_at_delta(df_greeks, 0.50, 'CALL')
-    iv_atm_put = interpolate_iv_at_delta(df_greeks, 0.50, 'PUT')
+    if prepared is None:
+        prepared = prepare_greeks(df_greeks)
+    if prepared is None:
+        return metrics
+    
+    # Filtre + tri une seule fois par type, partagés par tous les deltas cibles
+    calls = sorted_delta_iv(prepared, 'CALL')
+    puts = sorted_delta_iv(prepared, 'PUT')
+    
+    iv_atm_call = interp_sorted_iv(*calls, 0.50)
+    iv_atm_put = interp_sorted_iv(*puts, 0.50)
     metrics['iv_atm'] = np.nanmean([iv_atm_call, iv_atm_put])
     
-    metrics['iv_25d_put'] = interpolate_iv_at_delta(df_greeks, 0.25, 'PUT')
-    metrics['iv_25d_call'] = interpolate_iv_at_delta(df_greeks, 0.25, 'CALL')
+    metrics['iv_25d_put'] = interp_sorted_iv(*puts, 0.25)
+    metrics['iv_25d_call'] = interp_sorted_iv(*calls, 0.25)
     
     if np.isfinite(metrics['iv_25d_put']) and np.isfinite(metrics['iv_25d_call']):
         metrics['rr25'] = metrics['iv_25d_put'] - metrics['iv_25d_call']
     
-    metrics['iv_10d_put'] = interpolate_iv_at_delta(df_greeks, 0.10, 'PUT')
+    metrics['iv_10d_put'] = interp_sorted_iv(*puts, 0.10)
     
     if all(np.isfinite([metrics['iv_25d_put'], metrics['iv_atm'], metrics['iv_25d_call']])):
         metrics['bf25'] = (metrics['iv_25d_put'] + metrics['iv_25d_call']) / 2 - metrics['iv_atm']
@@ -291,8 +476,10 @@ def calculate_pc_ratios(df_price: pd.DataFrame, df_greeks: pd.DataFrame,
     if df.empty:
         return {}
 
-    puts = df[df['right'] == 'PUT'].copy()
-    calls = df[df['right'] == 'CALL'].copy()
+    # Lecture seule : pas de copie des sous-ensembles
+    is_call, is_put = right_masks(df['right'])
+    puts = df[is_put]
+    calls = df[is_call]
 
     vol_p = safe_column_sum(puts, 'volume')
     vol_c = safe_column_sum(calls, 'volume')
@@ -325,43 +512,71 @@ def calculate_pc_ratios(df_price: pd.DataFrame, df_greeks: pd.DataFrame,
     return ratios
 
 def calculate_gex_distribution(df_greeks: pd.DataFrame, df_oi: pd.DataFrame, 
-                               spot_price: float) -> pd.DataFrame:
+                               spot_price: float, df_merged: Optional[pd.DataFrame] = None,
+                               exposures: Optional[dict] = None) -> pd.DataFrame:
     """
     Calcule distribution GEX par strike.
-    """
-    df_greeks = normalize_columns(df_greeks)
-    df_oi = normalize_columns(df_oi)
     
-    df = df_greeks.merge(df_oi, on=['strike', 'right'], how='inner')
+    df_merged : résultat de merge_greeks_oi, pour éviter de refaire la jointure.
+    exposures : résultat de compute_exposures(df_merged), partagé avec les net exposures.
+    """
+    if df_merged is not None:
+        df = df_merged
+    else:
+        df_greeks = normalize_columns(df_greeks)
+        df_oi = normalize_columns(df_oi)
+        
+        df = df_greeks.merge(df_oi, on=['strike', 'right'], how='inner')
     
     if df.empty or 'gamma' not in df.columns or 'open_interest' not in df.columns:
         return pd.DataFrame()
     
-    df['gex'] = df['gamma'] * df['open_interest'] * 100 * spot_price
-    df.loc[df['right'] == 'PUT', 'gex'] *= -1
+    if exposures is None:
+        exposures = compute_exposures(df, spot_price)
+    
+    # Signe PUT appliqué à l'exposition gamma partagée ; frame local car df_merged peut être partagé
+    gex = np.where(exposures['is_put'], -exposures['gamma_exposure'], exposures['gamma_exposure'])
+    oi = df['open_interest'].to_numpy()
+    oi = oi.astype(np.int64) if np.issubdtype(oi.dtype, np.integer) else np.nan_to_num(oi.astype(float))
+    
+    # Agrégation par strike : tri stable puis np.add.reduceat sur les bornes de groupe
+    # (un balayage linéaire au lieu du hachage groupby ; strikes NaN ignorés comme groupby)
+    strikes = df['strike'].to_numpy(dtype=float)
+    keep = ~np.isnan(strikes)
+    order = np.argsort(strikes[keep], kind='stable')
+    sorted_strikes = strikes[keep][order]
+    uniq, starts = np.unique(sorted_strikes, return_index=True)
+    
+    if len(uniq):
+        gex_sum = np.add.reduceat(np.nan_to_num(gex[keep][order]), starts)
+        oi_sum = np.add.reduceat(oi[keep][order], starts)
+    else:
+        gex_sum = np.empty(0)
+        oi_sum = np.empty(0, dtype=oi.dtype)
     
-    gex_by_strike = df.groupby('strike').agg({
-        'gex': 'sum', 
-        'open_interest': 'sum'
-    }).reset_index()
+    gex_by_strike = pd.DataFrame({'strike': uniq, 'gex': gex_sum, 'open_interest': oi_sum})
     
     gex_by_strike['spot_price'] = spot_price
     gex_by_strike['distance_to_spot'] = gex_by_strike['strike'] - spot_price
     gex_by_strike['gex_billions'] = gex_by_strike['gex'] / 1e9
     
-    gex_by_strike['is_call_wall'] = False
-    gex_by_strike['is_put_wall'] = False
+    gex_arr = gex_by_strike['gex'].to_numpy()
+    is_call_wall = np.zeros(len(gex_arr), dtype=bool)
+    is_put_wall = np.zeros(len(gex_arr), dtype=bool)
     
-    if not gex_by_strike.empty:
-        max_call_idx = gex_by_strike['gex'].idxmax()
-        if gex_by_strike.loc[max_call_idx, 'gex'] > 0:
-            gex_by_strike.loc[max_call_idx, 'is_call_wall'] = True
+    if len(gex_arr):
+        i_max = gex_arr.argmax()
+        if gex_arr[i_max] > 0:
+            is_call_wall[i_max] = True
             
-        min_put_idx = gex_by_strike['gex'].idxmin()
-        if gex_by_strike.loc[min_put_idx, 'gex'] < 0:
-            gex_by_strike.loc[min_put_idx, 'is_put_wall'] = True
+        i_min = gex_arr.argmin()
+        if gex_arr[i_min] < 0:
+            is_put_wall[i_min] = True
+    
+    gex_by_strike['is_call_wall'] = is_call_wall
+    gex_by_strike['is_put_wall'] = is_put_wall
     
-    return gex_by_strike.sort_values('strike')
+    return gex_by_strike
 
 def analyze_liquidity(df_price: pd.DataFrame) -> dict:
     """
@@ -372,25 +587,27 @@ def analyze_liquidity(df_price: pd.DataFrame) -> dict:
     if df.empty:
         return {}
     
+    # Séries locales : le DataFrame (éventuellement partagé) n'est pas modifié
     if 'ask' in df.columns and 'bid' in df.columns and 'close' in df.columns:
-        df['spread_abs'] = df['ask'] - df['bid']
-        df['spread_pct'] = np.where(df['close'] > 0, 
-                                    (df['spread_abs'] / df['close']) * 100, 0)
-        df = df[df['spread_pct'] < 100]
+        spread_abs = df['ask'] - df['bid']
+        spread_pct = pd.Series(np.where(df['close'] > 0,
+                                        (spread_abs / df['close']) * 100, 0), index=df.index)
+        keep = spread_pct < 100
+        df = df[keep]
+        spread_pct = spread_pct[keep]
     else:
-        df['spread_pct'] = 0.0
+        spread_pct = pd.Series(0.0, index=df.index)
 
-    if 'volume' not in df.columns:
-        df['volume'] = 0
+    volume = df['volume'] if 'volume' in df.columns else pd.Series(0, index=df.index)
         
     metrics = {
-        'avg_spread_pct': df['spread_pct'].mean() if not df.empty else 0,
-        'median_spread_pct': df['spread_pct'].median() if not df.empty else 0,
-        'max_spread_pct': df['spread_pct'].max() if not df.empty else 0,
-        'total_volume': df['volume'].sum(),
-        'avg_volume': df['volume'].mean() if not df.empty else 0,
-        'illiquid_contracts': (df['spread_pct'] > 10).sum(),
-        'zero_volume_contracts': (df['volume'] == 0).sum()
+        'avg_spread_pct': spread_pct.mean() if not df.empty else 0,
+        'median_spread_pct': spread_pct.median() if not df.empty else 0,
+        'max_spread_pct': spread_pct.max() if not df.empty else 0,
+        'total_volume': volume.sum(),
+        'avg_volume': volume.mean() if not df.empty else 0,
+        'illiquid_contracts': (spread_pct > 10).sum(),
+        'zero_volume_contracts': (volume == 0).sum()
     }
     
     if len(df) > 0:
@@ -2,16 +2,17 @@
 Collecteurs de données spécialisés.
 """
 import pandas as pd
+import numpy as np
 import logging
-from typing import List, Dict
-import time
+from typing import List, Dict, Iterator, Optional
 from datetime import datetime, timedelta
 
-from core.api_wrapper import ThetaDataAPI
+from core.api_wrapper import ThetaDataAPI, trade_dates as _trade_dates
 from core.calculations import (
     calculate_net_exposures, calculate_realized_volatility,
     calculate_skew_metrics, calculate_pc_ratios,
-    calculate_gex_distribution, analyze_liquidity
+    calculate_gex_distribution, analyze_liquidity, merge_greeks_oi,
+    compute_exposures, concat_by_expiration
 )
 
 logger = logging.getLogger(__name__)
@@ -21,45 +22,67 @@ class OptionsDataCollector:
     
     def __init__(self):
         from config import settings
-        self.api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT)
+        self.api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT,
+                               settings.FETCH_WORKERS, settings.RATE_LIMIT_PER_SEC)
         self.settings = settings
     
+    def close(self):
+        """Libère les connexions HTTP et le pool de l'API."""
+        self.api.close()
+    
     def get_active_expirations(self, symbol: str, current_date: str) -> List[str]:
         """Récupère les expirations actives (>= date courante)."""
-        df_exp = self.api.fetch('/option/list/expirations', {'symbol': symbol})
+        # Mémorisé par (symbol, date) côté API : pas de re-fetch ni de re-parsing
+        exp_list = self.api.fetch_active_expirations(symbol, current_date)
         
-        if df_exp.empty:
-            logger.warning(f"No expirations found for {symbol}")
+        if not exp_list:
+            logger.warning(f"No active expirations found for {symbol}")
             return []
         
-        expirations = pd.to_datetime(df_exp['expiration'])
-        active = expirations[expirations >= pd.to_datetime(current_date)]
-        exp_list = active.dt.strftime('%Y%m%d').tolist()
         logger.info(f"Found {len(exp_list)} active expirations for {symbol}")
         return exp_list
     
+    @staticmethod
+    def _core_requests(symbol: str, date: str, expiration: str) -> List[tuple]:
+        """Requêtes (prices, greeks, OI) d'une expiration, pour fetch_many."""
+        return [
+            ('/option/history/eod', {
+                'symbol': symbol, 'expiration': expiration,
+                'start_date': date, 'end_date': date
+            }),
+            ('/option/history/greeks/eod', {
+                'symbol': symbol, 'expiration': expiration,
+                'start_date': date, 'end_date': date
+            }),
+            ('/option/history/open_interest', {
+                'symbol': symbol, 'expiration': expiration, 'date': date
+            }),
+        ]
+    
     def collect_core_data(self, symbol: str, date: str, expiration: str) -> Dict[str, pd.DataFrame]:
         """Collecte les 3 core datasets pour une expiration."""
         logger.info(f"Collecting core data: {symbol} exp={expiration} date={date}")
         
-        df_prices = self.api.fetch('/option/history/eod', {
-            'symbol': symbol, 'expiration': expiration,
-            'start_date': date, 'end_date': date
-        })
-        time.sleep(self.settings.RATE_LIMIT_DELAY)
+        df_prices, df_greeks, df_oi = self.api.fetch_many(self._core_requests(symbol, date, expiration))
         
-        df_greeks = self.api.fetch('/option/history/greeks/eod', {
-            'symbol': symbol, 'expiration': expiration,
-            'start_date': date, 'end_date': date
-        })
-        time.sleep(self.settings.RATE_LIMIT_DELAY)
+        return {'prices': df_prices, 'greeks': df_greeks, 'oi': df_oi}
+    
+    def _collect_per_expiration(self, symbol: str, date: str, expirations: List[str]) -> tuple:
+        """Fallback : (prices, greeks, oi) via une requête par expiration et par dataset."""
+        # Toutes les expirations d'un coup : le pool de l'API parallélise, le token bucket limite
+        requests_list = []
+        for exp in expirations:
+            requests_list += self._core_requests(symbol, date, exp)
+        results = self.api.fetch_many(requests_list)
         
-        df_oi = self.api.fetch('/option/history/open_interest', {
-            'symbol': symbol, 'expiration': expiration, 'date': date
-        })
-        time.sleep(self.settings.RATE_LIMIT_DELAY)
+        # Parsés une seule fois, puis une concat par dataset et un tag vectorisé
+        exp_dates = pd.DatetimeIndex(pd.to_datetime(pd.Series(expirations, dtype=object)))
+        date_dt = pd.Timestamp(date)
+        df_prices = concat_by_expiration(results[0::3], exp_dates, date_dt, add_date=False)
+        df_greeks = concat_by_expiration(results[1::3], exp_dates, date_dt, add_date=False)
+        df_oi = concat_by_expiration(results[2::3], exp_dates, date_dt, add_date=False)
         
-        return {'prices': df_prices, 'greeks': df_greeks, 'oi': df_oi}
+        return df_prices, df_greeks, df_oi
     
     def collect_all_expirations_data(self, symbol: str, date: str) -> Dict:
         """Collecte données pour TOUTES les expirations actives."""
@@ -71,28 +94,14 @@ class OptionsDataCollector:
                 'all_oi': pd.DataFrame(), 'expiration_count': 0
             }
         
-        all_prices = []
-        all_greeks = []
-        all_oi = []
-        
         logger.info(f"Collecting data for {len(expirations)} expirations...")
         
-        for i, exp in enumerate(expirations, 1):
-            logger.info(f"Processing expiration {i}/{len(expirations)}: {exp}")
-            data = self.collect_core_data(symbol, date, exp)
-            
-            for key in ['prices', 'greeks', 'oi']:
-                if not data[key].empty:
-                    data[key]['expiration'] = pd.to_datetime(exp)
-                    data[key]['dte'] = (pd.to_datetime(exp) - pd.to_datetime(date)).days
-            
-            all_prices.append(data['prices'])
-            all_greeks.append(data['greeks'])
-            all_oi.append(data['oi'])
-        
-        df_prices = pd.concat(all_prices, ignore_index=True) if all_prices else pd.DataFrame()
-        df_greeks = pd.concat(all_greeks, ignore_index=True) if all_greeks else pd.DataFrame()
-        df_oi = pd.concat(all_oi, ignore_index=True) if all_oi else pd.DataFrame()
+        # expiration='*' : 3 requêtes au total quand l'API le supporte
+        bulk = self.api.fetch_all_expirations(symbol, date, expirations)
+        if bulk is not None:
+            df_prices, df_greeks, df_oi = bulk
+        else:
+            df_prices, df_greeks, df_oi = self._collect_per_expiration(symbol, date, expirations)
         
         logger.info(f"Collected {len(df_prices)} price rows, {len(df_greeks)} greeks rows, {len(df_oi)} OI rows")
         
@@ -107,29 +116,178 @@ class OptionsDataCollector:
         
         metrics = {'symbol': symbol, 'date': date, 'timestamp': datetime.now().isoformat()}
         
-        df_spot = self.api.fetch('/stock/history/eod', {
-            'symbol': symbol, 'start_date': date, 'end_date': date
-        })
+        # Spot + fenêtre HV (300 jours) en une requête
+        start_date_hv = (pd.to_datetime(date) - timedelta(days=300)).strftime('%Y%m%d')
+        df_spot, df_stock_hist = self.api.fetch_spot_with_history(symbol, date, start_date_hv)
         
         if df_spot.empty:
             logger.error(f"No spot price for {symbol} on {date}")
             return metrics, {}
         
+        core_data = self.collect_all_expirations_data(symbol, date)
+        if core_data['all_greeks'].empty or core_data['all_oi'].empty:
+            metrics['spot_price'] = float(df_spot['close'].iloc[0])
+            metrics['expiration_count'] = core_data['expiration_count']
+            logger.warning("Insufficient data for calculations")
+            return metrics, {}
+        
+        return self._compute_daily_metrics(metrics, df_spot, core_data, df_stock_hist)
+    
+    def iter_range_data(self, symbol: str, start_date: str, end_date: str) -> Iterator[tuple]:
+        """
+        Collecte une plage de dates par lots mensuels (backfill).
+        
+        Chaque mois est un collect_range_data distinct : l'appelant calcule et
+        sauvegarde un lot avant que le suivant ne soit demandé, ce qui borne la
+        mémoire et conserve le travail déjà fait si le backfill s'interrompt.
+        L'historique stock (fenêtre HV comprise) n'est demandé qu'une fois.
+        
+        Yields:
+            (début, fin, bulk) par mois, bulk étant None si fallback jour par jour
+        """
+        start = pd.to_datetime(start_date)
+        end = pd.to_datetime(end_date)
+        
+        start_date_hv = (start - timedelta(days=300)).strftime('%Y%m%d')
+        df_stock_hist = self.api.fetch_stock_history(symbol, start_date_hv, end.strftime('%Y%m%d'))
+        
+        for month_start in pd.date_range(start.replace(day=1), end, freq='MS'):
+            batch_start = max(start, month_start)
+            batch_end = min(end, month_start + pd.offsets.MonthEnd(0))
+            yield batch_start, batch_end, self.collect_range_data(
+                symbol, batch_start.strftime('%Y%m%d'), batch_end.strftime('%Y%m%d'), df_stock_hist)
+    
+    def collect_range_data(self, symbol: str, start_date: str, end_date: str,
+                           df_stock_hist: Optional[pd.DataFrame] = None) -> Optional[Dict]:
+        """
+        Collecte en bloc une plage de dates (backfill).
+        
+        Greeks et prix : UNE requête par expiration sur toute la plage
+        (au lieu d'une par expiration et par jour), découpée ensuite par date.
+        L'OI reste demandé jour par jour (endpoint à date unique).
+        
+        Args:
+            df_stock_hist: Historique stock déjà collecté (fenêtre HV comprise),
+                demandé à l'API si absent
+        
+        Returns:
+            Données brutes indexées par 'trade_date', ou None si les réponses
+            ne permettent pas de découper par date (fallback jour par jour)
+        """
+        start = pd.to_datetime(start_date)
+        end = pd.to_datetime(end_date)
+        start_str, end_str = start.strftime('%Y%m%d'), end.strftime('%Y%m%d')
+        
+        if df_stock_hist is None:
+            start_date_hv = (start - timedelta(days=300)).strftime('%Y%m%d')
+            df_stock_hist = self.api.fetch_stock_history(symbol, start_date_hv, end_str)
+        
+        expirations = self.get_active_expirations(symbol, start_str)
+        exp_dates = pd.to_datetime(pd.Series(expirations, dtype=object))
+        trade_days = pd.bdate_range(start, end)
+        
+        requests_list = []
+        oi_keys = []
+        for exp, exp_dt in zip(expirations, exp_dates):
+            requests_list.append(('/option/history/eod', {
+                'symbol': symbol, 'expiration': exp, 'start_date': start_str, 'end_date': end_str
+            }))
+            requests_list.append(('/option/history/greeks/eod', {
+                'symbol': symbol, 'expiration': exp, 'start_date': start_str, 'end_date': end_str
+            }))
+        for exp, exp_dt in zip(expirations, exp_dates):
+            for day in trade_days[trade_days <= exp_dt]:
+                requests_list.append(('/option/history/open_interest', {
+                    'symbol': symbol, 'expiration': exp, 'date': day.strftime('%Y%m%d')
+                }))
+                oi_keys.append((exp_dt, day))
+        
+        logger.info(f"Range fetch: {len(requests_list)} requests for {len(expirations)} expirations")
+        results = self.api.fetch_many(requests_list)
+        
+        frames = {'prices': [], 'greeks': [], 'oi': []}
+        for i, exp_dt in enumerate(exp_dates):
+            for key, df in (('prices', results[2 * i]), ('greeks', results[2 * i + 1])):
+                if df.empty:
+                    continue
+                trade_date = _trade_dates(df)
+                if trade_date is None:
+                    logger.warning(f"No date column in range response ({key}), falling back to daily fetch")
+                    return None
+                frames[key].append(df.assign(expiration=exp_dt, trade_date=trade_date))
+        
+        for (exp_dt, day), df in zip(oi_keys, results[2 * len(expirations):]):
+            if not df.empty:
+                frames['oi'].append(df.assign(expiration=exp_dt, trade_date=day))
+        
+        if not df_stock_hist.empty:
+            trade_date = _trade_dates(df_stock_hist)
+            if trade_date is None:
+                logger.warning("No date column in stock history, falling back to daily fetch")
+                return None
+            df_stock_hist = df_stock_hist.assign(trade_date=trade_date)
+        
+        bulk = {key: pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+                for key, dfs in frames.items()}
+        bulk['stock_history'] = df_stock_hist
+        bulk['expirations'] = exp_dates
+        return bulk
+    
+    def calculate_daily_metrics_from_range(self, symbol: str, date: str, bulk: Dict) -> tuple:
+        """Équivalent de calculate_daily_metrics sur des données collect_range_data."""
+        logger.info(f"=== CALCULATING DAILY METRICS: {symbol} {date} ===")
+        
+        metrics = {'symbol': symbol, 'date': date, 'timestamp': datetime.now().isoformat()}
+        day = pd.to_datetime(date)
+        
+        def day_slice(df: pd.DataFrame) -> pd.DataFrame:
+            if df.empty:
+                return df
+            out = df[df['trade_date'] == day].drop(columns='trade_date')
+            out['dte'] = (out['expiration'] - day).dt.days
+            return out.reset_index(drop=True)
+        
+        df_hist = bulk['stock_history']
+        df_spot = df_hist[df_hist['trade_date'] == day] if not df_hist.empty else df_hist
+        
+        if df_spot.empty:
+            logger.error(f"No spot price for {symbol} on {date}")
+            return metrics, {}
+        
+        core_data = {
+            'all_prices': day_slice(bulk['prices']),
+            'all_greeks': day_slice(bulk['greeks']),
+            'all_oi': day_slice(bulk['oi']),
+            'expiration_count': int((bulk['expirations'] >= day).sum())
+        }
+        if core_data['all_greeks'].empty or core_data['all_oi'].empty:
+            metrics['spot_price'] = float(df_spot['close'].iloc[0])
+            metrics['expiration_count'] = core_data['expiration_count']
+            logger.warning("Insufficient data for calculations")
+            return metrics, {}
+        
+        hv_window = (df_hist['trade_date'] >= day - timedelta(days=300)) & (df_hist['trade_date'] <= day)
+        df_stock_hist = df_hist[hv_window].drop(columns='trade_date')
+        
+        return self._compute_daily_metrics(metrics, df_spot, core_data, df_stock_hist)
+    
+    def _compute_daily_metrics(self, metrics: Dict, df_spot: pd.DataFrame,
+                               core_data: Dict, df_stock_hist: pd.DataFrame) -> tuple:
+        """Calculs purs (aucun appel API) à partir des données d'une date."""
         spot_price = float(df_spot['close'].iloc[0])
         metrics['spot_price'] = spot_price
         logger.info(f"Spot price: ${spot_price:.2f}")
         
-        core_data = self.collect_all_expirations_data(symbol, date)
         df_prices = core_data['all_prices']
         df_greeks = core_data['all_greeks']
         df_oi = core_data['all_oi']
         metrics['expiration_count'] = core_data['expiration_count']
         
-        if df_greeks.empty or df_oi.empty:
-            logger.warning("Insufficient data for calculations")
-            return metrics, {}
+        # Jointure greeks ↔ OI partagée par net exposures et GEX
+        df_merged = merge_greeks_oi(df_greeks, df_oi)
+        exposures = compute_exposures(df_merged, spot_price) if df_merged is not None else None
         
-        net_exposures = calculate_net_exposures(df_greeks, df_oi, spot_price)
+        net_exposures = calculate_net_exposures(df_greeks, df_oi, spot_price, df_merged, exposures)
         metrics.update(net_exposures)
         logger.info(f"Net Gamma: ${net_exposures['net_gamma']/1e9:.2f}B")
         
@@ -139,7 +297,7 @@ class OptionsDataCollector:
         pc_ratios = calculate_pc_ratios(df_prices, df_greeks, df_oi)
         metrics.update(pc_ratios)
         
-        df_gex = calculate_gex_distribution(df_greeks, df_oi, spot_price)
+        df_gex = calculate_gex_distribution(df_greeks, df_oi, spot_price, df_merged, exposures)
         if not df_gex.empty:
             call_walls = df_gex[df_gex['is_call_wall']]
             put_walls = df_gex[df_gex['is_put_wall']]
@@ -152,11 +310,6 @@ class OptionsDataCollector:
         for k, v in liquidity.items():
             metrics[f'liquidity_{k}'] = v
         
-        start_date_hv = (pd.to_datetime(date) - timedelta(days=300)).strftime('%Y%m%d')
-        df_stock_hist = self.api.fetch('/stock/history/eod', {
-            'symbol': symbol, 'start_date': start_date_hv, 'end_date': date
-        })
-        
         if not df_stock_hist.empty:
             df_hv = calculate_realized_volatility(df_stock_hist, self.settings.HV_WINDOWS)
             if not df_hv.empty:
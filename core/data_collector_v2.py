@@ -5,14 +5,14 @@ VERSION MISE À JOUR avec Term Structure (RR25 par DTE)
 import pandas as pd
 import logging
 from typing import List, Dict
-import time
 from datetime import datetime, timedelta
 
 from core.api_wrapper import ThetaDataAPI
 from core.calculations import (
     calculate_net_exposures, calculate_realized_volatility,
     calculate_skew_metrics, calculate_pc_ratios,
-    calculate_gex_distribution, analyze_liquidity
+    calculate_gex_distribution, analyze_liquidity, merge_greeks_oi,
+    compute_exposures, concat_by_expiration, prepare_greeks
 )
 from core.term_structure import calculate_term_structure_metrics
 
@@ -23,46 +23,68 @@ class OptionsDataCollector:
     
     def __init__(self):
         from config import settings
-        self.api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT)
+        self.api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT,
+                               settings.FETCH_WORKERS, settings.RATE_LIMIT_PER_SEC)
         self.settings = settings
     
+    def close(self):
+        """Libère les connexions HTTP et le pool de l'API."""
+        self.api.close()
+    
     def get_active_expirations(self, symbol: str, current_date: str) -> List[str]:
         """Récupère les expirations actives (>= date courante)."""
-        df_exp = self.api.fetch('/option/list/expirations', {'symbol': symbol})
+        # Mémorisé par (symbol, date) côté API : pas de re-fetch ni de re-parsing
+        exp_list = self.api.fetch_active_expirations(symbol, current_date)
         
-        if df_exp.empty:
-            logger.warning(f"No expirations found for {symbol}")
+        if not exp_list:
+            logger.warning(f"No active expirations found for {symbol}")
             return []
         
-        expirations = pd.to_datetime(df_exp['expiration'])
-        active = expirations[expirations >= pd.to_datetime(current_date)]
-        exp_list = active.dt.strftime('%Y%m%d').tolist()
         logger.info(f"Found {len(exp_list)} active expirations for {symbol}")
         return exp_list
     
+    @staticmethod
+    def _core_requests(symbol: str, date: str, expiration: str) -> List[tuple]:
+        """Requêtes (prices, greeks, OI) d'une expiration, pour fetch_many."""
+        return [
+            ('/option/history/eod', {
+                'symbol': symbol, 'expiration': expiration,
+                'start_date': date, 'end_date': date
+            }),
+            ('/option/history/greeks/eod', {
+                'symbol': symbol, 'expiration': expiration,
+                'start_date': date, 'end_date': date
+            }),
+            ('/option/history/open_interest', {
+                'symbol': symbol, 'expiration': expiration, 'date': date
+            }),
+        ]
+    
     def collect_core_data(self, symbol: str, date: str, expiration: str) -> Dict[str, pd.DataFrame]:
         """Collecte les 3 core datasets pour une expiration."""
         logger.info(f"Collecting core data: {symbol} exp={expiration} date={date}")
         
-        df_prices = self.api.fetch('/option/history/eod', {
-            'symbol': symbol, 'expiration': expiration,
-            'start_date': date, 'end_date': date
-        })
-        time.sleep(self.settings.RATE_LIMIT_DELAY)
-        
-        df_greeks = self.api.fetch('/option/history/greeks/eod', {
-            'symbol': symbol, 'expiration': expiration,
-            'start_date': date, 'end_date': date
-        })
-        time.sleep(self.settings.RATE_LIMIT_DELAY)
-        
-        df_oi = self.api.fetch('/option/history/open_interest', {
-            'symbol': symbol, 'expiration': expiration, 'date': date
-        })
-        time.sleep(self.settings.RATE_LIMIT_DELAY)
+        df_prices, df_greeks, df_oi = self.api.fetch_many(self._core_requests(symbol, date, expiration))
         
         return {'prices': df_prices, 'greeks': df_greeks, 'oi': df_oi}
     
+    def _collect_per_expiration(self, symbol: str, date: str, expirations: List[str]) -> tuple:
+        """Fallback : (prices, greeks, oi) via une requête par expiration et par dataset."""
+        # Toutes les expirations d'un coup : le pool de l'API parallélise, le token bucket limite
+        requests_list = []
+        for exp in expirations:
+            requests_list += self._core_requests(symbol, date, exp)
+        results = self.api.fetch_many(requests_list)
+        
+        # Parsés une seule fois, puis une concat par dataset et un tag vectorisé
+        exp_dates = pd.DatetimeIndex(pd.to_datetime(pd.Series(expirations, dtype=object)))
+        date_dt = pd.Timestamp(date)
+        df_prices = concat_by_expiration(results[0::3], exp_dates, date_dt, add_date=False)
+        df_greeks = concat_by_expiration(results[1::3], exp_dates, date_dt, add_date=False)
+        df_oi = concat_by_expiration(results[2::3], exp_dates, date_dt, add_date=False)
+        
+        return df_prices, df_greeks, df_oi
+    
     def collect_all_expirations_data(self, symbol: str, date: str) -> Dict:
         """Collecte données pour TOUTES les expirations actives."""
         expirations = self.get_active_expirations(symbol, date)
@@ -73,28 +95,14 @@ class OptionsDataCollector:
                 'all_oi': pd.DataFrame(), 'expiration_count': 0
             }
         
-        all_prices = []
-        all_greeks = []
-        all_oi = []
-        
         logger.info(f"Collecting data for {len(expirations)} expirations...")
         
-        for i, exp in enumerate(expirations, 1):
-            logger.info(f"Processing expiration {i}/{len(expirations)}: {exp}")
-            data = self.collect_core_data(symbol, date, exp)
-            
-            for key in ['prices', 'greeks', 'oi']:
-                if not data[key].empty:
-                    data[key]['expiration'] = pd.to_datetime(exp)
-                    data[key]['dte'] = (pd.to_datetime(exp) - pd.to_datetime(date)).days
-            
-            all_prices.append(data['prices'])
-            all_greeks.append(data['greeks'])
-            all_oi.append(data['oi'])
-        
-        df_prices = pd.concat(all_prices, ignore_index=True) if all_prices else pd.DataFrame()
-        df_greeks = pd.concat(all_greeks, ignore_index=True) if all_greeks else pd.DataFrame()
-        df_oi = pd.concat(all_oi, ignore_index=True) if all_oi else pd.DataFrame()
+        # expiration='*' : 3 requêtes au total quand l'API le supporte
+        bulk = self.api.fetch_all_expirations(symbol, date, expirations)
+        if bulk is not None:
+            df_prices, df_greeks, df_oi = bulk
+        else:
+            df_prices, df_greeks, df_oi = self._collect_per_expiration(symbol, date, expirations)
         
         logger.info(f"Collected {len(df_prices)} price rows, {len(df_greeks)} greeks rows, {len(df_oi)} OI rows")
         
@@ -112,10 +120,9 @@ class OptionsDataCollector:
         
         metrics = {'symbol': symbol, 'date': date, 'timestamp': datetime.now().isoformat()}
         
-        # 1. Spot price
-        df_spot = self.api.fetch('/stock/history/eod', {
-            'symbol': symbol, 'start_date': date, 'end_date': date
-        })
+        # 1. Spot price (+ fenêtre HV de l'étape 9, même requête)
+        start_date_hv = (pd.to_datetime(date) - timedelta(days=300)).strftime('%Y%m%d')
+        df_spot, df_stock_hist = self.api.fetch_spot_with_history(symbol, date, start_date_hv)
         
         if df_spot.empty:
             logger.error(f"No spot price for {symbol} on {date}")
@@ -137,17 +144,23 @@ class OptionsDataCollector:
             return metrics, {}
         
         # 3. Net Delta & Gamma (CRITICAL)
-        net_exposures = calculate_net_exposures(df_greeks, df_oi, spot_price)
+        # Jointure greeks ↔ OI partagée par net exposures et GEX
+        df_merged = merge_greeks_oi(df_greeks, df_oi)
+        exposures = compute_exposures(df_merged, spot_price) if df_merged is not None else None
+        
+        net_exposures = calculate_net_exposures(df_greeks, df_oi, spot_price, df_merged, exposures)
         metrics.update(net_exposures)
         logger.info(f"Net Gamma: ${net_exposures['net_gamma']/1e9:.2f}B")
         
         # 4. Skew Metrics (Global - toutes expirations mélangées)
-        skew_metrics = calculate_skew_metrics(df_greeks)
+        # Tableaux type/delta/IV partagés par skew global et term structure
+        prepared = prepare_greeks(df_greeks)
+        skew_metrics = calculate_skew_metrics(df_greeks, prepared)
         metrics.update(skew_metrics)
         
         # 5. ⭐ NOUVEAU : Term Structure Metrics (RR25 par DTE)
         logger.info("Calculating term structure metrics (RR25 by DTE)...")
-        term_metrics = calculate_term_structure_metrics(df_greeks)
+        term_metrics = calculate_term_structure_metrics(df_greeks, prepared)
         metrics.update(term_metrics)
         
         # Log term structure
@@ -162,7 +175,7 @@ class OptionsDataCollector:
         metrics.update(pc_ratios)
         
         # 7. GEX Distribution
-        df_gex = calculate_gex_distribution(df_greeks, df_oi, spot_price)
+        df_gex = calculate_gex_distribution(df_greeks, df_oi, spot_price, df_merged, exposures)
         if not df_gex.empty:
             call_walls = df_gex[df_gex['is_call_wall']]
             put_walls = df_gex[df_gex['is_put_wall']]
@@ -176,12 +189,7 @@ class OptionsDataCollector:
         for k, v in liquidity.items():
             metrics[f'liquidity_{k}'] = v
         
-        # 9. Realized Volatility
-        start_date_hv = (pd.to_datetime(date) - timedelta(days=300)).strftime('%Y%m%d')
-        df_stock_hist = self.api.fetch('/stock/history/eod', {
-            'symbol': symbol, 'start_date': start_date_hv, 'end_date': date
-        })
-        
+        # 9. Realized Volatility (historique déjà récupéré avec le spot)
         if not df_stock_hist.empty:
             df_hv = calculate_realized_volatility(df_stock_hist, self.settings.HV_WINDOWS)
             if not df_hv.empty:
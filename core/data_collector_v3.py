@@ -4,20 +4,19 @@ Avec historique complet prix + term structure RR25 par DTE.
 """
 import pandas as pd
 import logging
-from typing import List, Dict
-import time
+from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 
 from core.api_wrapper import ThetaDataAPI
 from core.calculations import (
     calculate_net_exposures, calculate_realized_volatility,
     calculate_skew_metrics, calculate_pc_ratios,
-    calculate_gex_distribution, analyze_liquidity
+    calculate_gex_distribution, analyze_liquidity, merge_greeks_oi,
+    compute_exposures, concat_by_expiration, prepare_greeks
 )
 from core.term_structure import calculate_term_structure_metrics as calculate_full_term_structure
 from core.price_history import PriceHistoryManager
-
-logger = logging.getLogger(__name__)
+from utils.logger import get_logger
 
 class OptionsDataCollectorV3:
     """
@@ -27,15 +26,23 @@ class OptionsDataCollectorV3:
     - Surface IV complète
     """
     
-    def __init__(self):
+    def __init__(self, max_rate: Optional[float] = None, max_workers: Optional[int] = None):
         from config import settings
-        self.api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT)
+        # max_rate / max_workers : part du débit et des requêtes simultanées du Terminal
+        # quand plusieurs processus collectent en parallèle
+        self.api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT,
+                               max_workers or settings.FETCH_WORKERS,
+                               max_rate or settings.RATE_LIMIT_PER_SEC)
         self.settings = settings
         
         # Gestionnaire historique
         history_path = settings.PATHS['derived_hv'] / '..' / 'price_history'
         self.price_history = PriceHistoryManager(history_path)
     
+    def close(self):
+        """Libère les connexions HTTP et le pool de l'API."""
+        self.api.close()
+    
     def collect_stock_price_history(self, symbol: str, start_date: str, end_date: str):
         """
         Collecte historique complet des prix stock.
@@ -45,41 +52,70 @@ class OptionsDataCollectorV3:
             start_date: Date début (YYYYMMDD)
             end_date: Date fin (YYYYMMDD)
         """
-        logger.info(f"Collecting stock history: {symbol} from {start_date} to {end_date}")
+        log = get_logger(__name__, symbol)
+        log.info(f"Collecting stock history from {start_date} to {end_date}")
         
-        df_stock = self.api.fetch('/stock/history/eod', {
-            'symbol': symbol,
-            'start_date': start_date,
-            'end_date': end_date
-        })
+        df_stock = self.api.fetch_stock_history(symbol, start_date, end_date)
         
         if df_stock.empty:
-            logger.warning(f"No stock history retrieved for {symbol}")
+            log.warning("No stock history retrieved")
             return pd.DataFrame()
         
         # Sauvegarder
         self.price_history.save_stock_history(symbol, df_stock)
         
-        logger.info(f"Collected {len(df_stock)} days of stock history")
+        log.info(f"Collected {len(df_stock)} days of stock history")
         return df_stock
     
-    def get_active_expirations(self, symbol: str, current_date: str) -> List[str]:
-        """Récupère les expirations actives."""
-        df_exp = self.api.fetch('/option/list/expirations', {'symbol': symbol})
-        
-        if df_exp.empty:
-            logger.warning(f"No expirations found for {symbol}")
+    def get_active_expirations(self, symbol: str, current_date: str,
+                               log: Optional[logging.LoggerAdapter] = None) -> List[str]:
+        """Récupère les expirations actives (log : logger du symbole, créé si absent)."""
+        log = log or get_logger(__name__, symbol)
+        # Mémorisé par (symbol, date) côté API : pas de re-fetch ni de re-parsing
+        exp_list = self.api.fetch_active_expirations(symbol, current_date)
+        
+        if not exp_list:
+            log.warning("No active expirations found")
             return []
         
-        expirations = pd.to_datetime(df_exp['expiration'])
-        active = expirations[expirations >= pd.to_datetime(current_date)]
-        exp_list = active.dt.strftime('%Y%m%d').tolist()
-        logger.info(f"Found {len(exp_list)} active expirations for {symbol}")
+        log.info(f"Found {len(exp_list)} active expirations")
         return exp_list
     
-    def collect_all_expirations_data(self, symbol: str, date: str) -> Dict:
+    def _collect_per_expiration(self, symbol: str, date: str, expirations: List[str]) -> tuple:
+        """Fallback : (prices, greeks, oi) via une requête par expiration et par dataset."""
+        # Prices / Greeks / OI de toutes les expirations, soumis en un seul lot
+        # (le pool de l'API parallélise, le token bucket limite le débit)
+        requests_list = []
+        for exp in expirations:
+            requests_list += [
+                ('/option/history/eod', {
+                    'symbol': symbol, 'expiration': exp,
+                    'start_date': date, 'end_date': date
+                }),
+                ('/option/history/greeks/eod', {
+                    'symbol': symbol, 'expiration': exp,
+                    'start_date': date, 'end_date': date
+                }),
+                ('/option/history/open_interest', {
+                    'symbol': symbol, 'expiration': exp, 'date': date
+                }),
+            ]
+        results = self.api.fetch_many(requests_list)
+        
+        # Parsés une seule fois, puis une concat par dataset et un tag vectorisé
+        exp_dates = pd.DatetimeIndex(pd.to_datetime(pd.Series(expirations, dtype=object)))
+        date_dt = pd.Timestamp(date)
+        df_prices = concat_by_expiration(results[0::3], exp_dates, date_dt)
+        df_greeks = concat_by_expiration(results[1::3], exp_dates, date_dt)
+        df_oi = concat_by_expiration(results[2::3], exp_dates, date_dt)
+        
+        return df_prices, df_greeks, df_oi
+    
+    def collect_all_expirations_data(self, symbol: str, date: str,
+                                     log: Optional[logging.LoggerAdapter] = None) -> Dict:
         """Collecte données pour TOUTES les expirations actives."""
-        expirations = self.get_active_expirations(symbol, date)
+        log = log or get_logger(__name__, symbol)
+        expirations = self.get_active_expirations(symbol, date, log)
         
         if not expirations:
             return {
@@ -89,51 +125,20 @@ class OptionsDataCollectorV3:
                 'expiration_count': 0
             }
         
-        all_prices = []
-        all_greeks = []
-        all_oi = []
-        
-        logger.info(f"Collecting data for {len(expirations)} expirations...")
-        
-        for i, exp in enumerate(expirations, 1):
-            logger.debug(f"Processing expiration {i}/{len(expirations)}: {exp}")
-            
-            # Prices
-            df_prices = self.api.fetch('/option/history/eod', {
-                'symbol': symbol, 'expiration': exp,
-                'start_date': date, 'end_date': date
-            })
-            time.sleep(self.settings.RATE_LIMIT_DELAY)
-            
-            # Greeks
-            df_greeks = self.api.fetch('/option/history/greeks/eod', {
-                'symbol': symbol, 'expiration': exp,
-                'start_date': date, 'end_date': date
-            })
-            time.sleep(self.settings.RATE_LIMIT_DELAY)
-            
-            # OI
-            df_oi = self.api.fetch('/option/history/open_interest', {
-                'symbol': symbol, 'expiration': exp, 'date': date
-            })
-            time.sleep(self.settings.RATE_LIMIT_DELAY)
-            
-            # Ajouter DTE
+        log.info(f"Collecting data for {len(expirations)} expirations...")
+        
+        # expiration='*' : 3 requêtes au total quand l'API le supporte
+        bulk = self.api.fetch_all_expirations(symbol, date, expirations)
+        if bulk is not None:
+            df_prices, df_greeks, df_oi = bulk
+            date_ts = pd.Timestamp(date)
             for df in [df_prices, df_greeks, df_oi]:
                 if not df.empty:
-                    df['expiration'] = pd.to_datetime(exp)
-                    df['date'] = pd.to_datetime(date)
-                    df['dte'] = (pd.to_datetime(exp) - pd.to_datetime(date)).days
-            
-            all_prices.append(df_prices)
-            all_greeks.append(df_greeks)
-            all_oi.append(df_oi)
-        
-        df_prices = pd.concat(all_prices, ignore_index=True) if all_prices else pd.DataFrame()
-        df_greeks = pd.concat(all_greeks, ignore_index=True) if all_greeks else pd.DataFrame()
-        df_oi = pd.concat(all_oi, ignore_index=True) if all_oi else pd.DataFrame()
+                    df['date'] = date_ts
+        else:
+            df_prices, df_greeks, df_oi = self._collect_per_expiration(symbol, date, expirations)
         
-        logger.info(f"Collected {len(df_prices)} price rows, {len(df_greeks)} greeks rows, {len(df_oi)} OI rows")
+        log.info(f"Collected {len(df_prices)} price rows, {len(df_greeks)} greeks rows, {len(df_oi)} OI rows")
         
         return {
             'all_prices': df_prices, 
@@ -142,12 +147,17 @@ class OptionsDataCollectorV3:
             'expiration_count': len(expirations)
         }
     
-    def calculate_daily_metrics(self, symbol: str, date: str) -> tuple:
+    def calculate_daily_metrics(self, symbol: str, date: str,
+                                log: Optional[logging.LoggerAdapter] = None) -> tuple:
         """
         Calcule métriques complètes pour une date.
         VERSION 3 avec term structure RR25 par DTE.
+        
+        log : logger portant le symbole en contexte (get_logger), créé si absent ;
+        les lignes de processus parallèles restent attribuables au symbole.
         """
-        logger.info(f"=== CALCULATING DAILY METRICS V3: {symbol} {date} ===")
+        log = log or get_logger(__name__, symbol)
+        log.info(f"=== CALCULATING DAILY METRICS V3: {date} ===")
         
         metrics = {
             'symbol': symbol, 
@@ -155,13 +165,12 @@ class OptionsDataCollectorV3:
             'timestamp': datetime.now().isoformat()
         }
         
-        # 1. Spot price
-        df_spot = self.api.fetch('/stock/history/eod', {
-            'symbol': symbol, 'start_date': date, 'end_date': date
-        })
+        # 1. Spot price (+ fenêtre HV de l'étape 9, même requête)
+        start_date_hv = (pd.to_datetime(date) - timedelta(days=300)).strftime('%Y%m%d')
+        df_spot, df_stock_hist = self.api.fetch_spot_with_history(symbol, date, start_date_hv)
         
         if df_spot.empty:
-            logger.error(f"No spot price for {symbol} on {date}")
+            log.error(f"No spot price on {date}")
             return metrics, {}
         
         spot_price = float(df_spot['close'].iloc[0])
@@ -171,54 +180,57 @@ class OptionsDataCollectorV3:
         metrics['spot_low'] = float(df_spot['low'].iloc[0])
         metrics['spot_volume'] = int(df_spot['volume'].iloc[0])
         
-        logger.info(f"Spot price: ${spot_price:.2f}")
+        log.info(f"Spot price: ${spot_price:.2f}")
         
         # Sauvegarder prix dans historique
         self.price_history.save_stock_history(symbol, df_spot)
         
         # 2. Core data (toutes expirations)
-        core_data = self.collect_all_expirations_data(symbol, date)
+        core_data = self.collect_all_expirations_data(symbol, date, log)
         df_prices = core_data['all_prices']
         df_greeks = core_data['all_greeks']
         df_oi = core_data['all_oi']
         metrics['expiration_count'] = core_data['expiration_count']
         
         if df_greeks.empty or df_oi.empty:
-            logger.warning("Insufficient data for calculations")
+            log.warning("Insufficient data for calculations")
             return metrics, {}
         
         # 3. Net Delta & Gamma
-        net_exposures = calculate_net_exposures(df_greeks, df_oi, spot_price)
+        # Jointure greeks ↔ OI partagée par net exposures et GEX
+        df_merged = merge_greeks_oi(df_greeks, df_oi)
+        exposures = compute_exposures(df_merged, spot_price) if df_merged is not None else None
+        
+        net_exposures = calculate_net_exposures(df_greeks, df_oi, spot_price, df_merged, exposures)
         metrics.update(net_exposures)
-        logger.info(f"Net Gamma: ${net_exposures['net_gamma']/1e9:.2f}B")
+        log.info(f"Net Gamma: ${net_exposures['net_gamma']/1e9:.2f}B")
         
         # 4. Skew global (toutes expirations mélangées)
-        skew_metrics = calculate_skew_metrics(df_greeks)
+        # Tableaux type/delta/IV partagés par skew global et term structure
+        prepared = prepare_greeks(df_greeks)
+        skew_metrics = calculate_skew_metrics(df_greeks, prepared)
         metrics.update(skew_metrics)
         
         # 5. ⭐ NOUVEAU : Term Structure (RR25 par DTE)
-        logger.info("Calculating term structure (RR25 by DTE)...")
-        term_structure = calculate_full_term_structure(df_greeks)
+        log.info("Calculating term structure (RR25 by DTE)...")
+        term_structure = calculate_full_term_structure(df_greeks, prepared)
         metrics.update(term_structure)
         
         # Log term structure
         for dte in [0, 7, 30, 60]:
             rr25_key = f'ts_{dte}dte_rr25'
             if rr25_key in term_structure:
-                logger.info(f"RR25 {dte}DTE: {term_structure.get(rr25_key, 'N/A')}")
+                log.info(f"RR25 {dte}DTE: {term_structure.get(rr25_key, 'N/A')}")
         
         # Sauvegarder term structure dans historique
-        ts_row = {'date': pd.to_datetime(date)}
-        ts_row.update(term_structure)
-        df_ts = pd.DataFrame([ts_row])
-        self.price_history.save_term_structure_history(symbol, df_ts)
+        self.price_history.save_term_structure_row(symbol, date, term_structure)
         
         # 6. Put/Call Ratios
         pc_ratios = calculate_pc_ratios(df_prices, df_greeks, df_oi)
         metrics.update(pc_ratios)
         
         # 7. GEX Distribution
-        df_gex = calculate_gex_distribution(df_greeks, df_oi, spot_price)
+        df_gex = calculate_gex_distribution(df_greeks, df_oi, spot_price, df_merged, exposures)
         if not df_gex.empty:
             call_walls = df_gex[df_gex['is_call_wall']]
             put_walls = df_gex[df_gex['is_put_wall']]
@@ -232,12 +244,7 @@ class OptionsDataCollectorV3:
         for k, v in liquidity.items():
             metrics[f'liquidity_{k}'] = v
         
-        # 9. Realized Volatility
-        start_date_hv = (pd.to_datetime(date) - timedelta(days=300)).strftime('%Y%m%d')
-        df_stock_hist = self.api.fetch('/stock/history/eod', {
-            'symbol': symbol, 'start_date': start_date_hv, 'end_date': date
-        })
-        
+        # 9. Realized Volatility (historique déjà récupéré avec le spot)
         if not df_stock_hist.empty:
             df_hv = calculate_realized_volatility(df_stock_hist, self.settings.HV_WINDOWS)
             if not df_hv.empty:
@@ -252,7 +259,7 @@ class OptionsDataCollectorV3:
             if pd.notna(metrics['iv_atm']) and pd.notna(metrics['hv_20d']):
                 metrics['iv_hv_spread'] = metrics['iv_atm'] - metrics['hv_20d']
         
-        logger.info("=== DAILY METRICS V3 COMPLETED ===")
+        log.info("=== DAILY METRICS V3 COMPLETED ===")
         
         return metrics, {
             'gex_distribution': df_gex, 
@@ -3,13 +3,42 @@ Module de collecte et stockage d'historique des prix.
 Gère prix stock et historique complet RR25 par DTE.
 """
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import logging
+import time
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+from storage.manager import PARQUET_OPTIONS, WRITE_OPTIONS
+
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=256)
+def _to_timestamp(value: str) -> pd.Timestamp:
+    """Borne de date parsée une fois (les mêmes bornes reviennent à chaque chargement)."""
+    return pd.Timestamp(value)
+
+def _date_filters(start_date: Optional[str], end_date: Optional[str]) -> Optional[list]:
+    """Prédicats pyarrow sur 'date' : seuls les row groups de la plage sont lus."""
+    filters = []
+    if start_date:
+        filters.append(('date', '>=', _to_timestamp(start_date).to_pydatetime()))
+    if end_date:
+        filters.append(('date', '<=', _to_timestamp(end_date).to_pydatetime()))
+    return filters or None
+
+def _read_parquet(filepath: Path, filters: Optional[list]) -> pd.DataFrame:
+    """Lecture avec predicate pushdown, sinon lecture complète (colonne 'date' absente ou non datetime)."""
+    if filters:
+        try:
+            return pd.read_parquet(filepath, engine='pyarrow', filters=filters)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            pass
+    return pd.read_parquet(filepath, engine='pyarrow')
+
 class PriceHistoryManager:
     """Gestionnaire d'historique des prix."""
     
@@ -17,10 +46,86 @@ class PriceHistoryManager:
         self.storage_path = storage_path
         self.storage_path.mkdir(parents=True, exist_ok=True)
     
+    def _history_file(self, symbol: str, kind: str) -> Path:
+        """Fichier consolidé d'un historique ('stock_history' ou 'term_structure_history')."""
+        return self.storage_path / f"{symbol}_{kind}.parquet"
+    
+    def _parts_dir(self, symbol: str, kind: str) -> Path:
+        """Répertoire des parts pas encore fusionnées dans le fichier consolidé."""
+        return self.storage_path / f"{symbol}_{kind}_parts"
+    
+    def _append_history(self, symbol: str, kind: str, df: pd.DataFrame) -> Path:
+        """
+        Ajoute des lignes à un historique sans relire ni réécrire l'existant.
+        
+        Premier enregistrement : écrit directement le fichier consolidé.
+        Ensuite : une part par appel (O(lignes ajoutées)), fusionnée par compact_history().
+        """
+        filepath = self._next_history_path(symbol, kind)
+        if filepath == self._history_file(symbol, kind):
+            df = df.sort_values('date') if 'date' in df.columns else df
+        df.to_parquet(filepath, index=False, **PARQUET_OPTIONS)
+        return filepath
+    
+    def _next_history_path(self, symbol: str, kind: str) -> Path:
+        """Fichier consolidé s'il n'existe pas encore, sinon une nouvelle part."""
+        filepath = self._history_file(symbol, kind)
+        if not filepath.exists():
+            return filepath
+        
+        parts_dir = self._parts_dir(symbol, kind)
+        parts_dir.mkdir(parents=True, exist_ok=True)
+        return parts_dir / f"part_{time.time_ns()}.parquet"
+    
+    def _read_history(self, symbol: str, kind: str, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None) -> pd.DataFrame:
+        """
+        Lit le fichier consolidé + les parts (la première ligne écrite gagne par date),
+        restreints à [start_date, end_date] dès la lecture parquet.
+        """
+        filepath = self._history_file(symbol, kind)
+        parts_dir = self._parts_dir(symbol, kind)
+        parts = sorted(parts_dir.glob('*.parquet')) if parts_dir.exists() else []
+        filters = _date_filters(start_date, end_date)
+        
+        frames = [_read_parquet(filepath, filters)] if filepath.exists() else []
+        if not parts:
+            return frames[0] if frames else pd.DataFrame()
+        
+        frames += [_read_parquet(part, filters) for part in parts]
+        # Index d'origine conservé par la concat : un seul renumérotage, au tri final
+        df = pd.concat(frames)
+        df = df.drop_duplicates(subset=['date'])
+        return df.sort_values('date', ignore_index=True)
+    
+    def compact_history(self, symbol: str, min_parts: int = 1):
+        """
+        Fusionne les parts en attente dans les fichiers consolidés (une réécriture par historique).
+        
+        min_parts : parts en attente à partir desquelles un historique est réécrit
+        (job quotidien : settings.COMPACT_MIN_PARTS ; backfills / sauvegardes
+        ponctuelles : défaut 1). Entre deux fusions, _read_history intègre les parts.
+        """
+        for kind in ('stock_history', 'term_structure_history'):
+            parts_dir = self._parts_dir(symbol, kind)
+            parts = sorted(parts_dir.glob('*.parquet')) if parts_dir.exists() else []
+            if not parts or len(parts) < min_parts:
+                continue
+            
+            filepath = self._history_file(symbol, kind)
+            self._read_history(symbol, kind).to_parquet(filepath, index=False, **PARQUET_OPTIONS)
+            for part in parts:
+                part.unlink()
+            
+            logger.info(f"Compacted {len(parts)} {kind} parts into {filepath}")
+    
     def save_stock_history(self, symbol: str, df_stock: pd.DataFrame):
         """
         Sauvegarde l'historique complet des prix stock.
         
+        Append-only : les dates déjà présentes sont conservées (dédoublonnage
+        à la lecture et à la compaction).
+        
         Args:
             symbol: Ticker (ex: SPY)
             df_stock: DataFrame avec colonnes [date, open, high, low, close, volume]
@@ -28,18 +133,7 @@ class PriceHistoryManager:
         if df_stock.empty:
             return
         
-        filepath = self.storage_path / f"{symbol}_stock_history.parquet"
-        
-        # Si existe, merger avec ancien
-        if filepath.exists():
-            df_existing = pd.read_parquet(filepath)
-            df_combined = pd.concat([df_existing, df_stock], ignore_index=True)
-            df_combined = df_combined.drop_duplicates(subset=['date'])
-            df_combined = df_combined.sort_values('date')
-            df_combined.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
-        else:
-            df_stock.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
-        
+        filepath = self._append_history(symbol, 'stock_history', df_stock)
         logger.info(f"Saved stock history: {len(df_stock)} rows to {filepath}")
     
     def load_stock_history(self, symbol: str, start_date: Optional[str] = None, 
@@ -55,24 +149,23 @@ class PriceHistoryManager:
         Returns:
             DataFrame avec historique
         """
-        filepath = self.storage_path / f"{symbol}_stock_history.parquet"
+        df = self._read_history(symbol, 'stock_history', start_date, end_date)
         
-        if not filepath.exists():
-            logger.warning(f"Stock history not found: {filepath}")
+        if df.empty:
+            logger.warning(f"Stock history not found: {self._history_file(symbol, 'stock_history')}")
             return pd.DataFrame()
         
-        df = pd.read_parquet(filepath)
-        
+        # Filtre pandas conservé pour les fichiers lus sans pushdown
         if start_date:
-            df = df[df['date'] >= pd.to_datetime(start_date)]
+            df = df[df['date'] >= _to_timestamp(start_date)]
         if end_date:
-            df = df[df['date'] <= pd.to_datetime(end_date)]
+            df = df[df['date'] <= _to_timestamp(end_date)]
         
         return df
     
     def save_term_structure_history(self, symbol: str, df_ts: pd.DataFrame):
         """
-        Sauvegarde l'historique complet de la term structure.
+        Sauvegarde l'historique complet de la term structure (append-only).
         
         Args:
             symbol: Ticker
@@ -82,35 +175,41 @@ class PriceHistoryManager:
         if df_ts.empty:
             return
         
-        filepath = self.storage_path / f"{symbol}_term_structure_history.parquet"
+        filepath = self._append_history(symbol, 'term_structure_history', df_ts)
+        logger.info(f"Saved term structure history: {len(df_ts)} rows to {filepath}")
+    
+    def save_term_structure_row(self, symbol: str, date: str, term_structure: Dict):
+        """
+        Ajoute la term structure d'un jour, écrite directement en table Arrow.
         
-        # Si existe, merger
-        if filepath.exists():
-            df_existing = pd.read_parquet(filepath)
-            df_combined = pd.concat([df_existing, df_ts], ignore_index=True)
-            df_combined = df_combined.drop_duplicates(subset=['date'])
-            df_combined = df_combined.sort_values('date')
-            df_combined.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
-        else:
-            df_ts.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
+        Évite le DataFrame d'une ligne (inférence de types, block manager)
+        pour la sauvegarde quotidienne.
         
-        logger.info(f"Saved term structure history: {len(df_ts)} rows to {filepath}")
+        Args:
+            symbol: Ticker
+            date: Date de collecte (YYYYMMDD)
+            term_structure: Métriques term structure du jour
+        """
+        table = pa.Table.from_pylist([{'date': _to_timestamp(date), **term_structure}])
+        filepath = self._next_history_path(symbol, 'term_structure_history')
+        pq.write_table(table, filepath, **WRITE_OPTIONS)
+        logger.info(f"Saved term structure history: 1 rows to {filepath}")
     
     def load_term_structure_history(self, symbol: str, start_date: Optional[str] = None,
                                     end_date: Optional[str] = None) -> pd.DataFrame:
         """Charge l'historique term structure."""
-        filepath = self.storage_path / f"{symbol}_term_structure_history.parquet"
+        df = self._read_history(symbol, 'term_structure_history', start_date, end_date)
         
-        if not filepath.exists():
-            logger.warning(f"Term structure history not found: {filepath}")
+        if df.empty:
+            logger.warning(f"Term structure history not found: "
+                           f"{self._history_file(symbol, 'term_structure_history')}")
             return pd.DataFrame()
         
-        df = pd.read_parquet(filepath)
-        
+        # Filtre pandas conservé pour les fichiers lus sans pushdown
         if start_date:
-            df = df[df['date'] >= pd.to_datetime(start_date)]
+            df = df[df['date'] >= _to_timestamp(start_date)]
         if end_date:
-            df = df[df['date'] <= pd.to_datetime(end_date)]
+            df = df[df['date'] <= _to_timestamp(end_date)]
         
         return df
     
@@ -183,16 +282,19 @@ def create_historical_summary(df_stock: pd.DataFrame, df_ts: pd.DataFrame) -> Di
         }
     
     if not df_ts.empty:
-        # Stats RR25 par DTE
-        for dte in [0, 7, 30, 60]:
-            col = f'ts_{dte}dte_rr25'
-            if col in df_ts.columns:
+        # Stats RR25 par DTE : une seule agrégation pour toutes les colonnes
+        cols = {dte: f'ts_{dte}dte_rr25' for dte in [0, 7, 30, 60] if f'ts_{dte}dte_rr25' in df_ts.columns}
+        if cols:
+            stats = df_ts[list(cols.values())].agg(['mean', 'std', 'min', 'max', 'count'])
+            n = len(df_ts)
+            for dte, col in cols.items():
+                s = stats[col]
                 summary[f'rr25_{dte}dte'] = {
-                    'mean': df_ts[col].mean(),
-                    'std': df_ts[col].std(),
-                    'min': df_ts[col].min(),
-                    'max': df_ts[col].max(),
-                    'completeness': (1 - df_ts[col].isna().sum() / len(df_ts)) * 100
+                    'mean': s['mean'],
+                    'std': s['std'],
+                    'min': s['min'],
+                    'max': s['max'],
+                    'completeness': s['count'] / n * 100
                 }
     
     return summary
@@ -11,8 +11,10 @@ VERSION COMPLÈTE avec :
 import pandas as pd
 import numpy as np
 import logging
-from typing import Dict, List
-from scipy.interpolate import interp1d
+from typing import Dict, List, Optional
+
+from core.calculations import (parse_dates, prepare_greeks, right_masks,
+                               sorted_delta_iv, interp_sorted_iv)
 
 logger = logging.getLogger(__name__)
 
@@ -31,31 +33,27 @@ def find_nearest_expiration(df_greeks: pd.DataFrame, target_dte: int, tolerance:
     if df_greeks.empty or 'dte' not in df_greeks.columns:
         return pd.DataFrame()
     
-    # Trouver expirations dans la fenêtre de tolérance
-    df_filtered = df_greeks[
-        (df_greeks['dte'] >= target_dte - tolerance) &
-        (df_greeks['dte'] <= target_dte + tolerance)
-    ]
+    # Écart au DTE cible, hors fenêtre de tolérance exclu (ni copie ni colonne temporaire)
+    dte_diff = np.abs(df_greeks['dte'].to_numpy(dtype=float) - target_dte)
+    in_window = dte_diff <= tolerance
     
-    if df_filtered.empty:
+    if not in_window.any():
         return pd.DataFrame()
     
-    # Prendre l'expiration la plus proche du target
-    df_filtered = df_filtered.copy()
-    df_filtered['dte_diff'] = (df_filtered['dte'] - target_dte).abs()
-    
-    # Grouper par expiration et prendre la plus proche
-    closest_exp = df_filtered.loc[df_filtered['dte_diff'].idxmin(), 'expiration']
+    # Première ligne au plus proche du target, comme idxmin
+    closest_exp = df_greeks['expiration'].iloc[np.argmin(np.where(in_window, dte_diff, np.inf))]
     
     return df_greeks[df_greeks['expiration'] == closest_exp]
 
-def calculate_rr25_by_dte(df_greeks: pd.DataFrame, target_dtes: list = [0, 7, 30, 60]) -> dict:
+def calculate_rr25_by_dte(df_greeks: pd.DataFrame, target_dtes: list = [0, 7, 30, 60],
+                          prepared: Optional[dict] = None) -> dict:
     """
     Calcule RR25 (Risk Reversal 25-delta) pour chaque maturité spécifique.
     
     Args:
         df_greeks: DataFrame avec toutes les expirations
         target_dtes: Liste des DTEs cibles [0, 7, 30, 60]
+        prepared: prepare_greeks(df_greeks) déjà calculé (skew global), sinon recalculé
     
     Returns:
         {
@@ -87,8 +85,9 @@ def calculate_rr25_by_dte(df_greeks: pd.DataFrame, target_dtes: list = [0, 7, 30
     if 'dte' not in df_greeks.columns:
         # Calculer DTE si manquant
         if 'expiration' in df_greeks.columns and 'date' in df_greeks.columns:
-            df_greeks['dte'] = (pd.to_datetime(df_greeks['expiration']) - 
-                               pd.to_datetime(df_greeks['date'])).dt.days
+            # Colonnes déjà datetime64 (concat_by_expiration) : pas de re-parsing
+            df_greeks['dte'] = (parse_dates(df_greeks['expiration']) -
+                               parse_dates(df_greeks['date'])).dt.days
         else:
             # Impossible de calculer
             for dte in target_dtes:
@@ -97,7 +96,24 @@ def calculate_rr25_by_dte(df_greeks: pd.DataFrame, target_dtes: list = [0, 7, 30
                 metrics[f'actual_dte_{dte}'] = None
             return metrics
     
-    # Calculer pour chaque DTE cible
+    if prepared is None:
+        prepared = prepare_greeks(df_greeks)
+    if prepared is None:
+        for dte in target_dtes:
+            metrics[f'rr25_{dte}dte'] = np.nan
+            metrics[f'iv_atm_{dte}dte'] = np.nan
+            metrics[f'actual_dte_{dte}'] = None
+        return metrics
+    
+    # Une seule passe sur le frame : codes d'expiration, DTE et masque qualité
+    # partagés par tous les DTE cibles (au lieu de re-filtrer par cible)
+    exp_codes, _ = pd.factorize(df_greeks['expiration'])
+    dtes = df_greeks['dte'].to_numpy(dtype=float)
+    clean = prepared['quality'] & (
+        (df_greeks['volume'] > 0) &
+        (df_greeks['bid'] > 0)
+    ).to_numpy()
+    
     for target_dte in target_dtes:
         # Tolérance adaptative
         if target_dte == 0:
@@ -107,35 +123,40 @@ def calculate_rr25_by_dte(df_greeks: pd.DataFrame, target_dtes: list = [0, 7, 30
         else:
             tolerance = 5  # ±5 jours pour 30DTE et 60DTE
         
-        # Filtrer sur expiration proche
-        df_dte = find_nearest_expiration(df_greeks, target_dte, tolerance)
+        # Expiration la plus proche dans la fenêtre (première ligne à écart minimal)
+        in_window = (dtes >= target_dte - tolerance) & (dtes <= target_dte + tolerance)
+        code = -1
+        if in_window.any():
+            diffs = np.where(in_window, np.abs(dtes - target_dte), np.inf)
+            code = exp_codes[diffs.argmin()]
         
-        if df_dte.empty:
+        if code < 0:
             metrics[f'rr25_{target_dte}dte'] = np.nan
             metrics[f'iv_atm_{target_dte}dte'] = np.nan
             metrics[f'actual_dte_{target_dte}'] = None
             continue
         
+        in_exp = exp_codes == code
+        
         # DTE réel utilisé
-        actual_dte = int(df_dte['dte'].iloc[0])
+        actual_dte = int(dtes[in_exp.argmax()])
         metrics[f'actual_dte_{target_dte}'] = actual_dte
         
-        # Filtrer qualité
-        df_clean = df_dte[
-            (df_dte['iv_pct'] > 0) &
-            (df_dte['delta'].notna()) &
-            (df_dte['volume'] > 0) &
-            (df_dte['bid'] > 0)
-        ].copy()
+        # Filtrer qualité (masque précalculé, sans sous-frame)
+        rows = in_exp & clean
         
-        if df_clean.empty:
+        if not rows.any():
             metrics[f'rr25_{target_dte}dte'] = np.nan
             metrics[f'iv_atm_{target_dte}dte'] = np.nan
             continue
         
+        # |delta| / IV triés une fois par type, réutilisés pour 25-delta et ATM
+        put_delta, put_iv = sorted_delta_iv(prepared, 'PUT', rows)
+        call_delta, call_iv = sorted_delta_iv(prepared, 'CALL', rows)
+        
         # Calculer IV 25-delta pour Calls et Puts
-        iv_25d_put = interpolate_iv_at_delta_local(df_clean, 0.25, 'PUT')
-        iv_25d_call = interpolate_iv_at_delta_local(df_clean, 0.25, 'CALL')
+        iv_25d_put = interp_sorted_iv(put_delta, put_iv, 0.25)
+        iv_25d_call = interp_sorted_iv(call_delta, call_iv, 0.25)
         
         # RR25 = IV Put - IV Call
         if np.isfinite(iv_25d_put) and np.isfinite(iv_25d_call):
@@ -144,46 +165,31 @@ def calculate_rr25_by_dte(df_greeks: pd.DataFrame, target_dtes: list = [0, 7, 30
             metrics[f'rr25_{target_dte}dte'] = np.nan
         
         # Bonus: IV ATM pour cette maturité
-        iv_atm_call = interpolate_iv_at_delta_local(df_clean, 0.50, 'CALL')
-        iv_atm_put = interpolate_iv_at_delta_local(df_clean, 0.50, 'PUT')
+        iv_atm_call = interp_sorted_iv(call_delta, call_iv, 0.50)
+        iv_atm_put = interp_sorted_iv(put_delta, put_iv, 0.50)
         metrics[f'iv_atm_{target_dte}dte'] = np.nanmean([iv_atm_call, iv_atm_put])
     
     return metrics
 
 def interpolate_iv_at_delta_local(df: pd.DataFrame, target_delta: float, option_type: str) -> float:
     """
-    Version locale de interpolate_iv_at_delta (évite import circulaire).
-    Interpole IV à un delta spécifique.
+    Interpole IV à un delta spécifique sur toutes les lignes du type (delta renseigné),
+    sans le filtre qualité (IV > 0, volume) de calculations.interpolate_iv_at_delta.
     """
-    df_filtered = df[df['right'] == option_type].copy()
-    
-    if df_filtered.empty:
-        return np.nan
-    
-    df_filtered['abs_delta'] = df_filtered['delta'].abs()
-    df_filtered = df_filtered.sort_values('abs_delta')
-    
-    min_d = df_filtered['abs_delta'].min()
-    max_d = df_filtered['abs_delta'].max()
-    
-    if min_d > target_delta or max_d < target_delta:
-        return np.nan
-    
-    try:
-        f = interp1d(
-            df_filtered['abs_delta'],
-            df_filtered['iv_pct'],
-            kind='linear',
-            bounds_error=True
-        )
-        return float(f(target_delta))
-    except:
+    if df.empty:
         return np.nan
+    is_call, is_put = right_masks(df['right'])
+    delta = df['delta'].to_numpy(dtype=float)
+    rows = {'is_call': is_call, 'is_put': is_put, 'delta': delta,
+            'iv': df['iv_pct'].to_numpy(dtype=float), 'quality': ~np.isnan(delta)}
+    return interp_sorted_iv(*sorted_delta_iv(rows, option_type), target_delta)
 
-def calculate_term_structure_metrics(df_greeks: pd.DataFrame) -> dict:
+def calculate_term_structure_metrics(df_greeks: pd.DataFrame, prepared: Optional[dict] = None) -> dict:
     """
     Calcule TOUTES les métriques de term structure en un seul appel.
     
+    prepared : prepare_greeks(df_greeks) partagé avec calculate_skew_metrics.
+    
     Returns:
         {
             # RR25 par maturité
@@ -210,7 +216,7 @@ def calculate_term_structure_metrics(df_greeks: pd.DataFrame) -> dict:
         }
     """
     # Calculer RR25 et IV par DTE
-    metrics = calculate_rr25_by_dte(df_greeks, [0, 7, 30, 60])
+    metrics = calculate_rr25_by_dte(df_greeks, [0, 7, 30, 60], prepared)
     
     # Calculer spreads (dérivées de term structure)
     if (np.isfinite(metrics.get('rr25_60dte', np.nan)) and 
@@ -3,6 +3,7 @@ Script pratique pour visualiser le skew de volatilité.
 Usage: python generate_skew_plots.py
 """
 import sys
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -15,13 +16,22 @@ except:
     from config import settings
 
 from core.api_wrapper import ThetaDataAPI
-from storage.manager import StorageManager
+from core.calculations import concat_by_expiration
+from storage.manager import FLOAT32_COLUMNS, StorageManager, downcast_floats
 from visualization.volatility_skew import VolatilitySkewVisualizer
 
+# Colonnes lues par VolatilitySkewVisualizer et main()
+SKEW_COLUMNS = ['strike', 'right', 'delta', 'iv_pct', 'volume', 'bid', 'expiration', 'date', 'dte']
+
+# Float32 pour les graphiques : strike et volume en plus (jamais réutilisés comme clés ici)
+PLOT_FLOAT32_COLUMNS = FLOAT32_COLUMNS + ('strike', 'volume')
+
 def collect_fresh_data(symbol: str, date: str = None):
     """Collecte données fraîches via API."""
     
-    api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT)
+    api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT,
+                       settings.FETCH_WORKERS, settings.RATE_LIMIT_PER_SEC,
+                       cache_dir=settings.API_CACHE_DIR)
     
     if date is None:
         date = (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
@@ -43,8 +53,8 @@ def collect_fresh_data(symbol: str, date: str = None):
     spot_price = float(df_spot['close'].iloc[0])
     print(f"  Spot: ${spot_price:.2f}")
     
-    # Expirations
-    df_exp = api.fetch('/option/list/expirations', {'symbol': symbol})
+    # Expirations (cache disque du jour : pas de requête lors d'une régénération)
+    df_exp = api.fetch_expirations(symbol)
     
     if df_exp.empty:
         print("❌ No expirations found")
@@ -53,41 +63,42 @@ def collect_fresh_data(symbol: str, date: str = None):
     expirations = df_exp['expiration'].head(15).tolist()
     print(f"  Expirations: {len(expirations)}")
     
-    # Collecter Greeks
-    all_greeks = []
-    
-    for i, exp in enumerate(expirations, 1):
-        print(f"  [{i}/{len(expirations)}] {exp}...", end=" ", flush=True)
-        
-        df_greeks = api.fetch('/option/history/greeks/eod', {
+    # Collecter Greeks : toutes les expirations en un lot (pool de l'API + token bucket)
+    date_dt = pd.Timestamp(date)
+    results = api.fetch_many([
+        ('/option/history/greeks/eod', {
             'symbol': symbol,
             'expiration': exp,
             'start_date': date,
             'end_date': date
         })
-        
-        if not df_greeks.empty:
-            df_greeks['expiration'] = pd.to_datetime(exp)
-            df_greeks['date'] = pd.to_datetime(date)
-            df_greeks['dte'] = (pd.to_datetime(exp) - pd.to_datetime(date)).days
-            all_greeks.append(df_greeks)
-            print(f"✓ {len(df_greeks)}")
-        else:
-            print("✗")
-    
-    if not all_greeks:
+        for exp in expirations
+    ])
+    api.close()
+    
+    for i, (exp, df_greeks) in enumerate(zip(expirations, results), 1):
+        status = f"✓ {len(df_greeks)}" if not df_greeks.empty else "✗"
+        print(f"  [{i}/{len(expirations)}] {exp}... {status}")
+    
+    # Expiration / date / dte posés en une passe après la concat
+    exp_dates = pd.DatetimeIndex([pd.Timestamp(exp) for exp in expirations])
+    df_greeks = concat_by_expiration(results, exp_dates, date_dt)
+    
+    if df_greeks.empty:
         print("❌ No Greeks data collected")
         return None, None
     
-    df_greeks = pd.concat(all_greeks, ignore_index=True)
+    # Greeks en float32 : working set divisé par deux pour le filtrage et les graphiques
+    if settings.DOWNCAST_FLOAT32:
+        df_greeks = downcast_floats(df_greeks)
     
-    # Filtrage qualité
-    df_greeks = df_greeks[
-        (df_greeks['iv_pct'] > 0) &
-        (df_greeks['delta'].notna()) &
-        (df_greeks['volume'] > 0) &
-        (df_greeks['bid'] > 0)
-    ].copy()
+    # Filtrage qualité : un seul masque NumPy combiné en place
+    # (copy-on-write pandas 3 : le sous-frame n'a pas besoin de .copy())
+    mask = df_greeks['iv_pct'].to_numpy(dtype=float) > 0
+    mask &= df_greeks['volume'].to_numpy(dtype=float) > 0
+    mask &= df_greeks['bid'].to_numpy(dtype=float) > 0
+    mask &= ~np.isnan(df_greeks['delta'].to_numpy(dtype=float))
+    df_greeks = df_greeks[mask]
     
     print(f"\n✓ Total contracts: {len(df_greeks)}")
     print(f"  DTE range: {df_greeks['dte'].min()}-{df_greeks['dte'].max()} days")
@@ -102,7 +113,7 @@ def load_from_storage(symbol: str):
     print(f"\n📦 Loading data from warehouse...")
     
     # Charger master daily
-    df_master = storage.load_master_daily(symbol)
+    df_master = storage.load_master_daily(symbol, columns=['spot_price'])
     
     if df_master.empty:
         print("❌ No master data found")
@@ -118,28 +129,14 @@ def load_from_storage(symbol: str):
     # Charger core Greeks
     date_str = last_date.strftime('%Y%m%d')
     
-    # Chercher fichiers Greeks
-    greeks_path = settings.PATHS['core_greeks'] / symbol / str(last_date.year) / f"{last_date.month:02d}"
-    
-    if not greeks_path.exists():
-        print(f"❌ Greeks path not found: {greeks_path}")
-        return None, None
-    
-    # Charger tous les Greeks de cette date
-    greeks_files = list(greeks_path.glob(f"*{date_str}*.parquet"))
+    # Seules les colonnes utilisées par les graphiques sont lues
+    df_greeks = storage.load_core_greeks(symbol, date_str, columns=SKEW_COLUMNS)
     
-    if not greeks_files:
+    if df_greeks.empty:
         print("❌ No Greeks files found")
         return None, None
     
-    all_greeks = []
-    for file in greeks_files:
-        df = pd.read_parquet(file)
-        all_greeks.append(df)
-    
-    df_greeks = pd.concat(all_greeks, ignore_index=True)
-    
-    print(f"✓ Loaded {len(df_greeks)} contracts from {len(greeks_files)} files")
+    print(f"✓ Loaded {len(df_greeks)} contracts")
     
     return df_greeks, spot_price
 
@@ -177,6 +174,10 @@ def main():
         print("\n❌ Failed to load data")
         return
     
+    # Une seule conversion pour toutes les méthodes de tracé (les deux sources)
+    if settings.DOWNCAST_FLOAT32:
+        df_greeks = downcast_floats(df_greeks, PLOT_FLOAT32_COLUMNS)
+    
     # Créer output directory
     output_dir = Path('skew_plots')
     output_dir.mkdir(exist_ok=True)
@@ -200,35 +201,38 @@ def main():
     if exp_choice:
         selected_exp = expirations[int(exp_choice) - 1]
     else:
-        # Trouver expiration proche de 30 DTE
-        df_greeks['dte_diff'] = (df_greeks['dte'] - 30).abs()
-        selected_exp = df_greeks.loc[df_greeks['dte_diff'].idxmin(), 'expiration']
+        # Trouver expiration proche de 30 DTE (une ligne par expiration, pas de colonne temporaire)
+        dte_by_exp = df_greeks.drop_duplicates('expiration').set_index('expiration')['dte']
+        selected_exp = (dte_by_exp - 30).abs().idxmin()
     
     exp_str = selected_exp.strftime('%Y%m%d')
     
     print(f"\n📈 Generating plots...")
     
+    # Vue filtrée une seule fois pour les graphiques mono-expiration
+    df_sel = df_greeks[df_greeks['expiration'] == selected_exp]
+    
     # 1. Skew by Strike
     print("  1/6 Skew by Strike...")
     viz.plot_skew_by_strike(
-        df_greeks, spot_price, 
-        expiration_filter=exp_str,
+        df_sel, spot_price, 
+        expiration_filter=exp_str, already_filtered=True,
         save_path=output_dir / f"{symbol}_skew_strike_{exp_str}.png"
     )
     
     # 2. Skew by Delta
     print("  2/6 Skew by Delta...")
     viz.plot_skew_by_delta(
-        df_greeks,
-        expiration_filter=exp_str,
+        df_sel,
+        expiration_filter=exp_str, already_filtered=True,
         save_path=output_dir / f"{symbol}_skew_delta_{exp_str}.png"
     )
     
     # 3. Skew by Moneyness
     print("  3/6 Skew by Moneyness...")
     viz.plot_skew_by_moneyness(
-        df_greeks, spot_price,
-        expiration_filter=exp_str,
+        df_sel, spot_price,
+        expiration_filter=exp_str, already_filtered=True,
         save_path=output_dir / f"{symbol}_skew_moneyness_{exp_str}.png"
     )
     
@@ -250,8 +254,8 @@ def main():
     # 6. Dashboard
     print("  6/6 Complete Dashboard...")
     viz.create_skew_dashboard(
-        df_greeks, spot_price,
-        expiration_filter=exp_str,
+        df_sel, spot_price,
+        expiration_filter=exp_str, already_filtered=True,
         save_path=output_dir / f"{symbol}_skew_dashboard_{exp_str}.png"
     )
     
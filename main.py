@@ -5,19 +5,50 @@ Collecte quotidienne automatique à 22h15.
 import schedule
 import time
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-from utils.logger import setup_logging, log_section_header, log_metrics_summary
+from utils.logger import (setup_logging, start_log_listener, setup_worker_logging,
+                          worker_mp_context, get_logger, log_section_header,
+                          log_metrics_summary)
 from utils.alerts import AlertSystem
 from core.data_collector_v3 import OptionsDataCollectorV3
 from storage.manager import StorageManager
 from config import settings
 
-logger = setup_logging()
+logger = logging.getLogger(__name__)
 
-collector = OptionsDataCollectorV3()
+# Module ré-importé par les workers forkserver : logging et alertes sont mis en place par main()
 storage = StorageManager()
-alerts = AlertSystem()
+alerts = None
+
+MAX_IDLE_SECONDS = 3600  # Réveil au plus toutes les heures entre deux jobs
+
+_worker_collector = None  # Collecteur propre à chaque processus de calcul
+
+def _init_worker(n_workers: int, log_queue):
+    """Crée le collecteur du processus (session HTTP non partageable entre processus)."""
+    global _worker_collector
+    setup_worker_logging(log_queue)
+    # Débit et requêtes simultanées du Terminal sont répartis entre les processus
+    # (n_workers <= FETCH_WORKERS : le total reste dans la limite du Terminal)
+    _worker_collector = OptionsDataCollectorV3(settings.RATE_LIMIT_PER_SEC / n_workers,
+                                               max(1, settings.FETCH_WORKERS // n_workers))
+
+def _collect_symbol(symbol: str, date: str) -> dict:
+    """Collecte et sauvegarde un symbole (fichiers par symbole : pas de conflit d'écriture)."""
+    log = get_logger(__name__, symbol)
+    log.info("Processing...")
+    metrics, datasets = _worker_collector.calculate_daily_metrics(symbol, date, log)
+    storage.save_daily_metrics(symbol, metrics)
+    # Fusion différée : master et historiques ne sont réécrits qu'au-delà de COMPACT_MIN_PARTS parts
+    storage.compact_daily_metrics(symbol, min_parts=settings.COMPACT_MIN_PARTS)
+    _worker_collector.price_history.compact_history(symbol, min_parts=settings.COMPACT_MIN_PARTS)
+    
+    if 'gex_distribution' in datasets and not datasets['gex_distribution'].empty:
+        storage.save_gex_distribution(symbol, date, datasets['gex_distribution'])
+    
+    return metrics
 
 def daily_collection_job():
     """Job principal de collecte quotidienne."""
@@ -25,20 +56,26 @@ def daily_collection_job():
     
     today = datetime.now().strftime('%Y%m%d')
     start_time = time.time()
+    # Logs des workers écrits par le seul processus principal (rotation unique)
+    log_queue, log_listener = start_log_listener()
     
     try:
-        for symbol in settings.SYMBOLS:
-            logger.info(f"Processing {symbol}...")
-            
-            metrics, datasets = collector.calculate_daily_metrics(symbol, today)
-            storage.save_daily_metrics(symbol, metrics)
+        # Un processus par symbole, résultats consommés dans l'ordre de SYMBOLS. Job limité
+        # par le Terminal : au plus FETCH_WORKERS processus, chacun avec au moins un thread
+        n_workers = min(settings.CALC_WORKERS, settings.FETCH_WORKERS, len(settings.SYMBOLS))
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=worker_mp_context(),
+                                 initializer=_init_worker,
+                                 initargs=(n_workers, log_queue)) as executor:
+            futures = {symbol: executor.submit(_collect_symbol, symbol, today)
+                       for symbol in settings.SYMBOLS}
             
-            if 'gex_distribution' in datasets and not datasets['gex_distribution'].empty:
-                storage.save_gex_distribution(symbol, today, datasets['gex_distribution'])
-            
-            log_metrics_summary(metrics)
-            alerts.check_and_alert(metrics)
-            storage.update_state(symbol, today, 'success')
+            for symbol, future in futures.items():
+                metrics = future.result()
+                
+                # Alertes et state file restent dans le processus principal
+                log_metrics_summary(metrics)
+                alerts.check_and_alert(metrics)
+                storage.update_state(symbol, today, 'success', flush=False)
         
         storage_stats = storage.get_storage_stats()
         logger.info(f"Storage: {storage_stats['total']['size_gb']:.2f} GB, "
@@ -51,11 +88,21 @@ def daily_collection_job():
     except Exception as e:
         logger.error(f"Daily collection failed: {e}", exc_info=True)
         log_section_header("DAILY COLLECTION FAILED")
+    
+    finally:
+        log_listener.stop()
+        # Une seule écriture du state file pour tous les symboles traités
+        storage.flush_state()
+        alerts.close()
 
 def main():
     """Boucle principale avec scheduler."""
+    global alerts
+    setup_logging()
+    alerts = AlertSystem()
     log_section_header("THETADATA WAREHOUSE - STARTING")
     
+    settings.ensure_paths()
     logger.info(f"Symbols tracked: {', '.join(settings.SYMBOLS)}")
     logger.info("Scheduled job: 22:15 daily")
     logger.info("Press Ctrl+C to stop")
@@ -64,8 +111,13 @@ def main():
     
     try:
         while True:
+            # Sommeil jusqu'au prochain job (plafonné : robuste aux mises en veille / changements d'heure)
+            idle = schedule.idle_seconds()
+            if idle is None:
+                break
+            if idle > 0:
+                time.sleep(min(idle, MAX_IDLE_SECONDS))
             schedule.run_pending()
-            time.sleep(60)
     
     except KeyboardInterrupt:
         logger.info("Shutdown requested by user")
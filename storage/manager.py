@@ -2,14 +2,111 @@
 Gestionnaire de stockage Parquet optimisé.
 """
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import logging
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import json
+import os
+import threading
 from datetime import datetime
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
+# zstd niveau 3 : ~20-30% plus compact que snappy, décompression plus rapide.
+# Statistiques de colonnes écrites pour le filtrage par row group à la lecture.
+PARQUET_OPTIONS = {
+    'engine': 'pyarrow',
+    'compression': 'zstd',
+    'compression_level': 3,
+    'use_dictionary': True,
+    'data_page_version': '2.0',
+    'write_statistics': True,
+}
+# Mêmes options pour pq.write_table (sans le choix de moteur pandas)
+WRITE_OPTIONS = {k: v for k, v in PARQUET_OPTIONS.items() if k != 'engine'}
+
+def _read_parquet(filepath: Path, columns: Optional[List[str]] = None,
+                  filters: Optional[list] = None) -> pd.DataFrame:
+    """
+    Lecture parquet avec projection (seules les colonnes présentes dans le
+    fichier) et predicate pushdown, repli sur la lecture sans filtre si le
+    prédicat ne s'applique pas (ex. 'date' stockée en texte).
+    """
+    if columns is not None:
+        names = pq.read_schema(filepath).names
+        columns = [c for c in columns if c in names]
+    if filters:
+        try:
+            return pd.read_parquet(filepath, engine='pyarrow', columns=columns, filters=filters)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            pass
+    return pd.read_parquet(filepath, engine='pyarrow', columns=columns)
+
+def _with_datetime_dates(df: pd.DataFrame) -> pd.DataFrame:
+    """'date' en datetime64 (fichiers écrits avant le stockage natif : texte YYYYMMDD)."""
+    if 'date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['date']):
+        df['date'] = pd.to_datetime(df['date'].astype(str))
+    return df
+
+# Colonnes texte répétitives des données core, écrites en catégoriel
+CORE_CATEGORICAL_COLUMNS = ('symbol', 'right')
+
+# Colonnes flottantes sans besoin de float64 (~3 chiffres significatifs utiles).
+# strike reste en float64 : clé de jointure greeks / OI / prix.
+FLOAT32_COLUMNS = ('delta', 'gamma', 'theta', 'vega', 'rho', 'implied_vol', 'iv_pct', 'bid', 'ask')
+
+def downcast_floats(df: pd.DataFrame, columns: tuple = FLOAT32_COLUMNS) -> pd.DataFrame:
+    """Colonnes float64 parmi columns (défaut FLOAT32_COLUMNS) en float32 (sans modifier df)."""
+    cols = {c: df[c].astype('float32') for c in columns
+            if c in df.columns and df[c].dtype == 'float64'}
+    return df.assign(**cols) if cols else df
+
+def _as_categorical(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Colonnes texte à faible cardinalité en catégoriel (sans modifier df) :
+    pyarrow écrit directement un DictionaryArray et la relecture conserve
+    la catégorie.
+    """
+    cols = {c: df[c].astype('category') for c in CORE_CATEGORICAL_COLUMNS
+            if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype)}
+    return df.assign(**cols) if cols else df
+
+@lru_cache(maxsize=4096)
+def _ensure_dir(path: str) -> Path:
+    """Crée un répertoire de partition une seule fois par processus (clé : chemin texte)."""
+    directory = Path(path)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+def _write_core_table(df: pd.DataFrame, filepath: Path, downcast: bool = True):
+    """
+    Écrit un DataFrame core via Arrow directement : Table.from_pandas puis
+    pq.write_table, sans repasser par la couche DataFrame.to_parquet.
+    """
+    if downcast:
+        df = downcast_floats(df)
+    table = pa.Table.from_pandas(_as_categorical(df), preserve_index=False)
+    pq.write_table(table, filepath, **WRITE_OPTIONS)
+
+def _dir_usage(root: Path) -> tuple:
+    """(octets, fichiers parquet) d'un arbre, en un seul parcours os.scandir."""
+    size, count = 0, 0
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    size += entry.stat().st_size
+                    if entry.name.endswith('.parquet'):
+                        count += 1
+    return size, count
+
 class StorageManager:
     """Gestionnaire centralisé du stockage warehouse."""
     
@@ -17,6 +114,9 @@ class StorageManager:
         from config import settings
         self.paths = settings.PATHS
         self.state_file = settings.STATE_FILE
+        self.downcast_float32 = settings.DOWNCAST_FLOAT32
+        self._state_lock = threading.Lock()  # State file partagé entre threads
+        self._pending_state = {}  # symbol -> entrée pas encore écrite (update_state(flush=False))
     
     def save_core_data(self, symbol: str, date: str, expiration: str, 
                        df_prices: pd.DataFrame, df_greeks: pd.DataFrame, df_oi: pd.DataFrame):
@@ -27,42 +127,118 @@ class StorageManager:
         exp_clean = expiration.replace('-', '')
         
         if not df_prices.empty:
-            path = self.paths['core_prices'] / symbol / year / month
-            path.mkdir(parents=True, exist_ok=True)
+            path = _ensure_dir(str(self.paths['core_prices'] / symbol / year / month))
             filepath = path / f"exp_{exp_clean}.parquet"
-            df_prices.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
+            _write_core_table(df_prices, filepath, self.downcast_float32)
             logger.debug(f"Saved prices: {filepath}")
         
         if not df_greeks.empty:
-            path = self.paths['core_greeks'] / symbol / year / month
-            path.mkdir(parents=True, exist_ok=True)
+            path = _ensure_dir(str(self.paths['core_greeks'] / symbol / year / month))
             filepath = path / f"exp_{exp_clean}.parquet"
-            df_greeks.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
+            _write_core_table(df_greeks, filepath, self.downcast_float32)
             logger.debug(f"Saved greeks: {filepath}")
         
         if not df_oi.empty:
-            path = self.paths['core_oi'] / symbol / year / month
-            path.mkdir(parents=True, exist_ok=True)
+            path = _ensure_dir(str(self.paths['core_oi'] / symbol / year / month))
             filepath = path / f"exp_{exp_clean}.parquet"
-            df_oi.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
+            _write_core_table(df_oi, filepath, self.downcast_float32)
             logger.debug(f"Saved OI: {filepath}")
     
+    def _daily_parts_dir(self, symbol: str) -> Path:
+        """Répertoire des parts quotidiennes pas encore fusionnées dans le master."""
+        return self.paths['aggregated'] / f"{symbol}_master_daily_parts"
+    
+    def pending_daily_parts(self, symbol: str) -> List[Path]:
+        """Parts quotidiennes en attente de fusion dans le master, triées par date."""
+        parts_dir = self._daily_parts_dir(symbol)
+        return sorted(parts_dir.glob('*.parquet')) if parts_dir.exists() else []
+    
     def save_daily_metrics(self, symbol: str, metrics: Dict):
-        """Sauvegarde les métriques agrégées quotidiennes."""
-        df_metrics = pd.DataFrame([metrics])
-        filepath = self.paths['aggregated'] / f"{symbol}_master_daily.parquet"
+        """
+        Sauvegarde les métriques agrégées quotidiennes.
         
-        if filepath.exists():
-            df_existing = pd.read_parquet(filepath)
-            df_existing = df_existing[df_existing['date'] != metrics['date']]
-            df_combined = pd.concat([df_existing, df_metrics], ignore_index=True)
-            df_combined = df_combined.sort_values('date')
-            df_combined.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
-        else:
-            df_metrics.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
+        Append-only : une part par date, sans relire ni réécrire le master
+        (O(1) par jour au lieu de O(N)). Fusion via compact_daily_metrics().
+        """
+        parts_dir = self._daily_parts_dir(symbol)
+        parts_dir.mkdir(parents=True, exist_ok=True)
+        filepath = parts_dir / f"date_{str(metrics['date']).replace('-', '')}.parquet"
         
+        # 'date' stockée en datetime64 : comparaisons natives et statistiques min/max exploitables
+        df = pd.DataFrame([metrics])
+        df['date'] = pd.to_datetime(df['date'])
+        df.to_parquet(filepath, index=False, **PARQUET_OPTIONS)
         logger.info(f"Saved daily metrics: {filepath}")
     
+    def save_daily_metrics_batch(self, symbol: str, metrics_list: List[Dict]):
+        """
+        Sauvegarde en une seule écriture les métriques de plusieurs dates
+        (backfill d'un symbole complet).
+        """
+        if not metrics_list:
+            return
+        
+        filepath = self.paths['aggregated'] / f"{symbol}_master_daily.parquet"
+        df_new = pd.DataFrame.from_records(metrics_list)
+        df_new['date'] = pd.to_datetime(df_new['date'])
+        df_existing = self._read_master_daily(symbol)
+        
+        df_combined = pd.concat([df_existing, df_new], ignore_index=True) if not df_existing.empty else df_new
+        df_combined = df_combined.drop_duplicates(subset=['date'], keep='last')
+        df_combined = df_combined.sort_values('date')
+        df_combined.to_parquet(filepath, index=False, **PARQUET_OPTIONS)
+        
+        # Les parts en attente sont désormais incluses dans le master
+        parts_dir = self._daily_parts_dir(symbol)
+        if parts_dir.exists():
+            for part in parts_dir.glob('*.parquet'):
+                part.unlink()
+        
+        logger.info(f"Saved {len(metrics_list)} daily metrics rows: {filepath}")
+    
+    def _read_master_daily(self, symbol: str, columns: Optional[List[str]] = None,
+                           filters: Optional[list] = None) -> pd.DataFrame:
+        """
+        Lit le master + les parts en attente (la part la plus récente gagne par date),
+        restreints aux colonnes / dates demandées dès la lecture parquet.
+        """
+        filepath = self.paths['aggregated'] / f"{symbol}_master_daily.parquet"
+        parts = self.pending_daily_parts(symbol)
+        if columns is not None and 'date' not in columns:
+            columns = ['date', *columns]  # Clé de dédoublonnage
+        
+        frames = [_read_parquet(filepath, columns, filters)] if filepath.exists() else []
+        frames += [_read_parquet(part, columns, filters) for part in parts]
+        frames = [_with_datetime_dates(f) for f in frames]
+        if len(frames) <= 1:
+            return frames[0] if frames else pd.DataFrame()
+        
+        df = pd.concat(frames, ignore_index=True)
+        df = df.drop_duplicates(subset=['date'], keep='last')
+        return df.sort_values('date')
+    
+    def compact_daily_metrics(self, symbol: str, min_parts: int = 1):
+        """
+        Fusionne les parts quotidiennes dans le master (une seule réécriture).
+        
+        min_parts : nombre de parts en attente à partir duquel la fusion a lieu.
+        Le job quotidien passe settings.COMPACT_MIN_PARTS (réécriture O(historique)
+        amortie) ; les backfills fusionnent tout en fin de run (défaut 1).
+        Entre deux fusions, _read_master_daily intègre les parts en attente.
+        """
+        parts = self.pending_daily_parts(symbol)
+        if not parts or len(parts) < min_parts:
+            return
+        
+        filepath = self.paths['aggregated'] / f"{symbol}_master_daily.parquet"
+        df = self._read_master_daily(symbol)
+        df.to_parquet(filepath, index=False, **PARQUET_OPTIONS)
+        
+        for part in parts:
+            part.unlink()
+        
+        logger.info(f"Compacted {len(parts)} daily parts into {filepath}")
+    
     def save_gex_distribution(self, symbol: str, date: str, df_gex: pd.DataFrame):
         """Sauvegarde la distribution GEX par strike."""
         if df_gex.empty:
@@ -71,30 +247,73 @@ class StorageManager:
         df_gex['date'] = pd.to_datetime(date)
         date_obj = pd.to_datetime(date)
         year = date_obj.strftime('%Y')
-        path = self.paths['derived_gex'] / symbol / year
-        path.mkdir(parents=True, exist_ok=True)
+        path = _ensure_dir(str(self.paths['derived_gex'] / symbol / year))
         filepath = path / f"gex_{date.replace('-', '')}.parquet"
-        df_gex.to_parquet(filepath, engine='pyarrow', compression='snappy', index=False)
+        df_gex.to_parquet(filepath, index=False, **PARQUET_OPTIONS)
         logger.debug(f"Saved GEX distribution: {filepath}")
     
     def load_master_daily(self, symbol: str, start_date: Optional[str] = None, 
-                          end_date: Optional[str] = None) -> pd.DataFrame:
-        """Charge les métriques quotidiennes avec filtrage optionnel."""
-        filepath = self.paths['aggregated'] / f"{symbol}_master_daily.parquet"
+                          end_date: Optional[str] = None,
+                          columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Charge les métriques quotidiennes avec filtrage optionnel.
+        
+        columns : colonnes à lire ('date' toujours incluse), bornes de dates
+        poussées au lecteur parquet.
+        """
+        filters = []
+        if start_date:
+            filters.append(('date', '>=', pd.to_datetime(start_date).to_pydatetime()))
+        if end_date:
+            filters.append(('date', '<=', pd.to_datetime(end_date).to_pydatetime()))
+        df = self._read_master_daily(symbol, columns, filters or None)
         
-        if not filepath.exists():
-            logger.warning(f"Master daily file not found: {filepath}")
+        if df.empty:
+            logger.warning(f"Master daily not found for {symbol}")
             return pd.DataFrame()
         
-        df = pd.read_parquet(filepath)
+        # Filtre pandas conservé pour les fichiers lus sans pushdown
         if start_date:
             df = df[df['date'] >= pd.to_datetime(start_date)]
         if end_date:
             df = df[df['date'] <= pd.to_datetime(end_date)]
         return df
     
+    def load_core_greeks(self, symbol: str, date: str,
+                         columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Charge les fichiers Greeks core correspondant à une date (YYYYMMDD).
+        
+        columns : colonnes à lire (celles absentes d'un fichier sont ignorées).
+        """
+        date_obj = pd.to_datetime(date)
+        greeks_path = self.paths['core_greeks'] / symbol / date_obj.strftime('%Y') / date_obj.strftime('%m')
+        if not greeks_path.exists():
+            logger.warning(f"Greeks path not found: {greeks_path}")
+            return pd.DataFrame()
+        
+        greeks_files = list(greeks_path.glob(f"*{date}*.parquet"))
+        if not greeks_files:
+            return pd.DataFrame()
+        
+        # Un seul scan Arrow multi-fichiers (décodage parallèle), une conversion pandas
+        try:
+            # Schéma unifié : une colonne absente d'un fichier y devient nulle
+            schema = pa.unify_schemas([pq.read_schema(f) for f in greeks_files])
+            dataset = ds.dataset([str(f) for f in greeks_files], schema=schema, format='parquet')
+            if columns is not None:
+                columns = [c for c in columns if c in dataset.schema.names]
+            table = dataset.to_table(columns=columns, use_threads=True)
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Schémas incompatibles entre fichiers : lecture fichier par fichier
+            return pd.concat([_read_parquet(f, columns) for f in greeks_files], ignore_index=True)
+    
     def get_last_collected_date(self, symbol: str) -> Optional[str]:
         """Récupère la dernière date collectée depuis le state file."""
+        with self._state_lock:
+            if symbol in self._pending_state:
+                return self._pending_state[symbol]['last_date']
         if not self.state_file.exists():
             return None
         try:
@@ -104,8 +323,34 @@ class StorageManager:
         except:
             return None
     
-    def update_state(self, symbol: str, date: str, status: str = 'success'):
-        """Met à jour le state file avec la dernière collecte."""
+    def update_state(self, symbol: str, date: str, status: str = 'success', flush: bool = True):
+        """
+        Met à jour le state file avec la dernière collecte.
+        
+        flush=False : l'entrée reste en mémoire jusqu'à flush_state(), pour
+        une seule relecture/écriture du JSON par boucle de symboles.
+        """
+        with self._state_lock:
+            self._pending_state[symbol] = {
+                'last_date': date,
+                'last_update': datetime.now().isoformat(),
+                'status': status
+            }
+            if flush:
+                self._write_pending_state()
+        
+        logger.debug(f"Updated state: {symbol} -> {date} ({status})")
+    
+    def flush_state(self):
+        """Écrit les entrées en attente dans le state file."""
+        with self._state_lock:
+            self._write_pending_state()
+    
+    def _write_pending_state(self):
+        """Relit le state file, applique les entrées en attente et le réécrit atomiquement (verrou tenu)."""
+        if not self._pending_state:
+            return
+        
         state = {}
         if self.state_file.exists():
             try:
@@ -114,27 +359,28 @@ class StorageManager:
             except:
                 pass
         
-        if symbol not in state:
-            state[symbol] = {}
+        for symbol, entry in self._pending_state.items():
+            state.setdefault(symbol, {}).update(entry)
         
-        state[symbol]['last_date'] = date
-        state[symbol]['last_update'] = datetime.now().isoformat()
-        state[symbol]['status'] = status
-        
-        with open(self.state_file, 'w') as f:
+        # Écriture atomique : un crash en cours d'écriture ne tronque jamais le state file
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.state_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
             json.dump(state, f, indent=2)
-        
-        logger.debug(f"Updated state: {symbol} -> {date} ({status})")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.state_file)
+        self._pending_state.clear()
     
     def get_storage_stats(self) -> Dict:
         """Calcule statistiques d'utilisation du storage."""
         stats = {}
         for name, path in self.paths.items():
             if path.exists():
-                total_size = sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+                total_size, parquet_count = _dir_usage(path)
                 stats[name] = {
                     'size_mb': total_size / (1024 * 1024),
-                    'file_count': len(list(path.rglob('*.parquet')))
+                    'file_count': parquet_count
                 }
         
         total_mb = sum(s['size_mb'] for s in stats.values())
@@ -100,6 +100,7 @@ class TestRunner:
         return passed == total
 
 def main():
+    settings.ensure_paths()
     runner = TestRunner()
     success = runner.run_all_tests()
     sys.exit(0 if success else 1)
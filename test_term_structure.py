@@ -1,19 +1,19 @@
 """
 Test Term Structure - Validation RR25 par DTE
 Usage: python test_term_structure.py
+       DWC_SETTINGS=config.settings python test_term_structure.py
 """
+import importlib
+import os
 import sys
 import pandas as pd
 from datetime import datetime, timedelta
 
-# Importer modules
-sys.path.insert(0, '.')
-try:
-    from config import settings_test as settings
-except:
-    from config import settings
+# Settings choisis par variable d'environnement (config de test par défaut)
+settings = importlib.import_module(os.environ.get('DWC_SETTINGS', 'config.settings_test'))
 
 from core.api_wrapper import ThetaDataAPI
+from core.calculations import concat_by_expiration, prepare_greeks
 from core.term_structure import calculate_term_structure_metrics
 
 def test_term_structure():
@@ -23,7 +23,8 @@ def test_term_structure():
     print("  TERM STRUCTURE TEST - RR25 by DTE")
     print("="*80)
     
-    api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT)
+    api = ThetaDataAPI(settings.THETADATA_BASE_URL, settings.THETADATA_TIMEOUT,
+                       settings.FETCH_WORKERS, settings.RATE_LIMIT_PER_SEC)
     
     # Date de test (hier)
     test_date = (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
@@ -45,33 +46,33 @@ def test_term_structure():
     # 2. Collecter Greeks pour toutes expirations
     print("\n[2/3] Collecting Greeks data...", end=" ", flush=True)
     
-    all_greeks = []
-    
-    for exp in df_exp['expiration'][:20]:  # Limiter à 20 pour test
-        df_greeks = api.fetch('/option/history/greeks/eod', {
+    # Toutes les expirations en un lot : requêtes concurrentes via le pool de l'API
+    expirations = df_exp['expiration'][:20].tolist()  # Limiter à 20 pour test
+    date_dt = pd.Timestamp(test_date)
+    results = api.fetch_many([
+        ('/option/history/greeks/eod', {
             'symbol': 'SPY',
             'expiration': exp,
             'start_date': test_date,
             'end_date': test_date
         })
-        
-        if not df_greeks.empty:
-            df_greeks['expiration'] = pd.to_datetime(exp)
-            df_greeks['date'] = pd.to_datetime(test_date)
-            df_greeks['dte'] = (pd.to_datetime(exp) - pd.to_datetime(test_date)).days
-            all_greeks.append(df_greeks)
+        for exp in expirations
+    ])
+    api.close()
     
-    if not all_greeks:
+    exp_dates = pd.DatetimeIndex([pd.Timestamp(exp) for exp in expirations])
+    df_all_greeks = concat_by_expiration(results, exp_dates, date_dt)
+    
+    if df_all_greeks.empty:
         print("✗ No Greeks data collected")
         return False
     
-    df_all_greeks = pd.concat(all_greeks, ignore_index=True)
     print(f"✓ Collected {len(df_all_greeks)} rows")
     
     # Afficher distribution DTE
     print(f"\n  DTE Range: {df_all_greeks['dte'].min()} to {df_all_greeks['dte'].max()} days")
     
-    dte_counts = df_all_greeks.groupby('dte').size()
+    dte_counts = df_all_greeks['dte'].value_counts().sort_index()
     print(f"  Expirations available:")
     for dte, count in dte_counts.head(10).items():
         print(f"    DTE {dte:>3}: {count:>4} contracts")
@@ -79,7 +80,9 @@ def test_term_structure():
     # 3. Calculer term structure metrics
     print("\n[3/3] Calculating term structure...", end=" ", flush=True)
     
-    metrics = calculate_term_structure_metrics(df_all_greeks)
+    # Tableaux greeks préparés une fois : term structure et RR25 global
+    prepared = prepare_greeks(df_all_greeks)
+    metrics = calculate_term_structure_metrics(df_all_greeks, prepared=prepared)
     
     print("✓ Done")
     
@@ -158,8 +161,8 @@ def test_term_structure():
     # Calculer RR25 global (comme avant)
     from core.calculations import interpolate_iv_at_delta
     
-    iv_25d_put = interpolate_iv_at_delta(df_all_greeks, 0.25, 'PUT')
-    iv_25d_call = interpolate_iv_at_delta(df_all_greeks, 0.25, 'CALL')
+    iv_25d_put = interpolate_iv_at_delta(df_all_greeks, 0.25, 'PUT', prepared=prepared)
+    iv_25d_call = interpolate_iv_at_delta(df_all_greeks, 0.25, 'CALL', prepared=prepared)
     
     if pd.notna(iv_25d_put) and pd.notna(iv_25d_call):
         rr25_global = iv_25d_put - iv_25d_call
@@ -173,7 +176,8 @@ def test_term_structure():
     print("\n" + "="*80)
     
     # 7. Summary
-    valid_metrics = sum(1 for k, v in metrics.items() if 'rr25' in k and pd.notna(v))
+    # Seules les maturités cibles comptent (rr25_term_spread exclu)
+    valid_metrics = sum(1 for dte in target_dtes if pd.notna(metrics.get(f'rr25_{dte}dte')))
     
     if valid_metrics >= 3:
         print("\n✓ ✓ ✓  TERM STRUCTURE TEST PASSED  ✓ ✓ ✓")
@@ -195,6 +199,11 @@ def test_term_structure():
 def main():
     """Point d'entrée."""
     
+    # Sortie bufferisée par blocs plutôt que ligne à ligne (les indicateurs
+    # de progression gardent leur flush=True explicite)
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(line_buffering=False)
+    
     print("""
 ╔═══════════════════════════════════════════════════════════════════════╗
 ║                                                                       ║
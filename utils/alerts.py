@@ -1,20 +1,35 @@
 """
 Système d'alertes par email.
 """
+import io
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.policy import compat32
 import logging
 from typing import Dict
 
+from utils.logger import SUMMARY_METRICS
+
 logger = logging.getLogger(__name__)
 
+# Sérialisation SMTP : compat32 avec fins de ligne CRLF (RFC 5321). sendmail ne
+# normalise les fins de ligne que pour un str, pas pour des bytes.
+SMTP_POLICY = compat32.clone(linesep='\r\n')
+
+# Métriques surveillées par check_and_alert
+MONITORED_METRICS = frozenset(('net_gamma', 'net_delta'))
+
 class AlertSystem:
     """Système d'alertes intelligent."""
     
     def __init__(self):
         from config import settings
         self.thresholds = settings.ALERT_THRESHOLDS
+        # Seuils lus par check_and_alert à chaque symbole : résolus une fois
+        self._gex_negative_critical = self.thresholds['gex_negative_critical']
+        self._gex_positive_extreme = self.thresholds['gex_positive_extreme']
+        self._net_delta_extreme = self.thresholds['net_delta_extreme']
         self.smtp_config = {
             'server': settings.SMTP_SERVER,
             'port': settings.SMTP_PORT,
@@ -22,7 +37,11 @@ class AlertSystem:
             'password': settings.SMTP_PASSWORD,
             'to': settings.ALERT_EMAIL
         }
+        # ALERT_EMAIL peut lister plusieurs destinataires séparés par des virgules
+        self._recipients = [addr.strip() for addr in (settings.ALERT_EMAIL or '').split(',')
+                            if addr.strip()]
         self.enabled = bool(settings.SMTP_PASSWORD)
+        self._smtp = None  # Connexion SMTP réutilisée entre alertes (voir close())
         
         if not self.enabled:
             logger.warning("Alert system disabled (no SMTP_PASSWORD)")
@@ -36,7 +55,7 @@ class AlertSystem:
         try:
             msg = MIMEMultipart('alternative')
             msg['From'] = self.smtp_config['user']
-            msg['To'] = self.smtp_config['to']
+            msg['To'] = ', '.join(self._recipients)
             msg['Subject'] = f"[ThetaData Warehouse] {subject}"
             
             if html:
@@ -44,49 +63,80 @@ class AlertSystem:
             else:
                 msg.attach(MIMEText(body, 'plain'))
             
-            with smtplib.SMTP(self.smtp_config['server'], self.smtp_config['port']) as server:
-                server.starttls()
-                server.login(self.smtp_config['user'], self.smtp_config['password'])
-                server.send_message(msg)
+            # Message sérialisé une fois puis envoyé tel quel (pas de re-génération par send_message)
+            data = msg.as_bytes(policy=SMTP_POLICY)
+            self._ensure_smtp().sendmail(self.smtp_config['user'], self._recipients, data)
             
             logger.info(f"Alert sent: {subject}")
         
         except Exception as e:
             logger.error(f"Failed to send alert: {e}")
+            self.close()  # Connexion dans un état inconnu : la prochaine alerte se reconnecte
+    
+    def _ensure_smtp(self) -> smtplib.SMTP:
+        """Connexion SMTP authentifiée, ouverte au premier envoi puis réutilisée."""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close()
+        
+        server = smtplib.SMTP(self.smtp_config['server'], self.smtp_config['port'])
+        try:
+            server.starttls()
+            server.login(self.smtp_config['user'], self.smtp_config['password'])
+        except Exception:
+            server.close()
+            raise
+        self._smtp = server
+        return server
+    
+    def close(self):
+        """Ferme la connexion SMTP persistante (fin de job)."""
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        finally:
+            self._smtp = None
     
     def check_and_alert(self, metrics: Dict):
         """Vérifie les métriques et déclenche alertes si seuils dépassés."""
-        if not self.enabled:
+        if not self.enabled or not metrics or MONITORED_METRICS.isdisjoint(metrics.keys()):
             return
         
         alerts = []
         
-        net_gamma = metrics.get('net_gamma', 0)
-        if net_gamma < self.thresholds['gex_negative_critical']:
+        net_gamma = metrics.get('net_gamma')
+        if net_gamma is not None and net_gamma < self._gex_negative_critical:
             alerts.append({
                 'level': 'CRITICAL',
                 'metric': 'Net Gamma',
                 'value': f"${net_gamma/1e9:.2f}B",
-                'threshold': f"${self.thresholds['gex_negative_critical']/1e9:.2f}B",
+                'threshold': f"${self._gex_negative_critical/1e9:.2f}B",
                 'message': '🚨 NEGATIVE GAMMA REGIME - High volatility risk'
             })
         
-        if net_gamma > self.thresholds['gex_positive_extreme']:
+        if net_gamma is not None and net_gamma > self._gex_positive_extreme:
             alerts.append({
                 'level': 'WARNING',
                 'metric': 'Net Gamma',
                 'value': f"${net_gamma/1e9:.2f}B",
-                'threshold': f"${self.thresholds['gex_positive_extreme']/1e9:.2f}B",
+                'threshold': f"${self._gex_positive_extreme/1e9:.2f}B",
                 'message': '⚠️ EXTREME POSITIVE GAMMA - Volatility compression'
             })
         
-        net_delta = abs(metrics.get('net_delta', 0))
-        if net_delta > self.thresholds['net_delta_extreme']:
+        net_delta = metrics.get('net_delta')
+        if net_delta is not None and abs(net_delta) > self._net_delta_extreme:
             alerts.append({
                 'level': 'WARNING',
                 'metric': 'Net Delta',
-                'value': f"${net_delta/1e6:.2f}M",
-                'threshold': f"${self.thresholds['net_delta_extreme']/1e6:.2f}M",
+                'value': f"${abs(net_delta)/1e6:.2f}M",
+                'threshold': f"${self._net_delta_extreme/1e6:.2f}M",
                 'message': '⚠️ EXTREME DELTA POSITIONING - Market imbalance'
             })
         
@@ -98,5 +148,19 @@ class AlertSystem:
         symbol = metrics.get('symbol', 'UNKNOWN')
         date = metrics.get('date', 'UNKNOWN')
         subject = f"⚠️ {len(alerts)} Alert(s) for {symbol} on {date}"
-        body = f"Alerts triggered. Check logs for details. Metrics: {metrics}"
-        self.send_email(subject, body)
+        
+        # Corps écrit ligne à ligne : alertes + métriques clés, sans repr du dict complet
+        buf = io.StringIO()
+        buf.write(f"Symbol: {symbol}\nDate: {date}\n\n")
+        for alert in alerts:
+            buf.write(f"[{alert['level']}] {alert['metric']}: {alert['value']} "
+                      f"(threshold {alert['threshold']}) - {alert['message']}\n")
+        buf.write("\nKey metrics:\n")
+        for key, label, fmt in SUMMARY_METRICS:
+            if metrics.get(key) is not None:
+                try:
+                    buf.write(f"  {label}: {fmt.format(metrics[key])}\n")
+                except (TypeError, ValueError):
+                    pass
+        buf.write("\nCheck logs for details.\n")
+        self.send_email(subject, buf.getvalue())
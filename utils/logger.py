@@ -2,9 +2,46 @@
 Système de logging professionnel.
 """
 import logging
+import multiprocessing
 import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
+# (clé, libellé, format) des lignes de log_metrics_summary
+SUMMARY_METRICS = (
+    ('spot_price', 'Spot Price', '${:.2f}'),
+    ('net_gamma_billions', 'Net Gamma', '${:.2f}B'),
+    ('net_delta_millions', 'Net Delta', '${:.2f}M'),
+    ('iv_atm', 'IV ATM', '{:.2f}%'),
+    ('rr25', 'Risk Reversal 25D', '{:.2f}%'),
+    ('hv_20d', 'Realized Vol 20D', '{:.2f}%'),
+    ('iv_hv_spread', 'IV-HV Spread', '{:.2f}%'),
+    ('pc_volume', 'P/C Ratio (Volume)', '{:.2f}'),
+    ('liquidity_liquidity_stress_index', 'Liquidity Stress', '{:.1f}')
+)
+
+class ContextFilter(logging.Filter):
+    """%(symbol)s par défaut ('-') pour les records émis sans contexte."""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, 'symbol'):
+            record.symbol = '-'
+        return True
+
+class ContextAdapter(logging.LoggerAdapter):
+    """
+    Logger portant un contexte (symbol, ...) : injecté dans extra uniquement
+    pour les records réellement émis, sans interpolation au point d'appel.
+    """
+    
+    def process(self, msg, kwargs):
+        kwargs['extra'] = {**self.extra, **kwargs.get('extra', {})}
+        return msg, kwargs
+
+def get_logger(name: str, symbol: str) -> ContextAdapter:
+    """Logger du module name avec le symbole en contexte."""
+    return ContextAdapter(logging.getLogger(name), {'symbol': symbol})
+
 def setup_logging():
     """Configure le système de logging avec double output (console + fichier)."""
     from config import settings
@@ -13,18 +50,24 @@ def setup_logging():
     logger.setLevel(settings.LOG_LEVEL)
     
     formatter = logging.Formatter(
-        '%(asctime)s | %(levelname)-8s | %(name)s | %(message)s',
+        '%(asctime)s | %(levelname)-8s | %(name)s | %(symbol)s | %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     
+    # DEBUG uniquement sur disque : la console reste au minimum en INFO
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(settings.LOG_LEVEL)
+    console_handler.setLevel(max(logger.level, logging.INFO))
     console_handler.setFormatter(formatter)
+    console_handler.addFilter(ContextFilter())
     logger.addHandler(console_handler)
     
-    file_handler = logging.FileHandler(settings.LOG_FILE)
+    settings.LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    # Ouverture différée au premier message, taille plafonnée (5 x 50 Mo)
+    file_handler = RotatingFileHandler(settings.LOG_FILE, maxBytes=50 * 1024 * 1024,
+                                       backupCount=5, encoding='utf-8', delay=True)
     file_handler.setLevel(settings.LOG_LEVEL)
     file_handler.setFormatter(formatter)
+    file_handler.addFilter(ContextFilter())
     logger.addHandler(file_handler)
     
     logging.getLogger('urllib3').setLevel(logging.WARNING)
@@ -38,34 +81,72 @@ def setup_logging():
     
     return logger
 
+def worker_mp_context():
+    """
+    Contexte multiprocessing des pools de calcul : 'forkserver'.
+    
+    Les workers ne sont pas forkés depuis le processus principal, où tournent déjà
+    threads HTTP, token bucket et QueueListener (fork d'un processus multi-thread).
+    Les scripts importés par les workers ne configurent donc pas le logging à l'import.
+    """
+    return multiprocessing.get_context('forkserver')
+
+def start_log_listener():
+    """
+    Centralise les logs des processus de calcul dans le processus principal.
+    
+    Les workers d'un ProcessPoolExecutor héritent du RotatingFileHandler : chacun
+    ferait sa propre rotation du même fichier. Ils envoient donc leurs records dans
+    une queue, dépilée par un QueueListener qui les transmet aux handlers du parent.
+    
+    Returns:
+        (queue, listener) : queue à passer à setup_worker_logging, listener à
+        arrêter (stop) une fois le pool fermé
+    """
+    queue = worker_mp_context().Queue(-1)  # Même contexte que les pools de calcul
+    listener = QueueListener(queue, *logging.getLogger().handlers,
+                             respect_handler_level=True)
+    listener.start()
+    return queue, listener
+
+def setup_worker_logging(queue):
+    """
+    Initialiseur de processus : remplace les handlers hérités par un QueueHandler.
+    
+    Niveaux repositionnés ici : un worker forkserver ne passe pas par setup_logging.
+    """
+    from config import settings
+    
+    logger = logging.getLogger()
+    logger.setLevel(settings.LOG_LEVEL)
+    # Handlers retirés sans close() : le fichier reste celui du parent
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(queue))
+    
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+    logging.getLogger('requests').setLevel(logging.WARNING)
+
 def log_section_header(message: str):
     """Affiche un header de section visuellement distinct."""
     logger = logging.getLogger(__name__)
+    if not logger.isEnabledFor(logging.INFO):
+        return
     logger.info("=" * 80)
     logger.info(f"  {message}")
     logger.info("=" * 80)
 
 def log_metrics_summary(metrics: dict):
-    """Affiche un résumé formaté des métriques."""
-    logger = logging.getLogger(__name__)
+    """Affiche un résumé formaté des métriques (rien n'est formaté si INFO est filtré)."""
+    logger = get_logger(__name__, metrics.get('symbol', '-'))
+    if not logger.isEnabledFor(logging.INFO):
+        return
     
     logger.info("-" * 80)
     logger.info("DAILY METRICS SUMMARY")
     logger.info("-" * 80)
     
-    key_metrics = [
-        ('spot_price', 'Spot Price', '${:.2f}'),
-        ('net_gamma_billions', 'Net Gamma', '${:.2f}B'),
-        ('net_delta_millions', 'Net Delta', '${:.2f}M'),
-        ('iv_atm', 'IV ATM', '{:.2f}%'),
-        ('rr25', 'Risk Reversal 25D', '{:.2f}%'),
-        ('hv_20d', 'Realized Vol 20D', '{:.2f}%'),
-        ('iv_hv_spread', 'IV-HV Spread', '{:.2f}%'),
-        ('pc_volume', 'P/C Ratio (Volume)', '{:.2f}'),
-        ('liquidity_liquidity_stress_index', 'Liquidity Stress', '{:.1f}')
-    ]
-    
-    for key, label, fmt in key_metrics:
+    for key, label, fmt in SUMMARY_METRICS:
         if key in metrics and metrics[key] is not None:
             try:
                 value = fmt.format(metrics[key])
@@ -2,15 +2,29 @@
 Module de visualisation du skew de volatilité.
 Créé des graphiques professionnels du volatility smile/skew.
 """
+import os
+import sys
 import pandas as pd
 import numpy as np
+import matplotlib
+
+# Génération headless (cron, SSH) : Agg directement, sans tenter de backend GUI.
+# MPLBACKEND explicite toujours respecté.
+if (not os.environ.get('MPLBACKEND') and sys.platform.startswith('linux')
+        and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY')):
+    matplotlib.use('Agg')
+
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib import cm
+from matplotlib.colors import Normalize, to_rgba
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List
 import logging
 
+from core.calculations import right_masks
+
 logger = logging.getLogger(__name__)
 
 # Configuration style Bloomberg
@@ -28,15 +42,102 @@ COLORS = {
     'line5': '#ab47bc',  # Purple
 }
 
+SURFACE_MONEYNESS_BINS = 30  # Colonnes de la grille de la surface 3D
+SURFACE_MAX_EMPTY_RATIO = 0.5  # Au-delà, avertissement : la plupart des faces ne sont pas tracées
+
+# Sous-graphiques skew du dashboard : mode -> (array de la vue, libellé de l'axe x)
+DASHBOARD_SKEW_AXES = {
+    'strike': ('strike', 'Strike ($)'),
+    'delta': ('abs_delta', '|Delta|'),
+    'moneyness': ('moneyness', 'Moneyness (K/S)'),
+}
+# En dessous, la préparation des 4 sous-graphiques reste séquentielle (coût des threads)
+DASHBOARD_PARALLEL_MIN_ROWS = 50_000
+
+def _binned_mean(row_idx: np.ndarray, col_idx: np.ndarray, values: np.ndarray,
+                 shape: tuple) -> np.ndarray:
+    """Moyenne de values par cellule (row_idx, col_idx) d'une grille shape, NaN si vide."""
+    flat = row_idx * shape[1] + col_idx
+    sums = np.bincount(flat, weights=values, minlength=shape[0] * shape[1])
+    counts = np.bincount(flat, minlength=shape[0] * shape[1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts).reshape(shape)
+
+def _plot_markers_line(ax, x: np.ndarray, y: np.ndarray, color: str, markersize: float,
+                       edgecolor: Optional[str] = None, label: Optional[str] = None):
+    """
+    Points (alpha 0.6) reliés par une ligne fine (alpha 0.3) en un seul Line2D.
+    
+    Remplace la paire scatter + plot : un seul artiste, un seul tampon de marqueur.
+    edgecolor=None : marqueurs sans contour (pas de tracé du bord par point).
+    """
+    face = to_rgba(color, 0.6)
+    ax.plot(x, y, linestyle='-', linewidth=1, color=to_rgba(color, 0.3),
+            marker='o', markersize=markersize, markerfacecolor=face,
+            markeredgecolor='none' if edgecolor is None else to_rgba(edgecolor, 0.6),
+            markeredgewidth=0 if edgecolor is None else 0.5, label=label, rasterized=True)
+
+def _sorted_by_x(x: np.ndarray, y: np.ndarray, mask: np.ndarray) -> tuple:
+    """(x, y) restreints à mask et triés par x croissant (tri stable)."""
+    x, y = x[mask], y[mask]
+    order = np.argsort(x, kind='stable')
+    return x[order], y[order]
+
+def _prepare_skew_series(view: dict, mode: str) -> tuple:
+    """((x, iv) calls, (x, iv) puts) triés par x pour un sous-graphique skew du dashboard."""
+    x, iv = view[DASHBOARD_SKEW_AXES[mode][0]], view['iv_pct']
+    return _sorted_by_x(x, iv, view['is_call']), _sorted_by_x(x, iv, view['is_put'])
+
+def _prepare_put_focus(view: dict) -> Optional[tuple]:
+    """(|delta|, iv, couleurs RGBA) des puts triés par |delta|, None si aucun put."""
+    put_x, put_iv = _sorted_by_x(view['abs_delta'], view['iv_pct'],
+                                 view['is_put'] & view['has_delta'])
+    if not put_x.size:
+        return None
+    # Couleurs RGBA calculées une fois (pas de ScalarMappable à re-normaliser)
+    colors = matplotlib.colormaps['Reds'](Normalize(put_x.min(), put_x.max())(put_x))
+    return put_x, put_iv, colors
+
+def _delta_bin_means(abs_delta: np.ndarray, iv: np.ndarray, n_bins: int = 20) -> tuple:
+    """
+    (milieux, IV moyenne) des tranches de |delta| non vides.
+    
+    Mêmes bornes que pd.cut(bins=n_bins) : n_bins tranches égales sur
+    [min, max], fermées à droite, première borne abaissée de 0.1%.
+    """
+    lo, hi = abs_delta.min(), abs_delta.max()
+    if lo == hi:
+        lo, hi = lo - 0.001 * abs(lo), hi + 0.001 * abs(hi)
+        edges = np.linspace(lo, hi, n_bins + 1)
+    else:
+        edges = np.linspace(lo, hi, n_bins + 1)
+        edges[0] -= (hi - lo) * 0.001
+    idx = np.clip(np.searchsorted(edges, abs_delta, side='left') - 1, 0, n_bins - 1)
+    means = _binned_mean(np.zeros_like(idx), idx, iv, (1, n_bins))[0]
+    filled = ~np.isnan(means)
+    return ((edges[:-1] + edges[1:]) / 2)[filled], means[filled]
+
 class VolatilitySkewVisualizer:
     """Visualiseur de skew de volatilité."""
     
-    def __init__(self, figsize=(14, 8)):
+    def __init__(self, figsize=(14, 8), marker_edges: bool = False):
+        """
+        Args:
+            figsize: Taille des figures
+            marker_edges: Contour blanc des marqueurs (qualité publication, rendu plus lent)
+        """
         self.figsize = figsize
+        self.marker_edges = marker_edges
+    
+    @property
+    def _marker_edgecolor(self) -> Optional[str]:
+        """Couleur de contour des marqueurs, None = pas de contour (chemin rapide)."""
+        return 'white' if self.marker_edges else None
         
     def plot_skew_by_strike(self, df_greeks: pd.DataFrame, spot_price: float, 
                             expiration_filter: Optional[str] = None, 
-                            save_path: Optional[str] = None):
+                            save_path: Optional[str] = None,
+                            already_filtered: bool = False, ax=None):
         """
         Volatility Skew : IV en fonction du Strike.
         Le graphique classique "smile" ou "smirk".
@@ -46,46 +147,49 @@ class VolatilitySkewVisualizer:
             spot_price: Prix spot actuel
             expiration_filter: Filtrer sur expiration spécifique (ex: '20250131')
             save_path: Chemin pour sauvegarder (optionnel)
+            already_filtered: df_greeks est déjà restreint à expiration_filter
+                (le filtre ne sert alors qu'au titre)
+            ax: Axes existant à réutiliser (effacé avant tracé) ; sinon nouvelle figure
         """
-        fig, ax = plt.subplots(figsize=self.figsize, facecolor=COLORS['bg'])
+        owns_fig = ax is None  # Figure créée ici : fermée après sauvegarde
+        if owns_fig:
+            fig, ax = plt.subplots(figsize=self.figsize, facecolor=COLORS['bg'])
+        else:
+            fig = ax.figure
+            ax.cla()
         ax.set_facecolor(COLORS['paper'])
         
-        # Filtrer données
-        df = df_greeks.copy()
-        
-        if expiration_filter:
-            df = df[df['expiration'] == pd.to_datetime(expiration_filter)]
-        
-        # Filtrer qualité
-        df = df[
-            (df['iv_pct'] > 0) & 
-            (df['iv_pct'] < 100) &
-            (df['volume'] > 0) &
-            (df['strike'] > 0)
-        ]
+        # Filtrer données (expiration + qualité) : un seul masque sur les arrays NumPy
+        exp_ts = pd.to_datetime(expiration_filter) if expiration_filter else None  # Parsé une fois (filtre + titre)
+        iv_all = df_greeks['iv_pct'].to_numpy()
+        mask = ((iv_all > 0) & (iv_all < 100) &
+                (df_greeks['volume'].to_numpy() > 0) &
+                (df_greeks['strike'].to_numpy() > 0))
+        if exp_ts is not None and not already_filtered:
+            mask &= (df_greeks['expiration'] == exp_ts).to_numpy()
+        df = df_greeks[mask]
         
         if df.empty:
             logger.warning("No data to plot skew by strike")
+            if owns_fig:
+                plt.close(fig)
             return None
         
         # Séparer Calls et Puts
-        calls = df[df['right'] == 'CALL'].sort_values('strike')
-        puts = df[df['right'] == 'PUT'].sort_values('strike')
+        x = df['strike'].to_numpy()
+        iv = df['iv_pct'].to_numpy()
+        is_call, is_put = right_masks(df['right'])
+        call_x, call_iv = _sorted_by_x(x, iv, is_call)
+        put_x, put_iv = _sorted_by_x(x, iv, is_put)
         
         # Plot
-        if not calls.empty:
-            ax.scatter(calls['strike'], calls['iv_pct'], 
-                      alpha=0.6, s=50, color=COLORS['line1'], 
-                      label='Calls', edgecolors='white', linewidths=0.5)
-            ax.plot(calls['strike'], calls['iv_pct'], 
-                   alpha=0.3, linewidth=1, color=COLORS['line1'])
-        
-        if not puts.empty:
-            ax.scatter(puts['strike'], puts['iv_pct'], 
-                      alpha=0.6, s=50, color=COLORS['line2'], 
-                      label='Puts', edgecolors='white', linewidths=0.5)
-            ax.plot(puts['strike'], puts['iv_pct'], 
-                   alpha=0.3, linewidth=1, color=COLORS['line2'])
+        if call_x.size:
+            _plot_markers_line(ax, call_x, call_iv, COLORS['line1'], markersize=np.sqrt(50),
+                               edgecolor=self._marker_edgecolor, label='Calls')
+        
+        if put_x.size:
+            _plot_markers_line(ax, put_x, put_iv, COLORS['line2'], markersize=np.sqrt(50),
+                               edgecolor=self._marker_edgecolor, label='Puts')
         
         # Spot price line
         ax.axvline(spot_price, color=COLORS['line3'], 
@@ -96,8 +200,8 @@ class VolatilitySkewVisualizer:
         ax.set_ylabel('Implied Volatility (%)', fontsize=12, color=COLORS['text'])
         
         title = 'Volatility Skew by Strike'
-        if expiration_filter:
-            exp_date = pd.to_datetime(expiration_filter).strftime('%Y-%m-%d')
+        if exp_ts is not None:
+            exp_date = exp_ts.strftime('%Y-%m-%d')
             title += f' - Exp: {exp_date}'
         
         ax.set_title(title, fontsize=14, color=COLORS['text'], pad=20)
@@ -106,17 +210,20 @@ class VolatilitySkewVisualizer:
         ax.grid(True, alpha=0.3, color=COLORS['grid'])
         ax.tick_params(colors=COLORS['text'])
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         if save_path:
-            plt.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
+            fig.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
             logger.info(f"Saved skew by strike: {save_path}")
+            if owns_fig:
+                plt.close(fig)  # Libère le canvas (génération en batch)
         
         return fig
     
     def plot_skew_by_delta(self, df_greeks: pd.DataFrame, 
                           expiration_filter: Optional[str] = None,
-                          save_path: Optional[str] = None):
+                          save_path: Optional[str] = None,
+                          already_filtered: bool = False, ax=None):
         """
         Volatility Skew : IV en fonction du Delta.
         Représentation plus standardisée que par strike.
@@ -125,48 +232,49 @@ class VolatilitySkewVisualizer:
             df_greeks: DataFrame avec colonnes [delta, iv_pct, right, expiration]
             expiration_filter: Filtrer sur expiration
             save_path: Chemin sauvegarde
+            already_filtered: df_greeks est déjà restreint à expiration_filter
+                (le filtre ne sert alors qu'au titre)
+            ax: Axes existant à réutiliser (effacé avant tracé) ; sinon nouvelle figure
         """
-        fig, ax = plt.subplots(figsize=self.figsize, facecolor=COLORS['bg'])
+        owns_fig = ax is None  # Figure créée ici : fermée après sauvegarde
+        if owns_fig:
+            fig, ax = plt.subplots(figsize=self.figsize, facecolor=COLORS['bg'])
+        else:
+            fig = ax.figure
+            ax.cla()
         ax.set_facecolor(COLORS['paper'])
         
         # Filtrer
-        df = df_greeks.copy()
-        
-        if expiration_filter:
-            df = df[df['expiration'] == pd.to_datetime(expiration_filter)]
-        
-        df = df[
-            (df['iv_pct'] > 0) & 
-            (df['iv_pct'] < 100) &
-            (df['delta'].notna()) &
-            (df['volume'] > 0)
-        ]
+        exp_ts = pd.to_datetime(expiration_filter) if expiration_filter else None  # Parsé une fois (filtre + titre)
+        iv_all = df_greeks['iv_pct'].to_numpy()
+        mask = ((iv_all > 0) & (iv_all < 100) &
+                pd.notna(df_greeks['delta'].to_numpy()) &
+                (df_greeks['volume'].to_numpy() > 0))
+        if exp_ts is not None and not already_filtered:
+            mask &= (df_greeks['expiration'] == exp_ts).to_numpy()
+        df = df_greeks[mask]
         
         if df.empty:
             logger.warning("No data to plot skew by delta")
+            if owns_fig:
+                plt.close(fig)
             return None
         
-        # Abs delta
-        df['abs_delta'] = df['delta'].abs()
-        
-        # Séparer
-        calls = df[df['right'] == 'CALL'].sort_values('abs_delta')
-        puts = df[df['right'] == 'PUT'].sort_values('abs_delta')
+        # Séparer (x = |delta|)
+        x = df['delta'].abs().to_numpy()
+        iv = df['iv_pct'].to_numpy()
+        is_call, is_put = right_masks(df['right'])
+        call_x, call_iv = _sorted_by_x(x, iv, is_call)
+        put_x, put_iv = _sorted_by_x(x, iv, is_put)
         
         # Plot
-        if not calls.empty:
-            ax.scatter(calls['abs_delta'], calls['iv_pct'], 
-                      alpha=0.6, s=50, color=COLORS['line1'], 
-                      label='Calls', edgecolors='white', linewidths=0.5)
-            ax.plot(calls['abs_delta'], calls['iv_pct'], 
-                   alpha=0.3, linewidth=1, color=COLORS['line1'])
-        
-        if not puts.empty:
-            ax.scatter(puts['abs_delta'], puts['iv_pct'], 
-                      alpha=0.6, s=50, color=COLORS['line2'], 
-                      label='Puts', edgecolors='white', linewidths=0.5)
-            ax.plot(puts['abs_delta'], puts['iv_pct'], 
-                   alpha=0.3, linewidth=1, color=COLORS['line2'])
+        if call_x.size:
+            _plot_markers_line(ax, call_x, call_iv, COLORS['line1'], markersize=np.sqrt(50),
+                               edgecolor=self._marker_edgecolor, label='Calls')
+        
+        if put_x.size:
+            _plot_markers_line(ax, put_x, put_iv, COLORS['line2'], markersize=np.sqrt(50),
+                               edgecolor=self._marker_edgecolor, label='Puts')
         
         # ATM line (delta = 0.5)
         ax.axvline(0.5, color=COLORS['line3'], 
@@ -182,8 +290,8 @@ class VolatilitySkewVisualizer:
         ax.set_ylabel('Implied Volatility (%)', fontsize=12, color=COLORS['text'])
         
         title = 'Volatility Skew by Delta'
-        if expiration_filter:
-            exp_date = pd.to_datetime(expiration_filter).strftime('%Y-%m-%d')
+        if exp_ts is not None:
+            exp_date = exp_ts.strftime('%Y-%m-%d')
             title += f' - Exp: {exp_date}'
         
         ax.set_title(title, fontsize=14, color=COLORS['text'], pad=20)
@@ -193,17 +301,20 @@ class VolatilitySkewVisualizer:
         ax.grid(True, alpha=0.3, color=COLORS['grid'])
         ax.tick_params(colors=COLORS['text'])
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         if save_path:
-            plt.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
+            fig.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
             logger.info(f"Saved skew by delta: {save_path}")
+            if owns_fig:
+                plt.close(fig)  # Libère le canvas (génération en batch)
         
         return fig
     
     def plot_skew_by_moneyness(self, df_greeks: pd.DataFrame, spot_price: float,
                                expiration_filter: Optional[str] = None,
-                               save_path: Optional[str] = None):
+                               save_path: Optional[str] = None,
+                               already_filtered: bool = False, ax=None):
         """
         Volatility Skew : IV en fonction de Moneyness (Strike/Spot).
         Normalise le skew pour comparaison multi-dates.
@@ -213,48 +324,49 @@ class VolatilitySkewVisualizer:
             spot_price: Prix spot
             expiration_filter: Filtrer expiration
             save_path: Chemin sauvegarde
+            already_filtered: df_greeks est déjà restreint à expiration_filter
+                (le filtre ne sert alors qu'au titre)
+            ax: Axes existant à réutiliser (effacé avant tracé) ; sinon nouvelle figure
         """
-        fig, ax = plt.subplots(figsize=self.figsize, facecolor=COLORS['bg'])
+        owns_fig = ax is None  # Figure créée ici : fermée après sauvegarde
+        if owns_fig:
+            fig, ax = plt.subplots(figsize=self.figsize, facecolor=COLORS['bg'])
+        else:
+            fig = ax.figure
+            ax.cla()
         ax.set_facecolor(COLORS['paper'])
         
         # Filtrer
-        df = df_greeks.copy()
-        
-        if expiration_filter:
-            df = df[df['expiration'] == pd.to_datetime(expiration_filter)]
-        
-        df = df[
-            (df['iv_pct'] > 0) & 
-            (df['iv_pct'] < 100) &
-            (df['strike'] > 0) &
-            (df['volume'] > 0)
-        ]
+        exp_ts = pd.to_datetime(expiration_filter) if expiration_filter else None  # Parsé une fois (filtre + titre)
+        iv_all = df_greeks['iv_pct'].to_numpy()
+        mask = ((iv_all > 0) & (iv_all < 100) &
+                (df_greeks['strike'].to_numpy() > 0) &
+                (df_greeks['volume'].to_numpy() > 0))
+        if exp_ts is not None and not already_filtered:
+            mask &= (df_greeks['expiration'] == exp_ts).to_numpy()
+        df = df_greeks[mask]
         
         if df.empty:
             logger.warning("No data to plot skew by moneyness")
+            if owns_fig:
+                plt.close(fig)
             return None
         
-        # Calculer moneyness
-        df['moneyness'] = df['strike'] / spot_price
-        
-        # Séparer
-        calls = df[df['right'] == 'CALL'].sort_values('moneyness')
-        puts = df[df['right'] == 'PUT'].sort_values('moneyness')
+        # Séparer (x = moneyness K/S)
+        x = df['strike'].to_numpy() / spot_price
+        iv = df['iv_pct'].to_numpy()
+        is_call, is_put = right_masks(df['right'])
+        call_x, call_iv = _sorted_by_x(x, iv, is_call)
+        put_x, put_iv = _sorted_by_x(x, iv, is_put)
         
         # Plot
-        if not calls.empty:
-            ax.scatter(calls['moneyness'], calls['iv_pct'], 
-                      alpha=0.6, s=50, color=COLORS['line1'], 
-                      label='Calls', edgecolors='white', linewidths=0.5)
-            ax.plot(calls['moneyness'], calls['iv_pct'], 
-                   alpha=0.3, linewidth=1, color=COLORS['line1'])
-        
-        if not puts.empty:
-            ax.scatter(puts['moneyness'], puts['iv_pct'], 
-                      alpha=0.6, s=50, color=COLORS['line2'], 
-                      label='Puts', edgecolors='white', linewidths=0.5)
-            ax.plot(puts['moneyness'], puts['iv_pct'], 
-                   alpha=0.3, linewidth=1, color=COLORS['line2'])
+        if call_x.size:
+            _plot_markers_line(ax, call_x, call_iv, COLORS['line1'], markersize=np.sqrt(50),
+                               edgecolor=self._marker_edgecolor, label='Calls')
+        
+        if put_x.size:
+            _plot_markers_line(ax, put_x, put_iv, COLORS['line2'], markersize=np.sqrt(50),
+                               edgecolor=self._marker_edgecolor, label='Puts')
         
         # ATM line (moneyness = 1.0)
         ax.axvline(1.0, color=COLORS['line3'], 
@@ -262,15 +374,15 @@ class VolatilitySkewVisualizer:
         
         # Moneyness zones
         ax.axvspan(0, 0.9, alpha=0.1, color='red', label='Deep OTM Puts')
-        ax.axvspan(1.1, df['moneyness'].max(), alpha=0.1, color='green', label='Deep OTM Calls')
+        ax.axvspan(1.1, np.nanmax(x), alpha=0.1, color='green', label='Deep OTM Calls')
         
         # Styling
         ax.set_xlabel('Moneyness (Strike / Spot)', fontsize=12, color=COLORS['text'])
         ax.set_ylabel('Implied Volatility (%)', fontsize=12, color=COLORS['text'])
         
         title = 'Volatility Skew by Moneyness'
-        if expiration_filter:
-            exp_date = pd.to_datetime(expiration_filter).strftime('%Y-%m-%d')
+        if exp_ts is not None:
+            exp_date = exp_ts.strftime('%Y-%m-%d')
             title += f' - Exp: {exp_date}'
         
         ax.set_title(title, fontsize=14, color=COLORS['text'], pad=20)
@@ -279,17 +391,19 @@ class VolatilitySkewVisualizer:
         ax.grid(True, alpha=0.3, color=COLORS['grid'])
         ax.tick_params(colors=COLORS['text'])
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         if save_path:
-            plt.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
+            fig.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
             logger.info(f"Saved skew by moneyness: {save_path}")
+            if owns_fig:
+                plt.close(fig)  # Libère le canvas (génération en batch)
         
         return fig
     
     def plot_term_structure_skew(self, df_greeks: pd.DataFrame, 
                                  dte_targets: List[int] = [7, 30, 60, 90],
-                                 save_path: Optional[str] = None):
+                                 save_path: Optional[str] = None, ax=None):
         """
         Term Structure du Skew : IV en fonction du Delta pour plusieurs maturités.
         Compare le skew à travers différentes expirations.
@@ -298,37 +412,47 @@ class VolatilitySkewVisualizer:
             df_greeks: DataFrame Greeks avec colonne 'dte'
             dte_targets: DTEs à afficher (ex: [7, 30, 60])
             save_path: Chemin sauvegarde
+            ax: Axes existant à réutiliser (effacé avant tracé) ; sinon nouvelle figure
         """
-        fig, ax = plt.subplots(figsize=self.figsize, facecolor=COLORS['bg'])
+        owns_fig = ax is None  # Figure créée ici : fermée après sauvegarde
+        if owns_fig:
+            fig, ax = plt.subplots(figsize=self.figsize, facecolor=COLORS['bg'])
+        else:
+            fig = ax.figure
+            ax.cla()
         ax.set_facecolor(COLORS['paper'])
         
         colors_map = [COLORS['line1'], COLORS['line2'], COLORS['line3'], 
                      COLORS['line4'], COLORS['line5']]
         
+        # Lignes de qualité triées une fois par DTE : chaque cible est une tranche
+        # contiguë trouvée par recherche binaire (pas de re-scan par cible)
+        delta = df_greeks['delta'].to_numpy()
+        quality = ((df_greeks['iv_pct'].to_numpy() > 0) &
+                   pd.notna(delta) &
+                   (df_greeks['volume'].to_numpy() > 0))
+        dte = df_greeks['dte'].to_numpy()[quality]
+        order = np.argsort(dte, kind='stable')
+        dte = dte[order]
+        abs_delta = np.abs(delta[quality][order])
+        iv = df_greeks['iv_pct'].to_numpy()[quality][order]
+        
         # Pour chaque DTE
         for i, target_dte in enumerate(dte_targets):
-            # Filtrer proche du DTE
-            df_dte = df_greeks[
-                (df_greeks['dte'] >= target_dte - 3) &
-                (df_greeks['dte'] <= target_dte + 3) &
-                (df_greeks['iv_pct'] > 0) &
-                (df_greeks['delta'].notna()) &
-                (df_greeks['volume'] > 0)
-            ].copy()
+            # Fenêtre [target - 3, target + 3]
+            lo = np.searchsorted(dte, target_dte - 3, side='left')
+            hi = np.searchsorted(dte, target_dte + 3, side='right')
             
-            if df_dte.empty:
+            if hi <= lo:
                 continue
             
-            df_dte['abs_delta'] = df_dte['delta'].abs()
-            df_dte = df_dte.sort_values('abs_delta')
-            
-            # Plot (moyenne si plusieurs points même delta)
-            grouped = df_dte.groupby(pd.cut(df_dte['abs_delta'], bins=20))['iv_pct'].mean()
+            # Plot (moyenne par tranche de |delta|, tranches vides ignorées)
+            mids, iv_mean = _delta_bin_means(abs_delta[lo:hi], iv[lo:hi])
             
             color = colors_map[i % len(colors_map)]
-            actual_dte = int(df_dte['dte'].median())
+            actual_dte = int(np.median(dte[lo:hi]))
             
-            ax.plot(grouped.index.categories.mid, grouped.values, 
+            ax.plot(mids, iv_mean, 
                    linewidth=2, color=color, label=f'{actual_dte} DTE',
                    marker='o', markersize=4, alpha=0.8)
         
@@ -347,11 +471,13 @@ class VolatilitySkewVisualizer:
         ax.grid(True, alpha=0.3, color=COLORS['grid'])
         ax.tick_params(colors=COLORS['text'])
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         if save_path:
-            plt.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
+            fig.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
             logger.info(f"Saved term structure skew: {save_path}")
+            if owns_fig:
+                plt.close(fig)  # Libère le canvas (génération en batch)
         
         return fig
     
@@ -370,36 +496,52 @@ class VolatilitySkewVisualizer:
         ax = fig.add_subplot(111, projection='3d', facecolor=COLORS['paper'])
         
         # Filtrer données
+        iv_all = df_greeks['iv_pct'].to_numpy()
         df = df_greeks[
-            (df_greeks['iv_pct'] > 0) &
-            (df_greeks['iv_pct'] < 100) &
-            (df_greeks['strike'] > 0) &
-            (df_greeks['dte'] > 0) &
-            (df_greeks['volume'] > 0)
-        ].copy()
+            (iv_all > 0) & (iv_all < 100) &
+            (df_greeks['strike'].to_numpy() > 0) &
+            (df_greeks['dte'].to_numpy() > 0) &
+            (df_greeks['volume'].to_numpy() > 0)
+        ]
         
         if df.empty:
             logger.warning("No data for 3D volatility surface")
+            plt.close(fig)
             return None
         
-        # Calculer moneyness
-        df['moneyness'] = df['strike'] / spot_price
-        
-        # Séparer Calls et Puts
-        calls = df[df['right'] == 'CALL']
-        puts = df[df['right'] == 'PUT']
-        
-        # Plot Calls
-        if not calls.empty:
-            ax.scatter(calls['moneyness'], calls['dte'], calls['iv_pct'],
-                      c=calls['iv_pct'], cmap='Greens', s=20, alpha=0.6,
-                      label='Calls', edgecolors='none')
-        
-        # Plot Puts
-        if not puts.empty:
-            ax.scatter(puts['moneyness'], puts['dte'], puts['iv_pct'],
-                      c=puts['iv_pct'], cmap='Reds', s=20, alpha=0.6,
-                      label='Puts', edgecolors='none')
+        # Moneyness en float64 : des strikes float32 feraient basculer des points de cellule
+        moneyness = df['strike'].to_numpy(dtype=float) / spot_price
+        dte = df['dte'].to_numpy()
+        iv = df['iv_pct'].to_numpy()
+        dte_values, y_idx = np.unique(dte, return_inverse=True)
+        is_call, is_put = right_masks(df['right'])
+        
+        if len(dte_values) < 2:
+            # Une seule maturité : grille 1 x N sans face, nuage de points à la place
+            for mask, cmap, label in ((is_call, 'Greens', 'Calls'),
+                                      (is_put, 'Reds', 'Puts')):
+                if mask.any():
+                    ax.scatter(moneyness[mask], dte[mask], iv[mask], c=iv[mask], cmap=cmap,
+                               s=20, alpha=0.6, label=label, edgecolors='none')
+        else:
+            # Grille commune (moneyness x DTE) : une surface par type, coût de rendu
+            # fonction du nombre de cellules et non du nombre de contrats
+            x_edges = np.linspace(moneyness.min(), moneyness.max(), SURFACE_MONEYNESS_BINS + 1)
+            x_idx = np.clip(np.searchsorted(x_edges, moneyness, side='right') - 1,
+                            0, SURFACE_MONEYNESS_BINS - 1)
+            X, Y = np.meshgrid((x_edges[:-1] + x_edges[1:]) / 2, dte_values)
+            
+            for mask, cmap, label in ((is_call, 'Greens', 'Calls'),
+                                      (is_put, 'Reds', 'Puts')):
+                if not mask.any():
+                    continue
+                Z = _binned_mean(y_idx[mask], x_idx[mask], iv[mask], X.shape)
+                empty_ratio = np.isnan(Z).mean()
+                if empty_ratio > SURFACE_MAX_EMPTY_RATIO:
+                    logger.warning(f"3D surface ({label}): {empty_ratio:.0%} of grid cells empty, "
+                                   f"their faces are not drawn")
+                ax.plot_surface(X, Y, Z, cmap=cmap, alpha=0.6, rstride=1, cstride=1,
+                                linewidth=0, antialiased=False, label=label)
         
         # Styling
         ax.set_xlabel('Moneyness (K/S)', fontsize=11, color=COLORS['text'])
@@ -416,17 +558,19 @@ class VolatilitySkewVisualizer:
         
         ax.legend(loc='upper right', framealpha=0.9, facecolor=COLORS['paper'])
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         if save_path:
-            plt.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
+            fig.savefig(save_path, dpi=300, facecolor=COLORS['bg'])
             logger.info(f"Saved 3D volatility surface: {save_path}")
+            plt.close(fig)  # Libère le canvas (génération en batch)
         
         return fig
     
     def create_skew_dashboard(self, df_greeks: pd.DataFrame, spot_price: float,
                              expiration_filter: Optional[str] = None,
-                             save_path: Optional[str] = None):
+                             save_path: Optional[str] = None,
+                             already_filtered: bool = False):
         """
         Dashboard complet avec 4 représentations du skew.
         
@@ -435,78 +579,94 @@ class VolatilitySkewVisualizer:
             spot_price: Prix spot
             expiration_filter: Filtrer sur expiration
             save_path: Chemin sauvegarde
+            already_filtered: df_greeks est déjà restreint à expiration_filter
+                (le filtre ne sert alors qu'au titre)
         """
         fig = plt.figure(figsize=(18, 12), facecolor=COLORS['bg'])
         
+        # Vue commune aux 4 sous-graphiques : un seul masque (expiration + qualité),
+        # colonnes extraites une fois en arrays NumPy (|delta| et moneyness inclus)
+        exp_ts = pd.to_datetime(expiration_filter) if expiration_filter else None  # Parsé une fois (filtre + titre)
+        mask = (df_greeks['iv_pct'].to_numpy() > 0) & (df_greeks['volume'].to_numpy() > 0)
+        if exp_ts is not None and not already_filtered:
+            mask &= (df_greeks['expiration'] == exp_ts).to_numpy()
+        df_view = df_greeks[mask]
+        strike = df_view['strike'].to_numpy()
+        delta = df_view['delta'].to_numpy()
+        is_call, is_put = right_masks(df_view['right'])
+        view = {
+            'strike': strike,
+            'abs_delta': np.abs(delta),
+            'moneyness': strike / spot_price,
+            'iv_pct': df_view['iv_pct'].to_numpy(),
+            'is_call': is_call,
+            'is_put': is_put,
+            'has_delta': ~np.isnan(delta),
+        }
+        
+        # Préparation (masques + tris NumPy, qui libèrent le GIL) en parallèle sur les
+        # grosses chaînes ; le tracé Matplotlib (non thread-safe) reste séquentiel
+        jobs = [(_prepare_skew_series, view, 'strike'),
+                (_prepare_skew_series, view, 'delta'),
+                (_prepare_skew_series, view, 'moneyness'),
+                (_prepare_put_focus, view)]
+        if len(view['iv_pct']) >= DASHBOARD_PARALLEL_MIN_ROWS:
+            with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+                futures = [executor.submit(fn, *args) for fn, *args in jobs]
+                strike_series, delta_series, moneyness_series, put_focus = [f.result() for f in futures]
+        else:
+            strike_series, delta_series, moneyness_series, put_focus = [fn(*args) for fn, *args in jobs]
+        
         # Grid 2x2
         gs = fig.add_gridspec(2, 2, hspace=0.3, wspace=0.3)
         
         # 1. Skew by Strike
         ax1 = fig.add_subplot(gs[0, 0], facecolor=COLORS['paper'])
-        self._plot_skew_subplot(ax1, df_greeks, spot_price, 'strike', expiration_filter)
+        self._plot_skew_subplot(ax1, strike_series, 'strike')
         
         # 2. Skew by Delta
         ax2 = fig.add_subplot(gs[0, 1], facecolor=COLORS['paper'])
-        self._plot_skew_subplot(ax2, df_greeks, spot_price, 'delta', expiration_filter)
+        self._plot_skew_subplot(ax2, delta_series, 'delta')
         
         # 3. Skew by Moneyness
         ax3 = fig.add_subplot(gs[1, 0], facecolor=COLORS['paper'])
-        self._plot_skew_subplot(ax3, df_greeks, spot_price, 'moneyness', expiration_filter)
+        self._plot_skew_subplot(ax3, moneyness_series, 'moneyness')
         
         # 4. Put Skew Focus
         ax4 = fig.add_subplot(gs[1, 1], facecolor=COLORS['paper'])
-        self._plot_put_skew_focus(ax4, df_greeks, expiration_filter)
+        self._plot_put_skew_focus(ax4, put_focus)
         
         # Titre global
         title_text = 'Volatility Skew Dashboard'
-        if expiration_filter:
-            exp_date = pd.to_datetime(expiration_filter).strftime('%Y-%m-%d')
+        if exp_ts is not None:
+            exp_date = exp_ts.strftime('%Y-%m-%d')
             title_text += f' - Exp: {exp_date}'
         
         fig.suptitle(title_text, fontsize=16, color=COLORS['text'], y=0.98)
         
         if save_path:
-            plt.savefig(save_path, dpi=300, facecolor=COLORS['bg'], bbox_inches='tight')
+            fig.savefig(save_path, dpi=300, facecolor=COLORS['bg'], bbox_inches='tight')
             logger.info(f"Saved skew dashboard: {save_path}")
+            plt.close(fig)  # Libère le canvas (génération en batch)
         
         return fig
     
-    def _plot_skew_subplot(self, ax, df_greeks, spot_price, mode, expiration_filter):
-        """Helper pour subplot skew."""
-        df = df_greeks.copy()
-        
-        if expiration_filter:
-            df = df[df['expiration'] == pd.to_datetime(expiration_filter)]
-        
-        df = df[(df['iv_pct'] > 0) & (df['volume'] > 0)]
+    def _plot_skew_subplot(self, ax, series, mode):
+        """
+        Helper pour subplot skew.
         
-        if mode == 'strike':
-            calls = df[df['right'] == 'CALL'].sort_values('strike')
-            puts = df[df['right'] == 'PUT'].sort_values('strike')
-            x_col = 'strike'
-            xlabel = 'Strike ($)'
-            
-        elif mode == 'delta':
-            df['abs_delta'] = df['delta'].abs()
-            calls = df[df['right'] == 'CALL'].sort_values('abs_delta')
-            puts = df[df['right'] == 'PUT'].sort_values('abs_delta')
-            x_col = 'abs_delta'
-            xlabel = '|Delta|'
-            
-        elif mode == 'moneyness':
-            df['moneyness'] = df['strike'] / spot_price
-            calls = df[df['right'] == 'CALL'].sort_values('moneyness')
-            puts = df[df['right'] == 'PUT'].sort_values('moneyness')
-            x_col = 'moneyness'
-            xlabel = 'Moneyness (K/S)'
+        series : séries triées calls/puts (voir _prepare_skew_series).
+        """
+        xlabel = DASHBOARD_SKEW_AXES[mode][1]
+        (call_x, call_iv), (put_x, put_iv) = series
         
-        if not calls.empty:
-            ax.scatter(calls[x_col], calls['iv_pct'], s=30, alpha=0.6, color=COLORS['line1'])
-            ax.plot(calls[x_col], calls['iv_pct'], alpha=0.3, linewidth=1, color=COLORS['line1'], label='Calls')
+        if call_x.size:
+            _plot_markers_line(ax, call_x, call_iv, COLORS['line1'], markersize=np.sqrt(30),
+                               label='Calls')
         
-        if not puts.empty:
-            ax.scatter(puts[x_col], puts['iv_pct'], s=30, alpha=0.6, color=COLORS['line2'])
-            ax.plot(puts[x_col], puts['iv_pct'], alpha=0.3, linewidth=1, color=COLORS['line2'], label='Puts')
+        if put_x.size:
+            _plot_markers_line(ax, put_x, put_iv, COLORS['line2'], markersize=np.sqrt(30),
+                               label='Puts')
         
         ax.set_xlabel(xlabel, color=COLORS['text'])
         ax.set_ylabel('IV (%)', color=COLORS['text'])
@@ -515,29 +675,17 @@ class VolatilitySkewVisualizer:
         ax.grid(True, alpha=0.3, color=COLORS['grid'])
         ax.tick_params(colors=COLORS['text'])
     
-    def _plot_put_skew_focus(self, ax, df_greeks, expiration_filter):
-        """Focus sur le put skew (downside protection pricing)."""
-        df = df_greeks.copy()
-        
-        if expiration_filter:
-            df = df[df['expiration'] == pd.to_datetime(expiration_filter)]
-        
-        puts = df[
-            (df['right'] == 'PUT') &
-            (df['iv_pct'] > 0) &
-            (df['delta'].notna()) &
-            (df['volume'] > 0)
-        ].copy()
-        
-        if puts.empty:
+    def _plot_put_skew_focus(self, ax, put_focus):
+        """Focus sur le put skew (downside protection pricing), voir _prepare_put_focus."""
+        if put_focus is None:
             return
         
-        puts['abs_delta'] = puts['delta'].abs()
-        puts = puts.sort_values('abs_delta')
-        
-        ax.scatter(puts['abs_delta'], puts['iv_pct'], s=40, alpha=0.7, 
-                  c=puts['abs_delta'], cmap='Reds', edgecolors='white', linewidths=0.5)
-        ax.plot(puts['abs_delta'], puts['iv_pct'], linewidth=2, color=COLORS['line2'], alpha=0.5)
+        put_x, put_iv, colors = put_focus
+        ax.scatter(put_x, put_iv, s=40, alpha=0.7, 
+                  color=colors, linewidths=0.5,
+                  edgecolors=self._marker_edgecolor or 'none',
+                  rasterized=True)
+        ax.plot(put_x, put_iv, linewidth=2, color=COLORS['line2'], alpha=0.5)
         
         # Marquer deltas clés
         for delta in [0.10, 0.25, 0.50]: